@@ -1,17 +1,292 @@
 from abc import ABC, abstractmethod
 import json
 import base64
-from zhipuai import ZhipuAI
+from zhipuai import ZhipuAI, APIStatusError, APIConnectionError
 import time
 import re
+import random
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from key_pool import KeyPool, parse_api_keys
+from circuit_breaker import CircuitBreaker, CircuitOpenError
+from cost_tracker import (BudgetExceededError, SpendTracker, TokenPricing, response_usage, estimate_run,
+                          expected_keyframes)
+
+try:
+    # 可选依赖：安装 httpx[http2] 后可使用 HTTP/2（单连接多路复用）
+    import httpx
+    import h2  # noqa: F401
+except ImportError:
+    httpx = None
+
+# 没有收到响应的请求错误（连接被断开、超时等）
+NETWORK_ERRORS = (requests.RequestException, OSError) + ((httpx.HTTPError,) if httpx is not None else ())
+
+
+# 判定协议：紧凑 JSON，风险类型用短代码，说明限长，限制输出 token 数
+# 输出越短响应越快，也能一次解析，不需要多轮清理
+# 版本 3 增加置信度 c（0-100），版本 2 的响应仍可解析（置信度为空）
+VERDICT_SCHEMA_VERSION = 3
+SUPPORTED_SCHEMA_VERSIONS = (2, 3)
+RISK_CODES = {
+    'N': '',
+    'V': '暴力',
+    'T': '恐怖',
+    'P': '政治',
+    'G': '地球',
+    'M': '地图',
+    'O': '其他不适内容',
+    'S': '敏感内容',  # 接口以敏感内容拒绝请求时使用，不在提示词中
+}
+DESCRIPTION_MAX_CHARS = 40
+MAX_OUTPUT_TOKENS = 80
+
+PROMPT = (
+    "请以少儿内容专家的身份，判断这张图片是否适合儿童观看，主要关注：暴力、恐怖、政治、地球、地图等不适内容。"
+    '只输出一行JSON，不要输出其他文字：{"v":3,"s":1,"r":"N","c":90,"d":"说明"}。'
+    "s：1 安全，0 不安全；r：N 无、V 暴力、T 恐怖、P 政治、G 地球、M 地图、O 其他；"
+    "c：对判断的把握，0-100，画面模糊、细节看不清或难以判断时给低分；d：不超过20字。"
+)
+
+
+# base64 编码后的图片开头 -> MIME 类型（低分辨率图固定为 JPEG，原图按 output_encoding 可能是 WebP）
+IMAGE_BASE64_SIGNATURES = (
+    (b'/9j/', 'image/jpeg'),
+    (b'UklGR', 'image/webp'),
+    (b'iVBORw0KGgo', 'image/png'),
+)
+
+
+def image_mime_type(image_base64):
+    """按 base64 内容的开头判断图片的 MIME 类型，无法识别时按 JPEG 处理"""
+    head = image_base64[:16]
+    if isinstance(head, str):
+        head = head.encode('ascii')
+    for signature, mime in IMAGE_BASE64_SIGNATURES:
+        if head.startswith(signature):
+            return mime
+    return 'image/jpeg'
+
+
+# 接口错误类型
+ERROR_RATE_LIMITED = 'rate_limited'  # 429 并发或频率限制：暂停该密钥后重试
+ERROR_BILLING = 'billing'  # 账户欠费：停用该密钥
+ERROR_AUTH = 'auth'  # 认证失败：停用该密钥
+ERROR_SENSITIVE = 'sensitive'  # 敏感内容：按风险帧处理
+ERROR_SERVER = 'server'  # 5xx、408：服务故障，退避后重试，计入熔断
+ERROR_NETWORK = 'network'  # 连接断开、超时：同上
+ERROR_BAD_RESPONSE = 'bad_response'  # 响应不是合法 JSON：退避后重试
+ERROR_CLIENT = 'client'  # 其他 4xx：请求本身有问题，不重试
+
+ERROR_KINDS = (ERROR_RATE_LIMITED, ERROR_BILLING, ERROR_AUTH, ERROR_SENSITIVE,
+               ERROR_SERVER, ERROR_NETWORK, ERROR_BAD_RESPONSE, ERROR_CLIENT)
+# 说明服务不可用、计入熔断的错误
+OUTAGE_ERRORS = (ERROR_SERVER, ERROR_NETWORK)
+
+# 智谱业务错误码
+AUTH_ERROR_CODES = ('1000', '1001', '1002', '1003', '1004')  # 身份验证失败、令牌无效或过期等
+RATE_LIMIT_CODES = ('1302', '1303', '1305')  # 并发数过高、频率过高、请求过多
+BILLING_CODE = '1113'
+SENSITIVE_CODE = '1301'
+
+ERROR_MESSAGES = {
+    ERROR_BILLING: "AI服务账户已欠费，请充值后重试",
+    ERROR_AUTH: "API密钥无效或认证失败，请检查密钥",
+}
+
+
+class AIServiceError(Exception):
+    """分类后的接口错误，kind 为上面的错误类型之一"""
+
+    def __init__(self, kind, message, status=None, code=None, retry_after=None):
+        super().__init__(message)
+        self.kind = kind
+        self.status = status
+        self.code = code
+        self.retry_after = retry_after
+
+
+def _error_code(body):
+    """从错误响应体中取出业务错误码（{"error": {"code": "1113", ...}}）"""
+    try:
+        error = json.loads(body).get('error')
+        if isinstance(error, dict) and error.get('code') is not None:
+            return str(error['code'])
+    except (ValueError, AttributeError):
+        pass
+    match = re.search(r'"code"\s*:\s*"?(\d+)', body)
+    return match.group(1) if match else None
+
+
+def _retry_after(headers):
+    try:
+        return max(0.0, float(headers.get('Retry-After')))
+    except (AttributeError, TypeError, ValueError):
+        return None
+
+
+def classify_error(status, body):
+    """根据状态码和错误响应体判断错误类型，status 为 None 表示没有收到响应"""
+    if status is None:
+        return ERROR_NETWORK
+    code = _error_code(body)
+    if code == BILLING_CODE or "欠费" in body:
+        return ERROR_BILLING
+    if status in (401, 403) or code in AUTH_ERROR_CODES:
+        return ERROR_AUTH
+    if status == 429 or code in RATE_LIMIT_CODES:
+        return ERROR_RATE_LIMITED
+    if status == 400 and (code == SENSITIVE_CODE or 'content_filter' in body
+                          or 'content_policy' in body or '敏感' in body):
+        return ERROR_SENSITIVE
+    if status >= 500 or status == 408:
+        return ERROR_SERVER
+    return ERROR_CLIENT
+
+
+def http_error(status, headers, body):
+    """由接口的错误响应构造 AIServiceError"""
+    kind = classify_error(status, body)
+    message = ERROR_MESSAGES.get(kind) or f"Error code: {status} - {body[:500]}"
+    return AIServiceError(kind, message, status=status, code=_error_code(body),
+                          retry_after=_retry_after(headers))
+
+
+def backoff_delay(attempt, base=1.0, cap=30.0):
+    """第 attempt 次重试前的等待时间：指数退避加随机抖动（full jitter），避免各线程同时重试"""
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+def sensitive_response():
+    """接口以“敏感内容”拒绝请求时，按风险帧处理的响应"""
+    return {
+        "choices": [{
+            "message": {
+                "content": json.dumps({
+                    "v": VERDICT_SCHEMA_VERSION,
+                    "s": 0,
+                    "r": "S",
+                    "c": 100,
+                    "d": "系统检测到可能的敏感内容"
+                }, ensure_ascii=False)
+            }
+        }]
+    }
 
 
 class AIAnalyzer(ABC):
     """AI分析器的抽象基类"""
 
+    # 运行指标（MetricsRegistry），由 AIManager.set_metrics() 设置
+    metrics = None
+    # 是否使用 HTTP/2，由 AIManager.configure_analyzer() 设置，只对支持的分析器生效
+    http2 = False
+    # 每个密钥的每分钟请求数和并发上限（0 为不限），由 AIManager.configure_analyzer() 在 configure 前设置
+    key_rpm = 0
+    key_concurrency = 0
+    key_pool = None
+    # 熔断器（CircuitBreaker），由 AIManager 按服务提供方设置
+    breaker = None
+    max_retries = 3
+    retry_delay = 2  # 退避的基础等待时间（秒）
+    requires_api_key = True  # 自建服务等不需要密钥的分析器设为 False
+
+    def _count(self, name, value=1):
+        if self.metrics:
+            self.metrics.inc(name, value)
+
+    def _drop_key(self, key, reason):
+        """停用欠费或认证失败的密钥，其余密钥继续使用"""
+        self.key_pool.disable(key, reason)
+        self._count('ai_keys_disabled_total')
+        if self.metrics:
+            self.metrics.set('ai_keys_active', self.key_pool.active_count())
+
+    def _send_with_retries(self, send):
+        """按错误类型处理一次分析的全部尝试
+
+        send(key) 用密钥池中的一个密钥发送一次请求，返回响应或抛出 AIServiceError：
+            - 欠费、认证失败：停用该密钥，换其他密钥重试（不计入重试次数）
+            - 429：该密钥暂停 Retry-After 秒（或退避时间），换其他密钥重试
+            - 服务故障、响应格式错误：指数退避加抖动后重试
+            - 敏感内容：按风险帧处理；其他 4xx：不重试
+        服务故障计入熔断器，熔断器打开后剩余的重试立即以 CircuitOpenError 结束。
+        """
+        attempt = 0
+        while True:
+            # 先取得密钥再占用探测名额：等待密钥额度或密钥全部停用时不会占住探测名额
+            key = self.key_pool.acquire()
+            if self.breaker and not self.breaker.allow():
+                self.key_pool.release(key)
+                raise CircuitOpenError("AI服务暂时不可用（熔断中）")
+            if attempt:
+                self._count('ai_retries_total')
+            cooldown = delay = None
+            try:
+                response = send(key)
+            except AIServiceError as e:
+                error = e
+            except Exception:
+                if self.breaker:
+                    self.breaker.release()
+                self.key_pool.release(key)
+                raise
+            else:
+                if self.breaker:
+                    self.breaker.record_success()
+                self.key_pool.release(key)
+                return response
+
+            self._count('ai_errors_total')
+            self._count(f'ai_errors_{error.kind}_total')
+            if self.breaker:
+                if error.kind in OUTAGE_ERRORS:
+                    if self.breaker.record_failure():
+                        self._count('ai_circuit_opened_total')
+                else:
+                    # 服务有响应，说明服务可用
+                    self.breaker.record_success()
+
+            try:
+                if error.kind in (ERROR_BILLING, ERROR_AUTH):
+                    self._drop_key(key, str(error))
+                    continue
+                if error.kind == ERROR_SENSITIVE:
+                    self._count('ai_sensitive_total')
+                    return sensitive_response()
+                if error.kind == ERROR_CLIENT:
+                    raise error
+                attempt += 1
+                if error.kind == ERROR_RATE_LIMITED:
+                    self._count('ai_rate_limited_total')
+                    # 只暂停这个密钥，其他密钥仍可立即重试；只有一个密钥时 acquire() 会等到暂停结束
+                    cooldown = error.retry_after
+                    if cooldown is None:
+                        cooldown = backoff_delay(attempt, self.retry_delay)
+                    print(f"并发限制错误，密钥 {key.name} 暂停 {cooldown:.1f} 秒")
+                else:
+                    delay = backoff_delay(attempt, self.retry_delay)
+                    print(f"{error.kind} 错误 (尝试 {attempt}): {error}")
+                if attempt >= self.max_retries:
+                    raise error
+            finally:
+                self.key_pool.release(key, cooldown)
+            if delay:
+                # 先归还密钥再等待，等待期间不占用密钥的并发额度
+                time.sleep(delay)
+
+    def key_count(self):
+        """可用的密钥数量，用于确定并发请求数"""
+        return self.key_pool.active_count() if self.key_pool else 0
+
     @abstractmethod
-    def analyze_image(self, image_path):
-        """分析图片的抽象方法"""
+    def analyze_image(self, image_path, image_base64=None):
+        """分析图片的抽象方法，image_base64 为预先编码好的图片内容（可选）"""
         pass
 
     @abstractmethod
@@ -24,38 +299,211 @@ class AIAnalyzer(ABC):
         """检查是否配置完成"""
         pass
 
+    def prewarm(self, connections=1):
+        """提前建立到接口的连接（可选），默认不做任何事"""
+        pass
+
+    def parse_response(self, response):
+        """解析API响应：先按紧凑协议一次解析，不符合协议时再用兼容解析"""
+        if not response or not (hasattr(response, 'choices') or isinstance(response, dict)):
+            raise ValueError("Invalid response format")
+
+        try:
+            if isinstance(response, dict):
+                content = response['choices'][0]['message']['content']
+                usage = response.get('usage')
+            else:
+                content = response.choices[0].message.content
+                usage = getattr(response, 'usage', None)
+        except (KeyError, IndexError, TypeError, AttributeError) as e:
+            self._count('ai_parse_failures_total')
+            raise ValueError(f"Error parsing response: {e}")
+
+        self._count('ai_responses_parsed_total')
+        completion_tokens = (usage.get('completion_tokens') if isinstance(usage, dict)
+                             else getattr(usage, 'completion_tokens', None))
+        if completion_tokens:
+            self._count('ai_output_tokens_total', completion_tokens)
+            self._count('ai_responses_with_usage_total')
+
+        try:
+            return parse_verdict(content)
+        except (ValueError, KeyError, TypeError, AttributeError):
+            pass
+
+        # 不符合协议（旧版提示词、模型没有按格式输出等），记录次数和耗时
+        self._count('ai_parse_fallback_total')
+        started = time.perf_counter()
+        try:
+            return parse_verdict_lenient(content)
+        except Exception as e:
+            self._count('ai_parse_failures_total')
+            raise ValueError(f"Error parsing response: {e}")
+        finally:
+            if self.metrics:
+                self.metrics.observe('ai_parse_fallback_seconds', time.perf_counter() - started)
+
+
+def parse_verdict(content):
+    """按紧凑协议解析判定：{"v":3,"s":1/0,"r":"代码","c":0-100,"d":"说明"}，不符合协议时抛出异常
+
+    只截取第一个 { 到最后一个 } 之间的内容（去掉可能的 Markdown 代码块标记），解析一次。
+    """
+    start = content.find('{')
+    end = content.rfind('}')
+    if start < 0 or end < start:
+        raise ValueError("No JSON object in response")
+    data = json.loads(content[start:end + 1])
+    if data.get('v') not in SUPPORTED_SCHEMA_VERSIONS:
+        raise ValueError(f"Unsupported verdict version: {data.get('v')!r}")
+    safe = data['s']
+    if safe not in (0, 1):  # True / False 与 1 / 0 相等，同样接受
+        raise ValueError(f"Invalid verdict: {safe!r}")
+    is_safe = bool(safe)
+    risk_type = RISK_CODES[data.get('r') or 'N']
+    if not is_safe and not risk_type:
+        risk_type = "未知风险"
+    elif is_safe:
+        risk_type = ""
+    description = str(data.get('d') or '')[:DESCRIPTION_MAX_CHARS]
+    if not description:
+        description = "无详细说明" if is_safe else "检测到潜在风险"
+    confidence = data.get('c')
+    if confidence is not None:
+        confidence = max(0.0, min(float(confidence), 100.0)) / 100
+    return {
+        'is_safe': is_safe,
+        'risk_type': risk_type,
+        'description': description,
+        'confidence': confidence
+    }
+
+
+def parse_verdict_lenient(content):
+    """兼容解析：协议版本 1 的自由格式 JSON，或模型没有按格式输出的内容"""
+    # 清理 Markdown 代码块标记
+    content = re.sub(r'```json\s*', '', content)
+    content = re.sub(r'```\s*$', '', content)
+    content = content.strip()
+
+    try:
+        # 直接解析清理后的 JSON
+        content_data = json.loads(content)
+    except json.JSONDecodeError:
+        # 如果解析失败，尝试进一步清理和修复
+        try:
+            json_match = re.search(r'\{.*?\}', content, re.DOTALL)
+            if json_match:
+                json_str = json_match.group()
+                json_str = re.sub(r'(?m)^\s*([a-zA-Z_][a-zA-Z0-9_]*)\s*:', r'"\1":', json_str)
+                json_str = json_str.replace("'", '"')
+                content_data = json.loads(json_str)
+            else:
+                # 如果没有找到 JSON，从文本内容推断结果
+                content_lower = content.lower()
+                is_safe = all(word not in content_lower for word in [
+                    "不安全", "风险", "危险", "暴力", "恐怖", "血腥", 
+                    "敏感", "不适", "违规", "违法"
+                ])
+                content_data = {
+                    "is_safe": is_safe,
+                    "risk_type": "未知" if not is_safe else "",
+                    "description": content.strip()
+                }
+        except Exception as e:
+            raise ValueError(f"Error fixing JSON: {e}")
+
+    # 协议版本 2 的字段（版本号缺失或错误时）
+    if 's' in content_data and 'is_safe' not in content_data:
+        content_data = {
+            'is_safe': content_data.get('s'),
+            'risk_type': RISK_CODES.get(content_data.get('r'), content_data.get('r') or ''),
+            'description': content_data.get('d', ''),
+        }
+
+    # 提取和标准化结果
+    is_safe = content_data.get('is_safe', True)
+    if isinstance(is_safe, str):
+        is_safe = is_safe.lower() in ['true', '1', 'yes', '安全']
+    is_safe = bool(is_safe)
+    
+    risk_type = content_data.get('risk_type', '')
+    if not risk_type and not is_safe:
+        risk_type = "未知风险"
+    elif risk_type.lower() in ['无', 'none', '']:
+        risk_type = ""
+    
+    description = content_data.get('description', '')
+    if not description:
+        description = "无详细说明" if is_safe else "检测到潜在风险"
+
+    return {
+        'is_safe': is_safe,
+        'risk_type': risk_type,
+        'description': description,
+        'confidence': None  # 不符合协议的回复没有置信度
+    }
+
+
+def zhipu_error(e):
+    """把智谱 SDK 抛出的异常转换为 AIServiceError，其他异常原样返回"""
+    if isinstance(e, APIStatusError):
+        try:
+            body = e.response.text
+        except Exception:
+            body = str(e)
+        return http_error(e.status_code, e.response.headers, body)
+    if isinstance(e, APIConnectionError):
+        return AIServiceError(ERROR_NETWORK, str(e))
+    return e
+
 
 class ZhipuAnalyzer(AIAnalyzer):
-    """智谱AI分析器"""
+    """智谱AI分析器，可配置多个API密钥（逗号分隔），请求分摊到各密钥"""
 
     def __init__(self):
         self.api_key = ""
-        self.client = None
+        self.base_url = None
+        self.model = "glm-4v-flash"
+        self.clients = {}  # 密钥 -> ZhipuAI 客户端
+        self.key_pool = KeyPool([])
         self.max_retries = 3
         self.retry_delay = 2
 
-    def configure(self, api_key):
-        """配置API密钥"""
+    def configure(self, api_key, base_url=None, model=None):
+        """配置API密钥；base_url 为空时使用官方接口地址，也可指向本地模拟服务"""
         self.api_key = api_key
-        self.client = ZhipuAI(api_key=api_key)
+        self.base_url = base_url or None
+        self.model = model or "glm-4v-flash"
+        keys = parse_api_keys(api_key)
+        # 重试由 _send_with_retries 按错误类型处理，关闭 SDK 自带的重试
+        self.clients = {key: ZhipuAI(api_key=key, base_url=self.base_url, max_retries=0) for key in keys}
+        self.key_pool = KeyPool(keys, self.key_rpm, self.key_concurrency)
 
     def get_name(self):
         return "智谱 GLM-4V-Flash"
 
     def is_configured(self):
-        return bool(self.api_key and self.client)
+        return bool(self.api_key and self.clients)
 
-    def analyze_image(self, image_path):
+    def analyze_image(self, image_path, image_base64=None):
+        """分析图片，image_base64 为预先编码好的图片内容（可选）"""
         if not self.is_configured():
             raise ValueError("API key not configured")
+        if image_base64:
+            img_base = image_base64
+        else:
+            with open(image_path, 'rb') as image_file:
+                img_base = base64.b64encode(image_file.read()).decode('utf-8')
 
-        for attempt in range(self.max_retries):
+        def send(key):
+            self._count('ai_requests_total')
+            self._count('ai_upload_bytes_total', len(img_base))
+            request_started = time.perf_counter()
             try:
-                with open(image_path, 'rb') as image_file:
-                    img_base = base64.b64encode(image_file.read()).decode('utf-8')
-
-                response = self.client.chat.completions.create(
-                    model="glm-4v-flash",
+                response = self.clients[key.key].chat.completions.create(
+                    model=self.model,
+                    max_tokens=MAX_OUTPUT_TOKENS,
                     messages=[{
                         "role": "user",
                         "content": [
@@ -65,130 +513,366 @@ class ZhipuAnalyzer(AIAnalyzer):
                             },
                             {
                                 "type": "text",
-                                "text": "请以少儿内容专家的身份，分析这张图片是否安全是否适合儿童观看，主要关注：暴力、恐怖、政治、地球、地图等不适内容。请用JSON格式回复：{is_safe: true/false, risk_type: 风险类型, description: 说明}"
+                                "text": PROMPT
                             }
                         ]
                     }]
                 )
-                return response
-
             except Exception as e:
-                error_str = str(e)
-                print(f"API Error: {error_str}")  # 添加调试输出
-                
-                # 检查欠费错误
-                if '"code":"1113"' in error_str or "账户已欠费" in error_str:
-                    raise Exception("AI服务账户已欠费，请充值后重试") from e
-                elif "429" in error_str:
-                    print(f"并发限制错误，等待重试: {e}")
-                    time.sleep(self.retry_delay * (attempt + 1))
-                    continue
-                elif "400" in error_str:
-                    return {
-                        "choices": [{
-                            "message": {
-                                "content": json.dumps({
-                                    "is_safe": False,
-                                    "risk_type": "敏感内容",
-                                    "description": "系统检测到可能的敏感内容"
-                                })
-                            }
-                        }]
-                    }
+                print(f"API Error: {e}")  # 添加调试输出
+                raise zhipu_error(e) from e
+            if self.metrics:
+                self.metrics.observe('ai_request_seconds', time.perf_counter() - request_started)
+            return response
+
+        return self._send_with_retries(send)
+
+
+class _StreamBody:
+    """按块发送的请求体：JSON 前缀 + base64 图片 + JSON 后缀
+
+    图片内容不拼接进完整的 JSON 字符串，发送时按块读取，避免大图片被反复复制。
+    """
+
+    def __init__(self, *parts):
+        self.parts = [memoryview(part) for part in parts]
+        self.length = sum(len(part) for part in self.parts)
+        self._index = 0
+        self._offset = 0
+
+    def __len__(self):
+        return self.length
+
+    def read(self, size=-1):
+        """返回下一块数据（当前部分的 memoryview 切片，不复制），每次最多到当前部分的末尾"""
+        while self._index < len(self.parts):
+            part = self.parts[self._index]
+            if self._offset >= len(part):
+                self._index += 1
+                self._offset = 0
+                continue
+            end = len(part) if size is None or size < 0 else min(len(part), self._offset + size)
+            chunk = part[self._offset:end]
+            self._offset = end
+            return chunk
+        return b''
+
+    def __iter__(self):
+        while True:
+            chunk = self.read(64 * 1024)
+            if not chunk:
+                return
+            yield chunk
+
+
+class OpenAICompatibleAnalyzer(AIAnalyzer):
+    """OpenAI 兼容接口分析器（自建视觉模型服务、其他兼容 chat-completions 的服务）
+
+    所有分析线程共用一个带连接池的 HTTP 会话（keep-alive），
+    安装了 httpx[http2] 且开启 http2 时使用 HTTP/2。
+    配置多个密钥时，认证头按请求从密钥池中选取，不设置在会话上。
+    """
+
+    requires_api_key = False
+
+    def __init__(self, pool_size=8):
+        self.api_key = ""
+        self.base_url = None
+        self.model = ""
+        self.pool_size = pool_size
+        self.timeout = 60
+        self.max_retries = 3
+        self.retry_delay = 2
+        self.session = None
+        self._session_lock = threading.Lock()
+        self.key_pool = KeyPool([''])
+
+    def configure(self, api_key, base_url=None, model=None):
+        """配置接口地址（如 http://host:8000/v1）、模型名称和API密钥（自建服务可不填）"""
+        self.close()
+        self.api_key = api_key
+        self.base_url = (base_url or '').rstrip('/') or None
+        self.model = model or ''
+        # 自建服务可以不填密钥，此时池中只有一个空密钥，仍按其额度限流
+        self.key_pool = KeyPool(parse_api_keys(api_key) or [''], self.key_rpm, self.key_concurrency)
+
+    def get_name(self):
+        return "OpenAI 兼容接口"
+
+    def is_configured(self):
+        return bool(self.base_url and self.model)
+
+    def _get_session(self):
+        with self._session_lock:
+            if self.session is None:
+                headers = {'Content-Type': 'application/json'}
+                if self.http2 and httpx is not None:
+                    self.session = httpx.Client(
+                        http2=True,
+                        headers=headers,
+                        timeout=self.timeout,
+                        limits=httpx.Limits(max_connections=self.pool_size,
+                                            max_keepalive_connections=self.pool_size)
+                    )
                 else:
-                    print(f"其他错误 (尝试 {attempt + 1}): {e}")
-                    if attempt < self.max_retries - 1:
-                        time.sleep(self.retry_delay)
-                    else:
-                        raise
+                    if self.http2:
+                        print("httpx[http2] 未安装，使用 HTTP/1.1 连接池")
+                    session = requests.Session()
+                    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size)
+                    session.mount('http://', adapter)
+                    session.mount('https://', adapter)
+                    session.headers.update(headers)
+                    self.session = session
+            return self.session
 
-        return None
+    def close(self):
+        with self._session_lock:
+            if self.session is not None:
+                self.session.close()
+                self.session = None
 
-    def parse_response(self, response):
-        """解析API响应"""
-        if not response or not (hasattr(response, 'choices') or isinstance(response, dict)):
-            raise ValueError("Invalid response format")
+    def prewarm(self, connections=1):
+        """并发请求模型列表，让连接池提前建立好连接（TCP + TLS）"""
+        if not self.is_configured():
+            return
+        session = self._get_session()
+
+        def touch(_):
+            try:
+                headers = {}
+                if self.key_pool.keys[0].key:
+                    headers['Authorization'] = f'Bearer {self.key_pool.keys[0].key}'
+                response = session.get(f'{self.base_url}/models', headers=headers, timeout=10)
+                response.close()
+            except Exception as e:
+                print(f"Prewarm failed: {e}")
+
+        connections = max(1, min(connections, self.pool_size))
+        with ThreadPoolExecutor(max_workers=connections) as executor:
+            list(executor.map(touch, range(connections)))
 
+    def _request_body(self, image_base64):
+        """构造请求体，图片内容作为单独的块，不进行 JSON 转义和拼接"""
+        prefix = ('{"model": %s, "max_tokens": %d, "messages": [{"role": "user", "content": ['
+                  '{"type": "image_url", "image_url": {"url": "data:%s;base64,'
+                  % (json.dumps(self.model), MAX_OUTPUT_TOKENS, image_mime_type(image_base64))).encode('utf-8')
+        suffix = ('"}}, {"type": "text", "text": %s}]}]}'
+                  % json.dumps(PROMPT, ensure_ascii=False)).encode('utf-8')
+        if isinstance(image_base64, str):
+            # base64 只包含 ASCII 字符，可以直接放进 JSON 字符串
+            image_base64 = image_base64.encode('ascii')
+        return _StreamBody(prefix, image_base64, suffix)
+
+    def _post(self, body, api_key=''):
+        session = self._get_session()
+        url = f'{self.base_url}/chat/completions'
+        headers = {'Content-Length': str(len(body))}
+        if api_key:
+            headers['Authorization'] = f'Bearer {api_key}'
+        if httpx is not None and isinstance(session, httpx.Client):
+            response = session.post(url, content=iter(body), headers=headers)
+            return response.status_code, response.headers, response.content
+        response = session.post(url, data=body, headers=headers, timeout=self.timeout)
+        return response.status_code, response.headers, response.content
+
+    def analyze_image(self, image_path, image_base64=None):
+        """分析图片，image_base64 为预先编码好的图片内容（可选）"""
+        if not self.is_configured():
+            raise ValueError("API base URL or model not configured")
+        if not image_base64:
+            with open(image_path, 'rb') as image_file:
+                image_base64 = base64.b64encode(image_file.read())
+
+        return self._send_with_retries(lambda key: self._send(key, image_base64))
+
+    def _send(self, key, image_base64):
+        """用指定密钥发送一次请求，失败时抛出 AIServiceError"""
+        body = self._request_body(image_base64)
+        self._count('ai_requests_total')
+        self._count('ai_upload_bytes_total', len(image_base64))
+        request_started = time.perf_counter()
         try:
-            # 获取原始内容
-            if isinstance(response, dict):
-                content = response['choices'][0]['message']['content']
-            else:
-                content = response.choices[0].message.content
-            
-            print(f"Raw API response:", content)
-            
-            # 清理 Markdown 代码块标记
-            content = re.sub(r'```json\s*', '', content)
-            content = re.sub(r'```\s*$', '', content)
-            content = content.strip()
-            
+            status, headers, content = self._post(body, key.key)
+        except NETWORK_ERRORS as e:
+            raise AIServiceError(ERROR_NETWORK, str(e)) from e
+        if self.metrics:
+            self.metrics.observe('ai_request_seconds', time.perf_counter() - request_started)
+
+        if status == 200:
             try:
-                # 直接解析清理后的 JSON
-                content_data = json.loads(content)
-            except json.JSONDecodeError:
-                # 如果解析失败，尝试进一步清理和修复
-                try:
-                    json_match = re.search(r'\{.*?\}', content, re.DOTALL)
-                    if json_match:
-                        json_str = json_match.group()
-                        json_str = re.sub(r'(?m)^\s*([a-zA-Z_][a-zA-Z0-9_]*)\s*:', r'"\1":', json_str)
-                        json_str = json_str.replace("'", '"')
-                        content_data = json.loads(json_str)
-                    else:
-                        # 如果没有找到 JSON，从文本内容推断结果
-                        content_lower = content.lower()
-                        is_safe = all(word not in content_lower for word in [
-                            "不安全", "风险", "危险", "暴力", "恐怖", "血腥", 
-                            "敏感", "不适", "违规", "违法"
-                        ])
-                        content_data = {
-                            "is_safe": is_safe,
-                            "risk_type": "未知" if not is_safe else "",
-                            "description": content.strip()
-                        }
-                except Exception as e:
-                    raise ValueError(f"Error fixing JSON: {e}")
-
-            # 提取和标准化结果
-            is_safe = content_data.get('is_safe', True)
-            if isinstance(is_safe, str):
-                is_safe = is_safe.lower() in ['true', '1', 'yes', '安全']
-            
-            risk_type = content_data.get('risk_type', '')
-            if not risk_type and not is_safe:
-                risk_type = "未知风险"
-            elif risk_type.lower() in ['无', 'none', '']:
-                risk_type = ""
-            
-            description = content_data.get('description', '')
-            if not description:
-                description = "无详细说明" if is_safe else "检测到潜在风险"
+                return json.loads(content)
+            except ValueError as e:
+                raise AIServiceError(ERROR_BAD_RESPONSE, f"Invalid JSON response: {content[:200]!r}") from e
+
+        error_str = content.decode('utf-8', errors='replace')
+        print(f"API Error: {status} {error_str}")
+        raise http_error(status, headers, error_str)
+
+
+class ProviderStats:
+    """一个服务提供方最近的请求延迟和出错情况"""
+
+    def __init__(self, window=100):
+        self.latencies = deque(maxlen=window)  # 成功请求的耗时（秒）
+        self.outcomes = deque(maxlen=window)  # 最近请求是否成功
+        self.requests = 0
+        self.in_flight = 0
+        self.lock = threading.Lock()
+
+    def begin(self):
+        with self.lock:
+            self.requests += 1
+            self.in_flight += 1
+
+    def end(self, elapsed, ok):
+        """请求结束，ok 为 None 表示请求未发送（熔断），不计入统计"""
+        with self.lock:
+            self.in_flight -= 1
+            if ok is None:
+                return
+            self.outcomes.append(ok)
+            if ok:
+                self.latencies.append(elapsed)
+
+    def quantile(self, q):
+        with self.lock:
+            ordered = sorted(self.latencies)
+        if not ordered:
+            return None
+        return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+
+    def error_rate(self):
+        with self.lock:
+            if not self.outcomes:
+                return 0.0
+            return self.outcomes.count(False) / len(self.outcomes)
+
+    def score(self):
+        """预计耗时，越小越优先：中位延迟按出错率放大（出错要重试），并计入正在进行的请求
+
+        还没有成功样本的提供方得分为 0，会被优先尝试，从而积累样本。
+        """
+        p50 = self.quantile(0.5)
+        if p50 is None:
+            return 0.0
+        with self.lock:
+            in_flight = self.in_flight
+        return p50 * (1 + 0.1 * in_flight) / max(0.05, 1 - self.error_rate())
+
+    def to_dict(self):
+        p50, p95 = self.quantile(0.5), self.quantile(0.95)
+        return {
+            'requests': self.requests,
+            'in_flight': self.in_flight,
+            'error_rate': round(self.error_rate(), 4),
+            'p50': round(p50, 3) if p50 is not None else None,
+            'p95': round(p95, 3) if p95 is not None else None,
+        }
+
+
+class Provider:
+    """参与路由的一个分析器（或同一分析器的不同接口地址）"""
+
+    def __init__(self, name, analyzer, breaker=None):
+        self.name = name
+        self.analyzer = analyzer
+        self.stats = ProviderStats()
+        self.breaker = breaker or CircuitBreaker()
+        analyzer.breaker = self.breaker
+
+
+class ConfidenceCalibrator:
+    """按低分辨率判定与原图判定的一致率校准模型自报的置信度
+
+    模型给出的置信度按 10 分一档分组，统计每档中低分辨率判定被原图分析确认的比例；
+    某档样本足够时用该比例作为校准后的置信度，否则沿用模型给出的值。
+    """
+
+    def __init__(self, bins=10, min_samples=20):
+        self.bins = bins
+        self.min_samples = min_samples
+        self.agreed = [0] * bins
+        self.total = [0] * bins
+        self.lock = threading.Lock()
+
+    def _bin(self, confidence):
+        return min(int(confidence * self.bins), self.bins - 1)
 
+    def record(self, confidence, agreed):
+        if confidence is None:
+            return
+        index = self._bin(confidence)
+        with self.lock:
+            self.total[index] += 1
+            self.agreed[index] += bool(agreed)
+
+    def calibrate(self, confidence):
+        if confidence is None:
+            return None
+        index = self._bin(confidence)
+        with self.lock:
+            total, agreed = self.total[index], self.agreed[index]
+        if total >= self.min_samples:
+            return round(agreed / total, 3)
+        return confidence
+
+    def to_dict(self):
+        with self.lock:
             return {
-                'is_safe': is_safe,
-                'risk_type': risk_type,
-                'description': description
+                f"{i * 100 // self.bins}-{(i + 1) * 100 // self.bins}": {
+                    'samples': self.total[i],
+                    'agreement': round(self.agreed[i] / self.total[i], 3) if self.total[i] else None,
+                }
+                for i in range(self.bins)
             }
-            
-        except Exception as e:
-            raise ValueError(f"Error parsing response: {e}")
+
+
+ANALYZER_TYPES = {
+    'zhipu': ZhipuAnalyzer,
+    'openai': OpenAICompatibleAnalyzer,
+}
 
 
 class AIManager:
     """AI分析器管理类"""
 
     def __init__(self):
-        self.analyzers = {
-            "zhipu": ZhipuAnalyzer(),
-            # 在这里添加其他AI分析器
-        }
+        # 在 ANALYZER_TYPES 中添加其他AI分析器
+        self.analyzers = {key: cls() for key, cls in ANALYZER_TYPES.items()}
         self.current_analyzer = None
+        self.metrics = None
+        # 额外的服务提供方（configure_providers），与当前分析器一起参与路由
+        self.extra_providers = []
+        self._providers = {}  # 分析器 -> Provider，保存当前分析器的统计
+        # 对冲请求：请求耗时超过所选提供方的 p95 时，向另一个提供方再发一次，取先返回的结果
+        self.hedge_max_ratio = 0.1  # 对冲请求数最多占请求总数的比例（额外成本上限）
+        self.hedge_min_samples = 20  # 提供方的成功样本数达到后才按其 p95 对冲
+        self._requests = 0
+        self._hedges = 0
+        self._budget_lock = threading.Lock()
+        self._executor = None
+        # 熔断：每个提供方连续 failure_threshold 次服务故障后暂停发送，全部提供方都暂停时请求最多等待 max_wait 秒
+        self.circuit_options = {'failure_threshold': 5, 'reset_timeout': 5.0, 'max_reset_timeout': 60.0}
+        self.circuit_max_wait = 300.0
+        # 低分辨率初次分析：校准后置信度低于 reanalysis_threshold 的判定和风险判定用原图重新分析，
+        # 另按 reanalysis_audit_rate 抽查高置信度的判定，为校准积累样本
+        self.reanalysis_threshold = 0.7
+        self.reanalysis_audit_rate = 0.05
+        self.calibrator = ConfidenceCalibrator()
+        # token 用量与费用：每个响应按模型单价计费，记入当天和本次处理（new_run_spend()）的用量
+        self.pricing = TokenPricing()
+        self.run_budget = {'cost_budget': 0, 'token_budget': 0, 'throttle_ratio': 0.8}
+        self.daily_spend = SpendTracker('当天', daily=True)
 
     def get_available_analyzers(self):
         """获取所有可用的分析器"""
         return [(key, analyzer.get_name()) for key, analyzer in self.analyzers.items()]
 
+    def requires_api_key(self, analyzer_key):
+        """指定的分析器是否必须填写API密钥（OpenAI 兼容接口的自建服务可以不填）"""
+        analyzer = self.analyzers.get(analyzer_key)
+        return analyzer is None or analyzer.requires_api_key
+
     def set_current_analyzer(self, analyzer_key):
         """设置当前使用的分析器"""
         if analyzer_key in self.analyzers:
@@ -196,17 +880,306 @@ class AIManager:
         else:
             raise ValueError(f"Unknown analyzer: {analyzer_key}")
 
-    def configure_analyzer(self, analyzer_key, api_key):
-        """配置指定的分析器"""
+    def configure_analyzer(self, analyzer_key, api_key, base_url=None, model=None, http2=False,
+                           key_rpm=0, key_concurrency=0):
+        """配置指定的分析器，base_url 为自定义接口地址，model 为模型名称（均可选）
+
+        api_key 可以是逗号分隔的多个密钥，key_rpm / key_concurrency 为每个密钥的每分钟请求数和并发上限（0 为不限）
+        """
         if analyzer_key in self.analyzers:
-            self.analyzers[analyzer_key].configure(api_key)
+            analyzer = self.analyzers[analyzer_key]
+            analyzer.key_rpm = key_rpm
+            analyzer.key_concurrency = key_concurrency
+            analyzer.configure(api_key, base_url=base_url, model=model)
+            analyzer.http2 = http2
         else:
             raise ValueError(f"Unknown analyzer: {analyzer_key}")
 
-    def analyze_image(self, image_path):
-        """使用当前分析器分析图片"""
+    def set_metrics(self, metrics):
+        """设置各分析器记录运行指标的 MetricsRegistry，传入 None 停止记录"""
+        self.metrics = metrics
+        for analyzer in self.analyzers.values():
+            analyzer.metrics = metrics
+        for provider in self.extra_providers:
+            provider.analyzer.metrics = metrics
+
+    def configure_providers(self, specs, hedge_max_ratio=0.1, hedge_min_samples=20):
+        """配置额外的服务提供方，与当前分析器一起按延迟和出错率路由
+
+        specs 为字典列表：{"name": ..., "analyzer": "openai" / "zhipu",
+        "base_url": ..., "model": ..., "api_key": ..., "http2": false, "key_rpm": 0, "key_concurrency": 0}
+        """
+        providers = []
+        for spec in specs or []:
+            kind = spec.get('analyzer', 'openai')
+            if kind not in ANALYZER_TYPES:
+                print(f"Unknown analyzer in providers: {kind}")
+                continue
+            analyzer = ANALYZER_TYPES[kind]()
+            analyzer.key_rpm = spec.get('key_rpm', 0)
+            analyzer.key_concurrency = spec.get('key_concurrency', 0)
+            analyzer.configure(spec.get('api_key', ''), base_url=spec.get('base_url'), model=spec.get('model'))
+            analyzer.http2 = spec.get('http2', False)
+            analyzer.metrics = self.metrics
+            name = spec.get('name') or f"{analyzer.get_name()} {spec.get('base_url') or ''}".strip()
+            providers.append(Provider(name, analyzer, CircuitBreaker(**self.circuit_options)))
+        self.extra_providers = providers
+        self.hedge_max_ratio = hedge_max_ratio
+        self.hedge_min_samples = hedge_min_samples
+
+    def configure_circuit_breaker(self, failure_threshold=5, reset_timeout=5.0, max_reset_timeout=60.0,
+                                  max_wait=300.0):
+        """设置熔断参数，在 configure_providers() 之前调用"""
+        self.circuit_options = {
+            'failure_threshold': failure_threshold,
+            'reset_timeout': reset_timeout,
+            'max_reset_timeout': max_reset_timeout,
+        }
+        self.circuit_max_wait = max_wait
+        self._providers = {}
+
+    def configure_reanalysis(self, threshold=0.7, audit_rate=0.05):
+        """设置低分辨率初次分析后用原图重新分析的置信度阈值和抽查比例"""
+        self.reanalysis_threshold = threshold
+        self.reanalysis_audit_rate = audit_rate
+
+    def configure_budget(self, prices=None, run_cost=0, run_tokens=0, daily_cost=0, daily_tokens=0,
+                         throttle_ratio=0.8, spent_today=None):
+        """设置 token 单价（{模型: [输入, 输出]}，元/百万 token）和费用预算（0 为不限）
+
+        spent_today 为今天此前已用的 (token 数, 费用)，通常由结果库的 spend_since() 得到。
+        """
+        self.pricing = TokenPricing(prices)
+        self.run_budget = {'cost_budget': run_cost, 'token_budget': run_tokens, 'throttle_ratio': throttle_ratio}
+        self.daily_spend = SpendTracker('当天', daily_cost, daily_tokens, throttle_ratio, daily=True,
+                                        spent=spent_today)
+
+    def new_run_spend(self):
+        """新建一次处理的用量统计，作为 spend 参数传给 analyze_image() / analyze_verdict()"""
+        return SpendTracker('本次处理', parent=self.daily_spend, **self.run_budget)
+
+    def estimate_run(self, duration=None, history=None, frame_count=None):
+        """处理前按历史记录预估关键帧数、token 数和费用，frame_count 缺省时按视频时长估算"""
+        if frame_count is None:
+            frame_count = expected_keyframes(duration, history)
+        model = self.current_analyzer.model if self.current_analyzer else None
+        return estimate_run(frame_count, history, self.pricing, model)
+
+    def _provider(self, analyzer):
+        provider = self._providers.get(analyzer)
+        if provider is None:
+            provider = self._providers.setdefault(
+                analyzer, Provider(analyzer.get_name(), analyzer, CircuitBreaker(**self.circuit_options)))
+        return provider
+
+    def providers(self):
+        """参与路由的全部提供方，当前分析器在最前"""
+        providers = [self._provider(self.current_analyzer)] if self.current_analyzer else []
+        return providers + [p for p in self.extra_providers if p.analyzer.is_configured()]
+
+    def provider_stats(self):
+        return {provider.name: dict(provider.stats.to_dict(), circuit=provider.breaker.to_dict())
+                for provider in self.providers()}
+
+    def key_count(self):
+        """各提供方可用密钥数之和，用于确定并发请求数"""
+        return sum(provider.analyzer.key_count() for provider in self.providers())
+
+    def key_stats(self):
+        """各提供方每个密钥的请求数、429 次数和停用原因"""
+        return {provider.name: provider.analyzer.key_pool.stats()
+                for provider in self.providers() if provider.analyzer.key_pool}
+
+    def prewarm(self, connections=1):
+        """在后台为各提供方预先建立连接，视频解码期间调用"""
+        for provider in self.providers():
+            if not provider.analyzer.is_configured():
+                continue
+            try:
+                provider.analyzer.prewarm(connections)
+            except Exception as e:
+                print(f"Error prewarming {provider.name}: {e}")
+
+    def analyze_image(self, image_path, spend=None, **kwargs):
+        """分析图片：只有一个提供方时直接调用，有多个时发往预计最快的一个，必要时对冲
+
+        spend 为本次处理的用量统计（new_run_spend()），缺省时只计入当天的用量；
+        已达到预算时抛出 BudgetExceededError，接近预算时逐个发送。
+        """
         if not self.current_analyzer:
             raise ValueError("No analyzer selected")
         if not self.current_analyzer.is_configured():
             raise ValueError("Current analyzer not configured")
-        return self.current_analyzer.analyze_image(image_path)
+        spend = spend or self.daily_spend
+        try:
+            with spend.dispatch() as throttled:
+                if throttled:
+                    self._count('ai_budget_throttled_total')
+                return self._dispatch(image_path, kwargs, spend)
+        except BudgetExceededError:
+            self._count('ai_budget_exceeded_total')
+            raise
+
+    def _dispatch(self, image_path, kwargs, spend):
+        with self._budget_lock:
+            self._requests += 1
+        deadline = time.monotonic() + self.circuit_max_wait
+        while True:
+            providers = self._wait_for_providers(deadline)
+            # 排序稳定，得分相同时当前分析器优先
+            providers.sort(key=lambda p: p.stats.score())
+            try:
+                if len(providers) == 1:
+                    return self._call(providers[0], image_path, kwargs, spend)
+                return self._hedged_call(providers[0], providers[1], image_path, kwargs, spend)
+            except CircuitOpenError:
+                # 请求期间熔断器打开（或探测名额被其他线程占用），等待服务恢复后重新派发
+                if time.monotonic() >= deadline:
+                    raise
+                time.sleep(0.05)
+
+    def parse_response(self, response):
+        """用当前分析器解析判定，并附上该响应的 token 用量和费用"""
+        result = self.current_analyzer.parse_response(response)
+        model, prompt_tokens, completion_tokens = response_usage(response)
+        result.update(
+            prompt_tokens=prompt_tokens,
+            completion_tokens=completion_tokens,
+            cost=round(self.pricing.cost(model or self.current_analyzer.model, prompt_tokens, completion_tokens), 6)
+        )
+        return result
+
+    def analyze_verdict(self, image_path, image_base64=None, low_res_base64=None, spend=None):
+        """分析并解析判定；提供低分辨率图片时先分析低分辨率图片，需要时再用原图重新分析"""
+        if not low_res_base64:
+            return self.parse_response(self.analyze_image(image_path, spend=spend, image_base64=image_base64))
+        first = self.parse_response(self.analyze_image(image_path, spend=spend, image_base64=low_res_base64))
+        result, reanalyze = self.review_first_pass(first)
+        if reanalyze:
+            full = self.parse_response(self.analyze_image(image_path, spend=spend, image_base64=image_base64))
+            result = self.merge_reanalysis(first, full)
+        return result
+
+    def review_first_pass(self, first):
+        """校准低分辨率初次分析的置信度，返回 (结果, 是否需要用原图重新分析)
+
+        风险判定会进入报告，总是用原图确认；安全判定只有置信度低时才重新分析。
+        """
+        self._count('ai_low_res_total')
+        confidence = self.calibrator.calibrate(first.get('confidence'))
+        result = dict(first, confidence=confidence, analysis_pass='low_res')
+        if confidence is None or confidence < self.reanalysis_threshold or not first['is_safe']:
+            return result, True
+        if random.random() < self.reanalysis_audit_rate:
+            self._count('ai_reanalysis_audits_total')
+            return result, True
+        return result, False
+
+    def merge_reanalysis(self, first, full):
+        """记录初次判定是否被原图分析确认（用于校准），返回原图分析的结果"""
+        agreed = first['is_safe'] == full['is_safe']
+        self.calibrator.record(first.get('confidence'), agreed)
+        self._count('ai_reanalyzed_total')
+        if not agreed:
+            self._count('ai_reanalysis_flips_total')
+        # 两次分析的用量都计入该帧
+        usage = {name: (first.get(name) or 0) + (full.get(name) or 0)
+                 for name in ('prompt_tokens', 'completion_tokens', 'cost')}
+        return dict(full, analysis_pass='full', **usage)
+
+    def _wait_for_providers(self, deadline):
+        """返回熔断器允许发送的提供方；全部熔断时暂停派发，等待探测成功，超过 deadline 报错"""
+        paused = None
+        while True:
+            providers = [p for p in self.providers() if p.breaker.available()]
+            if providers:
+                if paused is not None and self.metrics:
+                    self.metrics.observe('ai_circuit_wait_seconds', time.monotonic() - paused)
+                return providers
+            if paused is None:
+                paused = time.monotonic()
+                self._count('ai_circuit_waits_total')
+            if time.monotonic() >= deadline:
+                raise CircuitOpenError("AI服务暂时不可用，请稍后重试")
+            time.sleep(0.2)
+
+    def _call(self, provider, image_path, kwargs, spend=None):
+        provider.stats.begin()
+        started = time.perf_counter()
+        try:
+            response = provider.analyzer.analyze_image(image_path, **kwargs)
+        except CircuitOpenError:
+            provider.stats.end(time.perf_counter() - started, None)
+            raise
+        except Exception:
+            provider.stats.end(time.perf_counter() - started, False)
+            raise
+        provider.stats.end(time.perf_counter() - started, response is not None)
+        if response is not None:
+            self._record_usage(provider, response, spend or self.daily_spend)
+        return response
+
+    def _record_usage(self, provider, response, spend):
+        """按提供方的模型单价记录响应的用量，对冲中较慢的响应同样计入"""
+        model, prompt_tokens, completion_tokens = response_usage(response)
+        cost = self.pricing.cost(model or provider.analyzer.model, prompt_tokens, completion_tokens)
+        spend.record(prompt_tokens, completion_tokens, cost)
+        self._count('ai_prompt_tokens_total', prompt_tokens)
+        self._count('ai_cost_yuan_total', cost)
+
+    def _take_hedge_budget(self):
+        with self._budget_lock:
+            if self._hedges + 1 > self.hedge_max_ratio * self._requests:
+                return False
+            self._hedges += 1
+            return True
+
+    def _count(self, name, value=1):
+        if self.metrics:
+            self.metrics.inc(name, value)
+
+    def _hedged_call(self, primary, backup, image_path, kwargs, spend=None):
+        if self._executor is None:
+            with self._budget_lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(max_workers=32, thread_name_prefix='ai-request')
+        futures = {self._executor.submit(self._call, primary, image_path, kwargs, spend): primary}
+
+        # 超过所选提供方的 p95 仍未返回时，在预算内向备用提供方再发一次
+        delay = None
+        if len(primary.stats.latencies) >= self.hedge_min_samples:
+            delay = primary.stats.quantile(0.95)
+        if delay is not None:
+            done, _ = wait(futures, timeout=delay)
+            if not done and self._take_hedge_budget():
+                self._count('ai_hedged_total')
+                futures[self._executor.submit(self._call, backup, image_path, kwargs, spend)] = backup
+
+        pending = set(futures)
+        error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                try:
+                    response = future.result()
+                except CircuitOpenError as e:
+                    # 另一个提供方的真实错误优先
+                    error = error or e
+                    continue
+                except Exception as e:
+                    error = e
+                    continue
+                if response is not None:
+                    if futures[future] is not primary:
+                        self._count('ai_hedge_wins_total')
+                    # 较慢的请求无法撤回，在后台完成后只计入统计
+                    return response
+            if not pending and backup not in futures.values():
+                # 所选提供方失败，改发到备用提供方
+                self._count('ai_failover_total')
+                future = self._executor.submit(self._call, backup, image_path, kwargs, spend)
+                futures[future] = backup
+                pending = {future}
+        if error is not None:
+            raise error
+        return None
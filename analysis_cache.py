@@ -0,0 +1,52 @@
+import hashlib
+import threading
+from collections import OrderedDict
+
+
+def hash_file(image_path):
+    """计算图片内容的 SHA1，作为分析结果缓存的键"""
+    sha1 = hashlib.sha1()
+    with open(image_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            sha1.update(chunk)
+    return sha1.hexdigest()
+
+
+def hash_bytes(data):
+    """计算内存中图片内容的 SHA1，与 hash_file 的结果相同"""
+    return hashlib.sha1(data).hexdigest()
+
+
+class AnalysisCache:
+    """按图片内容哈希缓存AI分析结果（线程安全的LRU）
+
+    相同画面（例如重复提交的视频、片头片尾）不再重复请求AI接口。
+    """
+
+    def __init__(self, max_entries=10000):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            result = self._entries.get(key)
+            if result is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return dict(result)
+
+    def put(self, key, result):
+        with self._lock:
+            self._entries[key] = dict(result)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
@@ -0,0 +1,83 @@
+"""关键帧处理吞吐量基准测试
+
+对比线程池与进程池（共享内存传递）处理缩略图 + 哈希 + base64 + 质量检查的速度，
+输出不同并发数下的 帧/秒，用于观察随CPU核数的扩展情况。
+
+用法：
+    python benchmarks/bench_frame_pool.py --frames 200 --width 1920 --height 1080
+"""
+import os
+import sys
+import time
+import argparse
+from io import BytesIO
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PIL import Image, ImageDraw  # noqa: E402
+
+from frame_workers import FrameProcessPool, _process_frame_bytes  # noqa: E402
+
+
+OPS = ('thumbnail', 'sha1', 'base64', 'quality')
+
+
+def make_frames(count, width, height):
+    """生成可复现的测试帧（渐变 + 色块，JPEG q≈95）"""
+    frames = []
+    for i in range(count):
+        img = Image.linear_gradient('L').resize((width, height)).convert('RGB')
+        draw = ImageDraw.Draw(img)
+        offset = (i * 37) % width
+        draw.rectangle([offset, height // 4, min(offset + width // 5, width), height // 2],
+                       fill=((i * 50) % 255, 80, 160))
+        buffer = BytesIO()
+        img.save(buffer, 'JPEG', quality=95)
+        frames.append(buffer.getvalue())
+    return frames
+
+
+def bench_threads(frames, workers):
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        list(executor.map(lambda data: _process_frame_bytes(data, OPS, 160), frames))
+    return len(frames) / (time.perf_counter() - start)
+
+
+def bench_processes(frames, workers):
+    pool = FrameProcessPool(max_workers=workers)
+    # 预热：拉起子进程
+    [f.result() for f in [pool.submit_bytes(frames[0], OPS) for _ in range(workers)]]
+    start = time.perf_counter()
+    futures = [pool.submit_bytes(data, OPS) for data in frames]
+    for future in futures:
+        future.result()
+    elapsed = time.perf_counter() - start
+    pool.shutdown(wait=True)
+    return len(frames) / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="关键帧处理吞吐量基准测试")
+    parser.add_argument('--frames', type=int, default=200)
+    parser.add_argument('--width', type=int, default=1920)
+    parser.add_argument('--height', type=int, default=1080)
+    parser.add_argument('--max-workers', type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+
+    frames = make_frames(args.frames, args.width, args.height)
+    size_mb = sum(len(f) for f in frames) / 1024 / 1024
+    print(f"测试帧：{args.frames} 张 {args.width}x{args.height}，共 {size_mb:.1f} MB，CPU 核数：{os.cpu_count()}")
+    print(f"{'并发数':>6} {'线程池 帧/秒':>14} {'进程池 帧/秒':>14} {'加速比':>8}")
+
+    workers = 1
+    while workers <= args.max_workers:
+        thread_fps = bench_threads(frames, workers)
+        process_fps = bench_processes(frames, workers)
+        print(f"{workers:>6} {thread_fps:>14.1f} {process_fps:>14.1f} {process_fps / thread_fps:>8.2f}")
+        workers *= 2
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,338 @@
+"""端到端基准测试：合成视频 + 模拟AI服务
+
+用 ffmpeg 的 lavfi 源生成可复现的测试视频（测试图案、镜头切换、噪声，不同分辨率、
+时长和切换密度），通过本地任务服务（JobService）完成 提取 → AI分析 → 报告 全流程，
+AI 请求发往本地模拟服务（mock_ai_server.py），可为每个场景设置延迟和出错比例。
+
+每个场景在单独的子进程中运行，输出：
+    关键帧数、帧/秒（关键帧数 / 总耗时）、端到端耗时、倍速（视频时长 / 总耗时）、
+    单帧延迟 p50/p95（提取 → 判定）、峰值内存（Python 进程 / ffmpeg）、
+    服务端收到的请求数（含重试）、注入的 500 错误数和最终分析失败的帧数
+并与保存的基线（benchmarks/baseline.json）比较，便于对比不同提交的性能。
+
+用法：
+    python benchmarks/bench_pipeline.py                       # 运行全部场景并与基线比较
+    python benchmarks/bench_pipeline.py --scenarios cuts_720p_dense,noise_480p
+    python benchmarks/bench_pipeline.py --save-baseline       # 把本次结果保存为基线
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import hashlib
+import argparse
+import platform
+import tempfile
+import subprocess
+
+try:
+    import resource
+except ImportError:  # Windows 下没有 resource 模块，不统计峰值内存
+    resource = None
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import mock_ai_server  # noqa: E402
+from video_pipeline import find_ffmpeg  # noqa: E402
+
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+
+
+def _cuts(width, height, duration, cut_seconds, noise=0):
+    """测试图案，每隔 cut_seconds 秒亮度跳变一次（形成一个镜头切换）"""
+    source = (f"testsrc2=s={width}x{height}:r=25:d={duration},"
+              f"eq=brightness='mod(floor(t/{cut_seconds})*0.61,1)-0.5':eval=frame")
+    if noise:
+        source += f",noise=alls={noise}:allf=t"
+    return source
+
+
+# 场景：视频源（lavfi 描述）、视频时长、灵敏度、模拟服务参数、分析并发数
+SCENARIOS = {
+    # 没有镜头切换，只测解码和场景检测
+    'static_360p': {
+        'source': "testsrc=s=640x360:r=25:d=30",
+        'duration': 30,
+        'mock': {'latency_ms': 300},
+    },
+    'cuts_720p_sparse': {
+        'source': _cuts(1280, 720, 60, 5),
+        'duration': 60,
+        'mock': {'latency_ms': 300},
+    },
+    'cuts_720p_dense': {
+        'source': _cuts(1280, 720, 60, 0.5),
+        'duration': 60,
+        'mock': {'latency_ms': 300, 'jitter_ms': 100},
+    },
+    'cuts_1080p_long': {
+        'source': _cuts(1920, 1080, 180, 2),
+        'duration': 180,
+        'mock': {'latency_ms': 300, 'jitter_ms': 100},
+    },
+    # 高熵画面，关键帧 JPEG 较大
+    'noise_480p': {
+        'source': _cuts(854, 480, 30, 1, noise=60),
+        'duration': 30,
+        'mock': {'latency_ms': 300},
+    },
+    'slow_api_720p': {
+        'source': _cuts(1280, 720, 30, 0.5),
+        'duration': 30,
+        'mock': {'latency_ms': 1500, 'jitter_ms': 500},
+    },
+    'flaky_api_720p': {
+        'source': _cuts(1280, 720, 30, 1),
+        'duration': 30,
+        'mock': {'latency_ms': 300, 'error_rate': 0.1},
+    },
+}
+
+
+def generate_video(ffmpeg_path, source, work_dir):
+    """按 lavfi 描述生成测试视频，相同描述的视频只生成一次"""
+    name = hashlib.sha1(source.encode('utf-8')).hexdigest()[:12]
+    video_path = os.path.join(work_dir, 'videos', f'{name}.mp4')
+    if os.path.exists(video_path):
+        return video_path
+    os.makedirs(os.path.dirname(video_path), exist_ok=True)
+    part_path = video_path + '.part.mp4'
+    subprocess.run(
+        [ffmpeg_path, '-hide_banner', '-loglevel', 'error', '-y', '-f', 'lavfi', '-i', source,
+         '-c:v', 'libx264', '-preset', 'veryfast', '-pix_fmt', 'yuv420p', part_path],
+        check=True
+    )
+    os.replace(part_path, video_path)
+    return video_path
+
+
+def _percentile(values, q):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+
+
+def _peak_rss_mb(who):
+    if resource is None:
+        return None
+    peak = resource.getrusage(who).ru_maxrss
+    # Linux 以 KB 为单位，macOS 以字节为单位
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+def run_scenario(video_path, base_url, output_dir, ffmpeg_path, sensitivity, workers, analyzer='zhipu',
+                 low_res_width=512):
+    """在当前进程中运行一个场景（由子进程调用），返回测量结果"""
+    from ai_analyzer import AIManager
+    from job_service import JobService, TERMINAL_STATES
+
+    ai_manager = AIManager()
+    ai_manager.configure_analyzer(analyzer, 'mock.key', base_url=base_url, model='mock')
+    ai_manager.set_current_analyzer(analyzer)
+
+    service = JobService(ai_manager=ai_manager, analysis_workers=workers, ffmpeg_path=ffmpeg_path,
+                         low_res_width=low_res_width)
+    started = time.perf_counter()
+    job = service.submit(video_path, sensitivity, output_dir)
+    ai_manager.set_metrics(job.metrics)
+
+    # 记录每帧的提取时刻和判定时刻
+    extracted = {}
+    latencies = []
+    last_id = 0
+    while True:
+        events = job.events_after(last_id, timeout=1)
+        now = time.perf_counter()
+        for event_id, event_type, data in events:
+            last_id = event_id
+            if event_type == 'frame':
+                extracted[data['frame']] = now
+            elif event_type in ('verdict', 'verdict_error') and data['frame'] in extracted:
+                latencies.append(now - extracted[data['frame']])
+        if job.state in TERMINAL_STATES and not job.events_after(last_id, timeout=0):
+            break
+    elapsed = time.perf_counter() - started
+    service.shutdown()
+
+    metrics = job.metrics
+    frames = len(job.frames)
+    return {
+        'state': job.state,
+        'error': job.error,
+        'frames': frames,
+        'elapsed': round(elapsed, 3),
+        'fps': round(frames / elapsed, 2) if elapsed else 0.0,
+        'extraction_fps': metrics.gauge('extraction_fps') or 0.0,
+        'latency_p50': round(_percentile(latencies, 0.5), 3),
+        'latency_p95': round(_percentile(latencies, 0.95), 3),
+        'ai_requests': metrics.counter('ai_requests_total'),
+        'ai_retries': metrics.counter('ai_retries_total'),
+        'ai_errors': metrics.counter('ai_errors_total'),
+        'ai_upload_bytes': metrics.counter('ai_upload_bytes_total'),
+        'ai_reanalyzed': metrics.counter('ai_reanalyzed_total'),
+        'analysis_errors': sum(1 for f in job.frames if f not in job.results),
+        'peak_rss_mb': _peak_rss_mb(resource.RUSAGE_SELF) if resource else None,
+        'ffmpeg_peak_rss_mb': _peak_rss_mb(resource.RUSAGE_CHILDREN) if resource else None,
+    }
+
+
+def _run_child(args):
+    spec = json.loads(args.child)
+    result = run_scenario(**spec)
+    sys.stdout.write('\nRESULT ' + json.dumps(result) + '\n')
+
+
+def run_in_subprocess(name, scenario, video_path, ffmpeg_path, work_dir, workers, analyzer='zhipu',
+                      low_res_width=512):
+    """启动模拟服务，在子进程中运行场景，合并服务端统计"""
+    server, base_url = mock_ai_server.start_in_thread(seed=0, **scenario.get('mock', {}))
+    output_dir = os.path.join(work_dir, 'output', name)
+    shutil.rmtree(output_dir, ignore_errors=True)
+    os.makedirs(output_dir)
+    spec = {
+        'video_path': video_path,
+        'base_url': base_url,
+        'output_dir': output_dir,
+        'ffmpeg_path': ffmpeg_path,
+        'sensitivity': scenario.get('sensitivity', 0.2),
+        'workers': scenario.get('workers', workers),
+        'analyzer': analyzer,
+        'low_res_width': low_res_width,
+    }
+    try:
+        proc = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), '--child', json.dumps(spec)],
+            capture_output=True, text=True, encoding='utf-8', errors='replace', cwd=ROOT
+        )
+    finally:
+        server.shutdown()
+        server.server_close()
+    line = next((l for l in reversed(proc.stdout.splitlines()) if l.startswith('RESULT ')), None)
+    if proc.returncode != 0 or line is None:
+        raise RuntimeError(f"场景 {name} 运行失败：\n{proc.stderr[-2000:]}")
+    result = json.loads(line[len('RESULT '):])
+    stats = server.state.stats()
+    # 视频时长 / 处理耗时
+    result['speed'] = round(scenario['duration'] / result['elapsed'], 2) if result['elapsed'] else 0.0
+    result['server_requests'] = stats['requests']
+    result['server_errors'] = stats['errors']
+    result['server_max_in_flight'] = stats['max_in_flight']
+    return result
+
+
+def load_baseline(path):
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _delta(current, base, lower_is_better=False):
+    if not base:
+        return ''
+    change = (current - base) / base * 100
+    better = change < 0 if lower_is_better else change > 0
+    return f"{change:+.0f}%{'' if abs(change) < 5 else (' ✓' if better else ' ✗')}"
+
+
+def print_results(results, baseline):
+    base_results = (baseline or {}).get('results', {})
+    header = (f"{'场景':<18} {'帧数':>5} {'帧/秒':>7} {'对比':>8} {'总耗时':>8} {'对比':>8} {'倍速':>6} "
+              f"{'p50':>6} {'p95':>6} {'内存MB':>7} {'ffmpeg':>7} {'请求':>5} {'500':>4} {'失败':>4}")
+    print(header)
+    for name, r in results.items():
+        base = base_results.get(name, {})
+        print(f"{name:<18} {r['frames']:>5} {r['fps']:>7.2f} {_delta(r['fps'], base.get('fps')):>8} "
+              f"{r['elapsed']:>7.1f}s {_delta(r['elapsed'], base.get('elapsed'), True):>8} {r['speed']:>5.1f}x "
+              f"{r['latency_p50']:>6.2f} {r['latency_p95']:>6.2f} "
+              f"{r['peak_rss_mb'] or 0:>7.0f} {r['ffmpeg_peak_rss_mb'] or 0:>7.0f} "
+              f"{r['server_requests']:>5} {r['server_errors']:>4} {r['analysis_errors']:>4}")
+    if baseline:
+        print(f"\n基线：{baseline.get('commit', '?')}，{baseline.get('created', '?')}，{baseline.get('machine', '?')}")
+
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT,
+                              capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="端到端基准测试（合成视频 + 模拟AI服务）")
+    parser.add_argument('--scenarios', default=None, help="逗号分隔的场景名，默认全部")
+    parser.add_argument('--ffmpeg', default=None, help="ffmpeg 路径，默认自动查找")
+    parser.add_argument('--work-dir', default=os.path.join(tempfile.gettempdir(), 'video_security_bench'),
+                        help="测试视频和输出目录")
+    parser.add_argument('--workers', type=int, default=4, help="AI分析并发数")
+    parser.add_argument('--analyzer', choices=('zhipu', 'openai'), default='zhipu',
+                        help="使用的分析器（智谱 SDK 或 OpenAI 兼容接口）")
+    parser.add_argument('--low-res-width', type=int, default=512,
+                        help="低分辨率初次分析的图片宽度，0 为直接用原图分析")
+    parser.add_argument('--baseline', default=BASELINE_PATH)
+    parser.add_argument('--save-baseline', action='store_true', help="把本次结果保存为基线")
+    parser.add_argument('--json', default=None, help="把本次结果写入指定 JSON 文件")
+    parser.add_argument('--list', action='store_true', help="列出场景")
+    parser.add_argument('--child', default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        _run_child(args)
+        return
+    if args.list:
+        for name, scenario in SCENARIOS.items():
+            print(f"{name:<18} {scenario['source']}  {scenario.get('mock', {})}")
+        return
+
+    ffmpeg_path = args.ffmpeg or find_ffmpeg()
+    if not ffmpeg_path:
+        parser.error("找不到 ffmpeg，请使用 --ffmpeg 指定路径")
+    names = args.scenarios.split(',') if args.scenarios else list(SCENARIOS)
+    unknown = [name for name in names if name not in SCENARIOS]
+    if unknown:
+        parser.error(f"未知场景: {', '.join(unknown)}")
+
+    results = {}
+    for name in names:
+        scenario = SCENARIOS[name]
+        print(f"[{name}] 生成测试视频...", flush=True)
+        video_path = generate_video(ffmpeg_path, scenario['source'], args.work_dir)
+        print(f"[{name}] 运行...", flush=True)
+        results[name] = run_in_subprocess(name, scenario, video_path, ffmpeg_path, args.work_dir,
+                                          args.workers, args.analyzer, args.low_res_width)
+        if results[name]['state'] != 'completed':
+            print(f"[{name}] 任务未完成：{results[name]['state']} {results[name]['error'] or ''}")
+
+    print()
+    baseline = load_baseline(args.baseline)
+    print_results(results, baseline)
+
+    run = {
+        'commit': _git_commit(),
+        'created': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'machine': f"{platform.system()} {platform.machine()}, {os.cpu_count()} CPU, Python {platform.python_version()}",
+        'workers': args.workers,
+        'analyzer': args.analyzer,
+        'low_res_width': args.low_res_width,
+        'results': results,
+    }
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(run, f, ensure_ascii=False, indent=2)
+    if args.save_baseline:
+        if args.scenarios and baseline:
+            # 只运行了部分场景时保留其余场景的基线
+            run['results'] = dict(baseline.get('results', {}), **results)
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump(run, f, ensure_ascii=False, indent=2)
+        print(f"基线已保存：{args.baseline}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+"""AI服务熔断器
+
+服务故障（5xx、连接断开、超时）时，每个关键帧都要重试几次才失败，分析线程长时间阻塞。
+熔断器统计连续的故障次数：
+    - 关闭（closed）：正常发送请求
+    - 打开（open）：连续故障达到阈值后不再发送请求，正在重试的请求立即失败，
+      新的请求暂停等待，不消耗重试次数
+    - 半开（half_open）：等待时间到后只放行一个探测请求，成功则关闭并恢复发送，
+      失败则重新打开，等待时间加倍（有上限）
+
+“成功”指服务有正常响应，429、敏感内容、认证失败等说明服务可用，同样按成功处理。
+"""
+import time
+import threading
+
+
+STATE_CLOSED = 'closed'
+STATE_OPEN = 'open'
+STATE_HALF_OPEN = 'half_open'
+
+
+class CircuitOpenError(Exception):
+    """熔断器打开，请求未发送"""
+
+
+class CircuitBreaker:
+    """一个服务提供方的熔断器，线程安全"""
+
+    def __init__(self, failure_threshold=5, reset_timeout=5.0, max_reset_timeout=60.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout  # 打开后多久放行探测请求（秒）
+        self.max_reset_timeout = max_reset_timeout
+        self.state = STATE_CLOSED
+        self.failures = 0  # 连续故障次数
+        self.opened = 0  # 打开次数
+        self._timeout = reset_timeout
+        self._open_until = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def available(self):
+        """现在是否可以发送请求（不占用探测名额），用于路由和暂停派发"""
+        with self._lock:
+            if self.state == STATE_CLOSED:
+                return True
+            if self.state == STATE_OPEN:
+                return time.monotonic() >= self._open_until
+            return not self._probing
+
+    def allow(self):
+        """发送请求前调用：关闭时放行；等待时间已到时放行一个探测请求"""
+        with self._lock:
+            if self.state == STATE_CLOSED:
+                return True
+            if self.state == STATE_OPEN and time.monotonic() < self._open_until:
+                return False
+            if self._probing:
+                return False
+            self.state = STATE_HALF_OPEN
+            self._probing = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            if self.state != STATE_CLOSED:
+                print("AI服务已恢复，继续发送请求")
+            self.state = STATE_CLOSED
+            self.failures = 0
+            self._timeout = self.reset_timeout
+            self._probing = False
+
+    def record_failure(self):
+        """记录一次服务故障，熔断器因此打开时返回 True"""
+        with self._lock:
+            self.failures += 1
+            if self.state == STATE_HALF_OPEN:
+                # 探测失败，等待时间加倍
+                self._timeout = min(self._timeout * 2, self.max_reset_timeout)
+            elif self.state == STATE_OPEN or self.failures < self.failure_threshold:
+                return False
+            self.state = STATE_OPEN
+            self._probing = False
+            self._open_until = time.monotonic() + self._timeout
+            self.opened += 1
+            print(f"AI服务连续 {self.failures} 次故障，暂停发送请求 {self._timeout:.0f} 秒")
+            return True
+
+    def release(self):
+        """请求因其他原因中止（如读取图片失败），不改变状态，只归还探测名额"""
+        with self._lock:
+            self._probing = False
+
+    def to_dict(self):
+        with self._lock:
+            return {
+                'state': self.state,
+                'failures': self.failures,
+                'opened': self.opened,
+            }
@@ -16,9 +16,45 @@ class ConfigManager:
             'enable_ai': False,
             'current_model': '',
             'api_key': '',
+            'api_base_url': '',  # 自定义接口地址，留空使用官方地址（可指向本地模拟服务）
+            'api_model': '',  # 模型名称，留空使用分析器默认模型（OpenAI 兼容接口必填）
+            'api_http2': False,  # OpenAI 兼容接口使用 HTTP/2（需要安装 httpx[http2]）
+            # API密钥可填多个（逗号分隔），按每个密钥的额度分摊请求；欠费或认证失败的密钥自动停用
+            'api_key_rpm': 0,  # 每个密钥每分钟最多请求数，0 为不限
+            'api_key_concurrency': 0,  # 每个密钥最多同时进行的请求数，0 为不限
+            'ai_concurrency_per_key': 2,  # 每个可用密钥对应的分析并发数
+            # 额外的AI服务提供方，与所选模型一起按延迟和出错率路由，
+            # 例如 [{"name": "自建", "analyzer": "openai", "base_url": "http://host:8000/v1", "model": "qwen-vl"}]
+            'ai_providers': [],
+            'hedge_max_ratio': 0.1,  # 对冲（重复）请求最多占请求总数的比例
+            # 熔断：连续多次服务故障（5xx、断开、超时）后暂停发送请求，定时探测，恢复后继续
+            'circuit_failure_threshold': 5,
+            'circuit_reset_seconds': 5,  # 首次探测前的等待时间，探测失败后加倍（最多 60 秒）
+            'circuit_max_wait': 300,  # 服务持续不可用时，每帧最多等待的秒数
+            # 先用缩小到该宽度的图片分析，置信度低或有风险的帧再用原图分析；0 为直接用原图
+            'analysis_low_res_width': 512,
+            'reanalysis_confidence': 0.7,  # 校准后置信度低于该值时用原图重新分析
+            'reanalysis_audit_rate': 0.05,  # 高置信度判定中用原图抽查的比例（用于校准置信度）
+            # 各模型的 token 单价（元/百万 token，[输入, 输出]），default 用于未列出的模型
+            'token_prices': {'default': [0, 0]},
+            # 费用（元）和 token 预算，0 为不限；用量达到 budget_throttle_ratio 后逐个发送请求，达到预算后停止分析
+            'budget_run_yuan': 0,
+            'budget_run_tokens': 0,
+            'budget_daily_yuan': 0,
+            'budget_daily_tokens': 0,
+            'budget_throttle_ratio': 0.8,
             'sensitivity': 0.2,
             'output_dir': '',
-            'use_video_dir': True
+            'use_video_dir': True,
+            'keep_all_frames': False,
+            'frame_storage': 'files',
+            'output_encoding': 'jpeg',
+            'output_quality': 95,
+            'frame_memory_limit_mb': 256,
+            'thumbnail_cache_mb': 200,
+            'report_page_size': 200,
+            'trace_sample_rate': 1.0,  # 关键帧生命周期追踪的抽样比例，0 为关闭
+            'trace_capacity': 50000
         }
         
         # 加载配置，但不覆盖已存在的值
@@ -0,0 +1,211 @@
+"""AI调用的 token 用量与费用
+
+接口按 token 计费。每个响应的 usage（prompt_tokens / completion_tokens）按模型单价换算成费用：
+    - 记入该关键帧的结果（分析结果.jsonl / .csv，结果库 frames 表）
+    - 汇总到本次处理（结果库 runs 表，包括对冲、重复发送的请求）和当天的用量
+
+预算（0 为不限）分本次处理和当天两级，费用（元）和 token 数分别设置：
+    - 用量达到预算的 throttle_ratio（默认 80%）后降速，同一时间只发送一个请求，
+      避免并发中的请求大幅超出预算
+    - 达到预算后停止派发，后续请求以 BudgetExceededError 结束，不再发送
+"""
+import time
+import threading
+from contextlib import contextmanager
+
+
+DEFAULT_PRICES = {'default': (0.0, 0.0)}  # 元/百万 token：(输入, 输出)，GLM-4V-Flash 免费
+
+
+class BudgetExceededError(Exception):
+    """已达到费用或 token 预算，请求未发送"""
+
+
+def response_usage(response):
+    """从接口响应中取出 (模型名称, 输入 token 数, 输出 token 数)，没有 usage 时 token 数为 0"""
+    if isinstance(response, dict):
+        usage = response.get('usage')
+        model = response.get('model')
+    else:
+        usage = getattr(response, 'usage', None)
+        model = getattr(response, 'model', None)
+
+    def field(name):
+        value = usage.get(name) if isinstance(usage, dict) else getattr(usage, name, None)
+        try:
+            return int(value or 0)
+        except (TypeError, ValueError):
+            return 0
+
+    return model, field('prompt_tokens'), field('completion_tokens')
+
+
+class TokenPricing:
+    """各模型的 token 单价（元/百万 token），未列出的模型使用 default"""
+
+    def __init__(self, prices=None):
+        self.prices = {}
+        for model, price in (prices or DEFAULT_PRICES).items():
+            try:
+                self.prices[model.lower()] = (float(price[0]), float(price[1]))
+            except (TypeError, ValueError, IndexError):
+                print(f"Invalid token price for {model}: {price!r}")
+
+    def price(self, model):
+        return self.prices.get((model or '').lower()) or self.prices.get('default') or (0.0, 0.0)
+
+    def cost(self, model, prompt_tokens, completion_tokens):
+        input_price, output_price = self.price(model)
+        return (prompt_tokens * input_price + completion_tokens * output_price) / 1e6
+
+
+def _today():
+    return time.strftime('%Y-%m-%d')
+
+
+def day_start(timestamp=None):
+    """timestamp 所在当天 0 点的时间戳（本地时间）"""
+    t = time.localtime(timestamp)
+    return time.mktime((t.tm_year, t.tm_mon, t.tm_mday, 0, 0, 0, 0, 0, -1))
+
+
+class SpendTracker:
+    """一个范围（本次处理或当天）的用量与预算，线程安全
+
+    parent 为上一级范围，记录用量时一并累加，检查预算时一并检查。
+    daily 为 True 时跨过零点自动清零；spent 为启动前已用的 (token 数, 费用)，如结果库中今天的用量。
+    """
+
+    def __init__(self, name, cost_budget=0, token_budget=0, throttle_ratio=0.8, parent=None,
+                 daily=False, spent=None):
+        self.name = name
+        self.cost_budget = cost_budget
+        self.token_budget = token_budget
+        self.throttle_ratio = throttle_ratio
+        self.parent = parent
+        self.day = _today() if daily else None
+        self.requests = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.cost = 0.0
+        self.base_tokens, self.base_cost = spent or (0, 0.0)
+        self._lock = threading.Lock()
+        self._throttle = threading.Lock()  # 降速时同一时间只放行一个请求
+
+    def _roll(self):
+        """跨过零点时清零（调用时持有锁）"""
+        if self.day is not None and self.day != _today():
+            self.day = _today()
+            self.requests = self.prompt_tokens = self.completion_tokens = 0
+            self.cost = 0.0
+            self.base_tokens, self.base_cost = 0, 0.0
+
+    def record(self, prompt_tokens, completion_tokens, cost):
+        """记录一个响应的用量"""
+        with self._lock:
+            self._roll()
+            self.requests += 1
+            self.prompt_tokens += prompt_tokens
+            self.completion_tokens += completion_tokens
+            self.cost += cost
+        if self.parent:
+            self.parent.record(prompt_tokens, completion_tokens, cost)
+
+    def totals(self):
+        """已用的 (token 数, 费用)，包括启动前已用的部分"""
+        with self._lock:
+            self._roll()
+            return (self.base_tokens + self.prompt_tokens + self.completion_tokens,
+                    self.base_cost + self.cost)
+
+    def usage_ratio(self):
+        """已用预算的比例（费用与 token 数中较高的一个），没有预算时为 0"""
+        tokens, cost = self.totals()
+        ratio = 0.0
+        if self.cost_budget:
+            ratio = max(ratio, cost / self.cost_budget)
+        if self.token_budget:
+            ratio = max(ratio, tokens / self.token_budget)
+        return ratio
+
+    def _chain(self):
+        scope = self
+        while scope is not None:
+            yield scope
+            scope = scope.parent
+
+    def check(self):
+        """本范围或上级范围已达到预算时抛出 BudgetExceededError"""
+        for scope in self._chain():
+            if scope.usage_ratio() >= 1:
+                tokens, cost = scope.totals()
+                raise BudgetExceededError(
+                    f"已达到{scope.name}的AI费用预算（已用 {tokens} token，¥{cost:.2f}），停止发送请求")
+
+    @contextmanager
+    def dispatch(self):
+        """发送请求期间使用：已达到预算时抛出异常；接近预算时排队逐个发送，返回是否在降速"""
+        self.check()
+        throttled = [scope for scope in self._chain()
+                     if scope.throttle_ratio and scope.usage_ratio() >= scope.throttle_ratio]
+        # 总是按本次处理 -> 当天的顺序加锁，不会互相等待
+        for scope in throttled:
+            scope._throttle.acquire()
+        try:
+            if throttled:
+                # 排队期间前面的请求可能已用完预算
+                self.check()
+            yield bool(throttled)
+        finally:
+            for scope in reversed(throttled):
+                scope._throttle.release()
+
+    def to_dict(self):
+        with self._lock:
+            self._roll()
+            return {
+                'requests': self.requests,
+                'prompt_tokens': self.prompt_tokens,
+                'completion_tokens': self.completion_tokens,
+                'cost': round(self.cost, 6),
+                'cost_budget': self.cost_budget,
+                'token_budget': self.token_budget,
+            }
+
+
+def estimate_run(frame_count, history, pricing, model=None):
+    """按历史上每个关键帧的平均 token 数估算 frame_count 个关键帧的用量和费用
+
+    history 为 ResultsDatabase.usage_history() 的结果，没有用量记录时只返回帧数。
+    """
+    estimate = {'frames': frame_count, 'prompt_tokens': None, 'completion_tokens': None, 'cost': None}
+    if frame_count is None or not history or not history.get('analyzed_frames'):
+        return estimate
+    prompt_tokens = round(frame_count * history['prompt_tokens_per_frame'])
+    completion_tokens = round(frame_count * history['completion_tokens_per_frame'])
+    estimate.update(
+        prompt_tokens=prompt_tokens,
+        completion_tokens=completion_tokens,
+        cost=round(pricing.cost(model, prompt_tokens, completion_tokens), 4)
+    )
+    return estimate
+
+
+def expected_keyframes(duration, history):
+    """按历史上每分钟视频提取的关键帧数估算关键帧数，没有记录时返回 None"""
+    if not duration or not history or not history.get('frames_per_minute'):
+        return None
+    return round(duration / 60 * history['frames_per_minute'])
+
+
+def format_estimate(estimate):
+    """界面和日志中显示的预估文字"""
+    if not estimate or estimate.get('frames') is None:
+        return ""
+    text = f"预计约 {estimate['frames']} 个关键帧"
+    if estimate.get('prompt_tokens') is not None:
+        tokens = estimate['prompt_tokens'] + estimate['completion_tokens']
+        text += f"，约 {tokens} token"
+        if estimate.get('cost'):
+            text += f"、¥{estimate['cost']:.2f}"
+    return text
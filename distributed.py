@@ -0,0 +1,523 @@
+"""分布式处理：协调节点 + 无状态工作节点
+
+协调节点把视频按整段或时间片切分为任务，工作节点通过HTTP拉取（租约）任务，
+在本地提取关键帧并完成AI分析，再把每帧的判定结果（风险帧附带图片）推送回来。
+租约超时或工作节点报告失败的任务会重新派发。同一视频的所有分片完成后，
+协调节点合并结果并生成与界面版相同格式的风险报告。
+
+视频路径需要在所有工作节点上可访问（例如共享的NAS目录）。单机测试时
+在同一台机器上分别启动协调节点和若干工作节点即可。
+
+用法：
+    python distributed.py coordinator --port 8770 --segment-seconds 300
+    python distributed.py worker --coordinator http://127.0.0.1:8770
+    python distributed.py submit --coordinator http://127.0.0.1:8770 D:/videos/a.mp4
+"""
+import os
+import json
+import time
+import uuid
+import base64
+import socket
+import argparse
+import threading
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+
+import requests
+
+from video_pipeline import (find_ffmpeg, make_frames_dir, stream_keyframes, format_timestamp, frame_extension,
+                            probe_duration, is_frame_name)
+from frame_store import FrameStore
+from report_exporter import export_risk_report
+
+
+class SegmentTask:
+    """一个视频分片（或整段视频）的处理任务"""
+
+    def __init__(self, job_id, video_path, sensitivity, start=None, duration=None):
+        self.id = uuid.uuid4().hex[:12]
+        self.job_id = job_id
+        self.video_path = video_path
+        self.sensitivity = sensitivity
+        self.start = start
+        self.duration = duration
+        self.state = 'queued'  # queued / leased / done / failed
+        self.worker_id = None
+        self.lease_expires = 0
+        self.attempts = 0
+        self.last_error = None
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'job_id': self.job_id,
+            'video_path': self.video_path,
+            'sensitivity': self.sensitivity,
+            'start': self.start,
+            'duration': self.duration,
+            'attempts': self.attempts,
+        }
+
+
+class DistributedJob:
+    """协调节点上的一个视频任务，汇总各分片的结果"""
+
+    def __init__(self, video_path, sensitivity, output_dir=None, lock=None):
+        self.id = uuid.uuid4().hex[:12]
+        self.video_path = video_path
+        self.sensitivity = sensitivity
+        self.output_dir = output_dir
+        self.tasks = {}
+        self.frames = {}  # 帧文件名 -> 判定结果
+        self.frames_dir = None
+        self.report_path = None
+        self.state = 'running'
+        self.error = None
+        self.created_at = time.time()
+        self.finished_at = None
+        self.lock = lock or threading.Lock()  # 协调节点的锁，tasks / frames 在其他线程中更新
+
+    def to_dict(self):
+        with self.lock:
+            done = sum(1 for t in self.tasks.values() if t.state == 'done')
+            return {
+                'id': self.id,
+                'video_path': self.video_path,
+                'state': self.state,
+                'error': self.error,
+                'tasks_total': len(self.tasks),
+                'tasks_done': done,
+                'frame_count': len(self.frames),
+                'risk_count': sum(1 for r in self.frames.values() if not r.get('is_safe', True)),
+                'error_count': sum(1 for r in self.frames.values() if r.get('error')),
+                'frames_dir': self.frames_dir,
+                'report_path': self.report_path,
+                'created_at': self.created_at,
+                'finished_at': self.finished_at,
+            }
+
+
+class Coordinator:
+    """任务切分、租约管理与结果合并"""
+
+    def __init__(self, segment_seconds=0, lease_seconds=120, max_attempts=3, ffmpeg_path=None):
+        self.segment_seconds = segment_seconds  # 0 表示按整段视频派发
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.ffmpeg_path = ffmpeg_path
+        self.jobs = {}
+        self.tasks = {}
+        self.queue = deque()
+        self.lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._reaper = threading.Thread(target=self._reap_expired_leases, daemon=True)
+        self._reaper.start()
+
+    def submit(self, video_path, sensitivity=0.2, output_dir=None):
+        job = DistributedJob(video_path, float(sensitivity), output_dir, lock=self.lock)
+        job.frames_dir = make_frames_dir(video_path, output_dir)
+
+        duration = None
+        if self.segment_seconds:
+            duration = probe_duration(video_path, self.ffmpeg_path)
+        if duration and duration > self.segment_seconds:
+            start = 0.0
+            while start < duration:
+                length = min(self.segment_seconds, duration - start)
+                task = SegmentTask(job.id, video_path, job.sensitivity, start, length)
+                job.tasks[task.id] = task
+                start += self.segment_seconds
+        else:
+            task = SegmentTask(job.id, video_path, job.sensitivity)
+            job.tasks[task.id] = task
+
+        with self.lock:
+            self.jobs[job.id] = job
+            for task in job.tasks.values():
+                self.tasks[task.id] = task
+                self.queue.append(task.id)
+        print(f"[coordinator] 已提交 {video_path}，共 {len(job.tasks)} 个分片")
+        return job
+
+    def lease(self, worker_id):
+        """为工作节点分配一个任务，没有任务时返回 None"""
+        with self.lock:
+            while self.queue:
+                task = self.tasks[self.queue.popleft()]
+                if task.state != 'queued':
+                    continue
+                task.state = 'leased'
+                task.worker_id = worker_id
+                task.attempts += 1
+                task.lease_expires = time.time() + self.lease_seconds
+                return task
+        return None
+
+    def heartbeat(self, task_id, worker_id):
+        """续租，返回 False 表示租约已失效（任务已被重新派发）"""
+        with self.lock:
+            task = self.tasks.get(task_id)
+            if not task or task.state != 'leased' or task.worker_id != worker_id:
+                return False
+            task.lease_expires = time.time() + self.lease_seconds
+            return True
+
+    def complete(self, task_id, worker_id, frames):
+        """接收工作节点推送的判定结果
+
+        帧文件名只能是时间码文件名，不能包含目录，否则抛出 ValueError（接口返回 400），不写入任何文件。
+        """
+        for frame in frames:
+            name = frame.get('frame')
+            if not is_frame_name(name) or os.path.basename(name) != name:
+                raise ValueError(f"无效的帧文件名：{name!r}")
+
+        with self.lock:
+            task = self.tasks.get(task_id)
+            if not task or task.state != 'leased' or task.worker_id != worker_id:
+                return False
+            job = self.jobs[task.job_id]
+
+        # 先写入帧图片，结果写入 job.frames 后才标记分片完成，合并报告时不会缺少这些帧
+        results = {}
+        for frame in frames:
+            frame_name = frame['frame']
+            frame_path = os.path.join(job.frames_dir, frame_name)
+            if frame.get('image'):
+                with open(frame_path, 'wb') as f:
+                    f.write(base64.b64decode(frame['image']))
+            results[frame_name] = {
+                'is_safe': frame.get('is_safe', True),
+                'risk_type': frame.get('risk_type', ''),
+                'description': frame.get('description', ''),
+                'error': frame.get('error'),
+            }
+
+        with self.lock:
+            # 写入图片期间租约可能已超时并重新派发
+            if task.state != 'leased' or task.worker_id != worker_id:
+                return False
+            job.frames.update(results)
+            task.state = 'done'
+        self._maybe_finish(job)
+        return True
+
+    def list_jobs(self):
+        """所有任务的快照（列表），避免遍历时 submit() 修改字典"""
+        with self.lock:
+            return list(self.jobs.values())
+
+    def get_job(self, job_id):
+        with self.lock:
+            return self.jobs.get(job_id)
+
+    def fail(self, task_id, worker_id, error):
+        with self.lock:
+            task = self.tasks.get(task_id)
+            if not task or task.worker_id != worker_id or task.state != 'leased':
+                return False
+            task.last_error = error
+            self._requeue(task)
+            job = self.jobs[task.job_id]
+        print(f"[coordinator] 分片 {task_id} 失败（第 {task.attempts} 次）：{error}")
+        self._maybe_finish(job)
+        return True
+
+    def _requeue(self, task):
+        """重新派发任务，超过最大次数后标记失败（调用方持有锁）"""
+        task.worker_id = None
+        if task.attempts >= self.max_attempts:
+            task.state = 'failed'
+        else:
+            task.state = 'queued'
+            self.queue.append(task.id)
+
+    def _reap_expired_leases(self):
+        while not self._stop_event.wait(1):
+            now = time.time()
+            expired_jobs = []
+            with self.lock:
+                for task in self.tasks.values():
+                    if task.state == 'leased' and task.lease_expires < now:
+                        print(f"[coordinator] 分片 {task.id} 租约超时（{task.worker_id}），重新派发")
+                        task.last_error = 'lease expired'
+                        self._requeue(task)
+                        expired_jobs.append(self.jobs[task.job_id])
+            for job in expired_jobs:
+                self._maybe_finish(job)
+
+    def _maybe_finish(self, job):
+        with self.lock:
+            if job.state != 'running':
+                return
+            states = [t.state for t in job.tasks.values()]
+            if any(s in ('queued', 'leased') for s in states):
+                return
+            failed = [t for t in job.tasks.values() if t.state == 'failed']
+            job.state = 'merging'
+            analysis_results = {
+                os.path.join(job.frames_dir, name): result
+                for name, result in job.frames.items()
+            }
+
+        report_path, error = None, None
+        try:
+            if analysis_results:
+                report_path = export_risk_report(job.frames_dir, analysis_results)
+            if failed:
+                error = f"{len(failed)} 个分片处理失败：{failed[0].last_error}"
+        except Exception as e:
+            error = f"合并结果失败：{e}"
+        with self.lock:
+            job.report_path = report_path
+            job.error = error
+            job.state = 'failed' if error else 'completed'
+            job.finished_at = time.time()
+        print(f"[coordinator] 任务 {job.id} {job.state}，报告：{job.report_path}")
+
+    def stop(self):
+        self._stop_event.set()
+
+
+class CoordinatorRequestHandler(BaseHTTPRequestHandler):
+    """协调节点的HTTP接口"""
+
+    server_version = "VideoSecurityCoordinator/1.0"
+
+    @property
+    def coordinator(self):
+        return self.server.coordinator
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status, data=None):
+        body = json.dumps(data if data is not None else {}, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_json(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        return json.loads(self.rfile.read(length).decode('utf-8')) if length else {}
+
+    def do_GET(self):
+        parts = [p for p in urlparse(self.path).path.split('/') if p]
+        job = self.coordinator.get_job(parts[1]) if len(parts) == 2 and parts[0] == 'jobs' else None
+        if parts == ['jobs']:
+            self._send_json(200, {'jobs': [j.to_dict() for j in self.coordinator.list_jobs()]})
+        elif job is not None:
+            self._send_json(200, job.to_dict())
+        else:
+            self._send_json(404, {'error': 'not found'})
+
+    def do_POST(self):
+        parts = [p for p in urlparse(self.path).path.split('/') if p]
+        try:
+            data = self._read_json()
+            if parts == ['jobs']:
+                job = self.coordinator.submit(data['video_path'], data.get('sensitivity', 0.2),
+                                              data.get('output_dir'))
+                self._send_json(201, job.to_dict())
+            elif parts == ['lease']:
+                task = self.coordinator.lease(data['worker_id'])
+                if task:
+                    self._send_json(200, dict(task.to_dict(), lease_seconds=self.coordinator.lease_seconds))
+                else:
+                    self._send_json(204)
+            elif len(parts) == 3 and parts[0] == 'tasks':
+                task_id, action = parts[1], parts[2]
+                worker_id = data.get('worker_id')
+                if action == 'heartbeat':
+                    ok = self.coordinator.heartbeat(task_id, worker_id)
+                elif action == 'result':
+                    ok = self.coordinator.complete(task_id, worker_id, data.get('frames', []))
+                elif action == 'fail':
+                    ok = self.coordinator.fail(task_id, worker_id, data.get('error', ''))
+                else:
+                    self._send_json(404, {'error': 'not found'})
+                    return
+                # 409 表示租约已失效，工作节点应丢弃该任务
+                self._send_json(200 if ok else 409, {'ok': ok})
+            else:
+                self._send_json(404, {'error': 'not found'})
+        except (KeyError, ValueError, json.JSONDecodeError) as e:
+            self._send_json(400, {'error': str(e)})
+
+
+def create_coordinator_server(coordinator, host='127.0.0.1', port=8770):
+    server = ThreadingHTTPServer((host, port), CoordinatorRequestHandler)
+    server.daemon_threads = True
+    server.coordinator = coordinator
+    return server
+
+
+class Worker:
+    """无状态工作节点：拉取任务、提取并分析关键帧、推送结果"""
+
+    def __init__(self, coordinator_url, ai_manager=None, worker_id=None, poll_interval=2, ffmpeg_path=None):
+        self.coordinator_url = coordinator_url.rstrip('/')
+        self.ai_manager = ai_manager
+        self.worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}"
+        self.poll_interval = poll_interval
+        self.ffmpeg_path = ffmpeg_path or find_ffmpeg()
+        self.session = requests.Session()
+        self._stop_event = threading.Event()
+
+    def _post(self, path, data):
+        return self.session.post(f"{self.coordinator_url}{path}", json=data, timeout=30)
+
+    def run_forever(self):
+        print(f"[worker {self.worker_id}] 已连接 {self.coordinator_url}")
+        while not self._stop_event.is_set():
+            try:
+                response = self._post('/lease', {'worker_id': self.worker_id})
+            except requests.RequestException as e:
+                print(f"[worker {self.worker_id}] 无法连接协调节点：{e}")
+                self._stop_event.wait(self.poll_interval)
+                continue
+            if response.status_code != 200:
+                self._stop_event.wait(self.poll_interval)
+                continue
+            self.run_task(response.json())
+
+    def stop(self):
+        self._stop_event.set()
+
+    def run_task(self, task):
+        task_id = task['id']
+        lease_lost = threading.Event()
+        heartbeat_stop = threading.Event()
+
+        def heartbeat():
+            interval = max(task.get('lease_seconds', 120) / 3, 1)
+            while not heartbeat_stop.wait(interval):
+                try:
+                    response = self._post(f'/tasks/{task_id}/heartbeat', {'worker_id': self.worker_id})
+                    if response.status_code == 409:
+                        lease_lost.set()
+                        return
+                except requests.RequestException:
+                    pass
+
+        heartbeat_thread = threading.Thread(target=heartbeat, daemon=True)
+        heartbeat_thread.start()
+        # 帧数据只保存在内存中（超过上限时溢出到临时文件），风险帧随结果回传
+        frame_store = FrameStore()
+        frames = []
+
+        def on_frame(timestamp, data):
+            frame_name = format_timestamp(timestamp) + frame_extension('jpeg')
+            frame_store.put(frame_name, data, timestamp)
+            frames.append(frame_name)
+
+        try:
+            stream_keyframes(
+                task['video_path'],
+                task['sensitivity'],
+                on_frame=on_frame,
+                ffmpeg_path=self.ffmpeg_path,
+                start=task.get('start'),
+                duration=task.get('duration')
+            )
+            results = []
+            for frame_name in frames:
+                if lease_lost.is_set():
+                    print(f"[worker {self.worker_id}] 分片 {task_id} 租约已失效，放弃")
+                    return
+                try:
+                    results.append(self._analyze_frame(frame_name, frame_store.get(frame_name)))
+                except Exception as e:
+                    # 单帧分析失败只记录在该帧上，不丢弃已完成的结果，也不重新派发整个分片
+                    print(f"[worker {self.worker_id}] 分析 {frame_name} 失败：{e}")
+                    results.append({'frame': frame_name, 'is_safe': True,
+                                    'risk_type': '', 'description': '', 'error': str(e)})
+                finally:
+                    frame_store.release(frame_name)
+            self._post(f'/tasks/{task_id}/result', {'worker_id': self.worker_id, 'frames': results})
+        except Exception as e:
+            print(f"[worker {self.worker_id}] 分片 {task_id} 失败：{e}")
+            try:
+                self._post(f'/tasks/{task_id}/fail', {'worker_id': self.worker_id, 'error': str(e)})
+            except requests.RequestException:
+                pass  # 协调节点会在租约超时后重新派发
+        finally:
+            heartbeat_stop.set()
+            frame_store.close()
+
+    def _analyze_frame(self, frame_name, data):
+        frame = {'frame': frame_name, 'is_safe': True, 'risk_type': '', 'description': ''}
+        if not (self.ai_manager and self.ai_manager.current_analyzer):
+            return frame
+        image_base64 = base64.b64encode(data).decode('ascii')
+        response = self.ai_manager.analyze_image(frame_name, image_base64=image_base64)
+        frame.update(self.ai_manager.parse_response(response))
+        if not frame['is_safe']:
+            # 只回传风险帧的图片，用于生成报告
+            frame['image'] = image_base64
+        return frame
+
+
+def main():
+    parser = argparse.ArgumentParser(description="视频安全检查分布式处理")
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    coord = sub.add_parser('coordinator', help="启动协调节点")
+    coord.add_argument('--host', default='127.0.0.1', help="多机部署时设置为局域网地址")
+    coord.add_argument('--port', type=int, default=8770)
+    coord.add_argument('--segment-seconds', type=float, default=0, help="按时间片切分（秒），0 表示整段派发")
+    coord.add_argument('--lease-seconds', type=float, default=120)
+    coord.add_argument('--max-attempts', type=int, default=3)
+
+    work = sub.add_parser('worker', help="启动工作节点")
+    work.add_argument('--coordinator', default='http://127.0.0.1:8770')
+    work.add_argument('--no-ai', action='store_true', help="只提取关键帧，不进行AI分析")
+
+    submit = sub.add_parser('submit', help="向协调节点提交视频")
+    submit.add_argument('--coordinator', default='http://127.0.0.1:8770')
+    submit.add_argument('--sensitivity', type=float, default=0.2)
+    submit.add_argument('--output-dir')
+    submit.add_argument('videos', nargs='+')
+
+    args = parser.parse_args()
+
+    if args.command == 'coordinator':
+        coordinator = Coordinator(args.segment_seconds, args.lease_seconds, args.max_attempts, find_ffmpeg())
+        server = create_coordinator_server(coordinator, args.host, args.port)
+        print(f"协调节点已启动: http://{args.host}:{server.server_address[1]}")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            coordinator.stop()
+            server.server_close()
+
+    elif args.command == 'worker':
+        ai_manager = None
+        if not args.no_ai:
+            from config_manager import ConfigManager
+            from job_service import create_ai_manager_from_config
+            ai_manager = create_ai_manager_from_config(ConfigManager().config)
+        worker = Worker(args.coordinator, ai_manager)
+        try:
+            worker.run_forever()
+        except KeyboardInterrupt:
+            worker.stop()
+
+    elif args.command == 'submit':
+        for video_path in args.videos:
+            response = requests.post(f"{args.coordinator.rstrip('/')}/jobs", json={
+                'video_path': os.path.abspath(video_path),
+                'sensitivity': args.sensitivity,
+                'output_dir': args.output_dir,
+            }, timeout=60)
+            print(json.dumps(response.json(), ensure_ascii=False))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,195 @@
+"""处理前估算（试运行）
+
+正式处理一批长视频前，估算每个视频和全部视频的关键帧数、AI请求数、耗时和费用，不发送AI请求：
+    - 关键帧数：在视频中均匀选取几段（默认 6 段 × 20 秒），只解码这几段并按相同的场景阈值统计场景切换
+      （不编码输出图片），按时长外推；短视频直接统计全片
+    - 请求数：关键帧数扣除历史的缓存命中比例，再加上历史的原图复查比例
+    - 耗时：提取关键帧按试运行中实测的解码速度外推，AI分析按历史的单帧耗时和分析并发数估算，
+      两者同时进行，取较长的一个
+    - token 数和费用：按历史的每帧平均 token 数和配置中的单价估算
+历史数据来自结果库 results.db（界面版和本地任务服务的处理记录），没有记录的项不做估算。
+
+用法：
+    python dry_run.py D:/videos [更多视频或目录] [--sensitivity 0.2] [--workers N] [--json]
+"""
+import os
+import sys
+import json
+import time
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+from video_pipeline import find_ffmpeg, probe_duration, count_scene_changes
+from results_store import ResultsDatabase, RESULTS_DB_NAME
+
+
+VIDEO_EXTENSIONS = ('.mp4', '.avi', '.mov', '.mkv')
+
+
+def find_videos(paths):
+    """展开命令行中的视频文件和目录（目录下递归查找视频文件）"""
+    videos = []
+    for path in paths:
+        if os.path.isdir(path):
+            for root, _, files in os.walk(path):
+                videos += [os.path.join(root, name) for name in sorted(files)
+                           if name.lower().endswith(VIDEO_EXTENSIONS)]
+        elif os.path.isfile(path):
+            videos.append(path)
+        else:
+            print(f"找不到视频文件或目录: {path}")
+    return videos
+
+
+def sample_windows(duration, samples=6, sample_seconds=20):
+    """在视频中均匀选取的 (开始时间, 长度) 列表，视频不长时整段统计"""
+    if not duration or duration <= samples * sample_seconds * 1.5:
+        return [(0, duration)]
+    step = duration / samples
+    return [(max(0.0, (i + 0.5) * step - sample_seconds / 2), sample_seconds) for i in range(samples)]
+
+
+def probe_video(video_path, sensitivity, ffmpeg_path=None, samples=6, sample_seconds=20):
+    """抽样统计一个视频的场景切换，返回时长、外推的关键帧数和实测的解码速度"""
+    duration = probe_duration(video_path, ffmpeg_path)
+    if not duration:
+        raise ValueError("无法读取视频时长")
+    windows = sample_windows(duration, samples, sample_seconds)
+    started = time.perf_counter()
+    cuts = sum(count_scene_changes(video_path, sensitivity, ffmpeg_path, start=start, duration=length)
+               for start, length in windows)
+    elapsed = time.perf_counter() - started
+    sampled = sum(length for _, length in windows)
+    return {
+        'duration': round(duration, 1),
+        'sampled_seconds': round(sampled, 1),
+        'sampled_keyframes': cuts,
+        'keyframes': round(cuts * duration / sampled),
+        'decode_speed': round(sampled / elapsed, 2) if elapsed else None,  # 每秒处理的视频秒数
+        'probe_seconds': round(elapsed, 2),
+    }
+
+
+def estimate_video(probe, history, workers, ai_manager=None, low_res=True):
+    """由抽样结果和历史记录估算请求数、耗时和费用"""
+    frames = probe['keyframes']
+    estimate = dict(probe, requests=0, prompt_tokens=0, completion_tokens=0, cost=0.0)
+    extraction = probe['duration'] / probe['decode_speed'] if probe['decode_speed'] else None
+    analysis = 0.0
+    if ai_manager is not None:
+        history = history or {}
+        sent = frames * (1 - (history.get('cache_hit_rate') or 0))
+        if low_res:
+            sent *= 1 + (history.get('reanalysis_rate') or 0)
+        estimate['requests'] = round(sent)
+        spend = ai_manager.estimate_run(frame_count=frames, history=history)
+        estimate.update(prompt_tokens=spend['prompt_tokens'], completion_tokens=spend['completion_tokens'],
+                        cost=spend['cost'])
+        latency = history.get('seconds_per_frame')
+        analysis = None
+        if latency:
+            # 分析与提取同时进行，最后一帧提取后还要等它的分析完成
+            analysis = frames * (1 - (history.get('cache_hit_rate') or 0)) * latency / max(1, workers) + latency
+    if extraction is None or analysis is None:
+        estimate['wall_seconds'] = None
+    else:
+        estimate['wall_seconds'] = round(max(extraction, analysis), 1)
+    estimate['extraction_seconds'] = round(extraction, 1) if extraction is not None else None
+    estimate['analysis_seconds'] = round(analysis, 1) if analysis is not None else None
+    return estimate
+
+
+def summarize(estimates):
+    """全部视频的合计，耗时按逐个处理计算；任一视频缺少某项时该项合计为 None"""
+    total = {'videos': len(estimates)}
+    for name in ('duration', 'keyframes', 'requests', 'prompt_tokens', 'completion_tokens', 'cost',
+                 'wall_seconds'):
+        values = [e.get(name) for e in estimates]
+        total[name] = None if any(v is None for v in values) else round(sum(values), 4)
+    return total
+
+
+def _minutes(seconds):
+    return f"{seconds / 60:.1f}" if seconds is not None else "-"
+
+
+def _value(value, fmt="{}"):
+    return fmt.format(value) if value is not None else "-"
+
+
+def print_table(estimates, total):
+    print(f"{'视频':<32} {'时长(分)':>8} {'关键帧':>6} {'请求':>6} {'token':>9} {'费用(元)':>9} {'耗时(分)':>8}")
+    for e in estimates:
+        if 'error' in e:
+            print(f"{os.path.basename(e['video'])[:32]:<32} 出错：{e['error']}")
+            continue
+        tokens = (e['prompt_tokens'] + e['completion_tokens']) if e['prompt_tokens'] is not None else None
+        print(f"{os.path.basename(e['video'])[:32]:<32} {_minutes(e['duration']):>8} {e['keyframes']:>6} "
+              f"{e['requests']:>6} {_value(tokens):>9} {_value(e['cost'], '{:.2f}'):>9} "
+              f"{_minutes(e['wall_seconds']):>8}")
+    tokens = (total['prompt_tokens'] + total['completion_tokens']) if total['prompt_tokens'] is not None else None
+    print(f"{'合计':<32} {_minutes(total['duration']):>8} {_value(total['keyframes']):>6} "
+          f"{_value(total['requests']):>6} {_value(tokens):>9} {_value(total['cost'], '{:.2f}'):>9} "
+          f"{_minutes(total['wall_seconds']):>8}")
+
+
+def main():
+    from config_manager import ConfigManager
+    from job_service import create_ai_manager_from_config
+
+    config_manager = ConfigManager()
+    config = config_manager.config
+    parser = argparse.ArgumentParser(description="处理前估算关键帧数、请求数、耗时和费用（不发送AI请求）")
+    parser.add_argument('paths', nargs='+', help="视频文件或目录")
+    parser.add_argument('--sensitivity', type=float, default=config.get('sensitivity', 0.2))
+    parser.add_argument('--samples', type=int, default=6, help="每个视频抽样的段数")
+    parser.add_argument('--sample-seconds', type=float, default=20, help="每段的长度（秒）")
+    parser.add_argument('--workers', type=int, default=None,
+                        help="AI分析并发数（默认按密钥数量 × ai_concurrency_per_key）")
+    parser.add_argument('--jobs', type=int, default=2, help="同时抽样的视频数")
+    parser.add_argument('--db', default=None, help="结果库路径（默认使用配置目录下的 results.db）")
+    parser.add_argument('--ffmpeg', default=None)
+    parser.add_argument('--json', action='store_true', help="输出 JSON")
+    args = parser.parse_args()
+
+    ffmpeg_path = args.ffmpeg or find_ffmpeg()
+    if not ffmpeg_path:
+        print("找不到 ffmpeg")
+        sys.exit(1)
+    videos = find_videos(args.paths)
+    if not videos:
+        sys.exit(1)
+
+    database = ResultsDatabase(args.db or os.path.join(config_manager.get_config_dir(), RESULTS_DB_NAME))
+    history = database.usage_history(args.sensitivity)
+    ai_manager = create_ai_manager_from_config(config)
+    workers = args.workers
+    if workers is None:
+        per_key = config.get('ai_concurrency_per_key', 2)
+        workers = max(2, per_key * ai_manager.key_count()) if ai_manager else 2
+    low_res = bool(config.get('analysis_low_res_width', 512))
+
+    def run(video_path):
+        try:
+            probe = probe_video(video_path, args.sensitivity, ffmpeg_path, args.samples, args.sample_seconds)
+            return dict(estimate_video(probe, history, workers, ai_manager, low_res), video=video_path)
+        except Exception as e:
+            return {'video': video_path, 'error': str(e)}
+
+    with ThreadPoolExecutor(max_workers=max(1, args.jobs)) as executor:
+        estimates = list(executor.map(run, videos))
+    total = summarize([e for e in estimates if 'error' not in e])
+
+    if args.json:
+        sys.stdout.write(json.dumps({'videos': estimates, 'total': total, 'history': history, 'workers': workers},
+                                    ensure_ascii=False, indent=2) + '\n')
+        return
+    print_table(estimates, total)
+    if not ai_manager:
+        print("未启用AI分析，只估算关键帧数和提取耗时")
+    elif not history.get('analyzed_frames'):
+        print("结果库中还没有分析记录，token 数、费用和分析耗时无法估算")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,191 @@
+"""单文件关键帧容器
+
+每次处理只生成两个文件，代替成百上千个零散的小图片：
+    frames.pack  追加写入的帧数据
+    frames.idx   定长索引：时间戳、偏移、长度、SHA1、判定结果
+
+读取通过 mmap 完成，预览、分析和报告生成都不需要再打开单独的文件。
+
+用法（导出为普通图片文件）：
+    python frame_pack.py list <目录>
+    python frame_pack.py extract <目录> [输出目录]
+"""
+import os
+import sys
+import mmap
+import struct
+import hashlib
+import threading
+
+
+PACK_FILE = 'frames.pack'
+INDEX_FILE = 'frames.idx'
+
+# 索引文件头：魔数 + 编码格式（jpeg / webp）
+INDEX_HEADER = struct.Struct('<8s8s')
+INDEX_MAGIC = b'VSCIDX01'
+# 索引记录：时间戳(秒)、偏移、长度、SHA1、判定结果
+INDEX_RECORD = struct.Struct('<dQI20sB')
+VERDICT_OFFSET = INDEX_RECORD.size - 1
+
+VERDICT_UNKNOWN = 0
+VERDICT_SAFE = 1
+VERDICT_RISK = 2
+
+EXTENSIONS = {'jpeg': '.jpg', 'webp': '.webp'}
+
+
+class FramePackEntry:
+    __slots__ = ('index', 'timestamp', 'offset', 'length', 'sha1', 'verdict')
+
+    def __init__(self, index, timestamp, offset, length, sha1, verdict):
+        self.index = index
+        self.timestamp = timestamp
+        self.offset = offset
+        self.length = length
+        self.sha1 = sha1
+        self.verdict = verdict
+
+
+class FramePack:
+    """追加写入的关键帧容器"""
+
+    def __init__(self, directory, encoding='jpeg', writable=True):
+        self.directory = directory
+        self.pack_path = os.path.join(directory, PACK_FILE)
+        self.index_path = os.path.join(directory, INDEX_FILE)
+        self.writable = writable
+        self.entries = []
+        self._lock = threading.Lock()
+        self._mmap = None
+        self._mapped_size = 0
+
+        if os.path.exists(self.index_path):
+            self._load_index()
+        elif writable:
+            self.encoding = encoding
+            with open(self.index_path, 'wb') as f:
+                f.write(INDEX_HEADER.pack(INDEX_MAGIC, encoding.encode('ascii')))
+        else:
+            raise FileNotFoundError(self.index_path)
+
+        if writable:
+            self._truncate_torn_tail()
+            self._pack_file = open(self.pack_path, 'ab+')
+            self._index_file = open(self.index_path, 'r+b')
+        else:
+            self._pack_file = open(self.pack_path, 'rb')
+            self._index_file = None
+        self._pack_size = os.path.getsize(self.pack_path)
+
+    @property
+    def extension(self):
+        return EXTENSIONS.get(self.encoding, '.jpg')
+
+    def _load_index(self):
+        with open(self.index_path, 'rb') as f:
+            magic, encoding = INDEX_HEADER.unpack(f.read(INDEX_HEADER.size))
+            if magic != INDEX_MAGIC:
+                raise ValueError(f"不是有效的关键帧索引文件: {self.index_path}")
+            self.encoding = encoding.rstrip(b'\0').decode('ascii')
+            while True:
+                record = f.read(INDEX_RECORD.size)
+                if len(record) < INDEX_RECORD.size:
+                    # 写入中断留下的不完整记录直接忽略
+                    break
+                timestamp, offset, length, sha1, verdict = INDEX_RECORD.unpack(record)
+                self.entries.append(FramePackEntry(len(self.entries), timestamp, offset, length, sha1, verdict))
+
+    def _truncate_torn_tail(self):
+        """截掉写入中断留下的不完整记录和帧数据，之后追加的记录与索引号对齐"""
+        pack_size = os.path.getsize(self.pack_path) if os.path.exists(self.pack_path) else 0
+        # 帧数据先于索引写入，索引指向文件之外的记录同样是中断留下的
+        while self.entries and self.entries[-1].offset + self.entries[-1].length > pack_size:
+            self.entries.pop()
+        data_end = max((e.offset + e.length for e in self.entries), default=0)
+        index_end = INDEX_HEADER.size + len(self.entries) * INDEX_RECORD.size
+        if os.path.getsize(self.index_path) != index_end:
+            os.truncate(self.index_path, index_end)
+        if os.path.exists(self.pack_path) and pack_size != data_end:
+            os.truncate(self.pack_path, data_end)
+
+    def append(self, timestamp, data):
+        """追加一帧，返回该帧的索引号"""
+        sha1 = hashlib.sha1(data).digest()
+        with self._lock:
+            offset = self._pack_size
+            self._pack_file.write(data)
+            self._pack_file.flush()
+            self._pack_size += len(data)
+
+            entry = FramePackEntry(len(self.entries), timestamp, offset, len(data), sha1, VERDICT_UNKNOWN)
+            self._index_file.seek(0, os.SEEK_END)
+            self._index_file.write(INDEX_RECORD.pack(timestamp, offset, len(data), sha1, VERDICT_UNKNOWN))
+            self._index_file.flush()
+            self.entries.append(entry)
+            return entry.index
+
+    def set_verdict(self, index, is_safe):
+        """在索引中原地更新判定结果"""
+        verdict = VERDICT_SAFE if is_safe else VERDICT_RISK
+        with self._lock:
+            entry = self.entries[index]
+            entry.verdict = verdict
+            self._index_file.seek(INDEX_HEADER.size + index * INDEX_RECORD.size + VERDICT_OFFSET)
+            self._index_file.write(bytes([verdict]))
+            self._index_file.flush()
+
+    def read(self, index):
+        """返回帧内容的 memoryview（直接引用 mmap，不复制）"""
+        with self._lock:
+            entry = self.entries[index]
+            end = entry.offset + entry.length
+            if end > self._mapped_size:
+                # 文件增长后重新映射；旧映射在没有引用后由垃圾回收释放
+                self._mmap = mmap.mmap(self._pack_file.fileno(), self._pack_size, access=mmap.ACCESS_READ)
+                self._mapped_size = self._pack_size
+            return memoryview(self._mmap)[entry.offset:end]
+
+    def frame_name(self, index):
+        """帧对应的时间码文件名"""
+        from video_pipeline import format_timestamp
+        return f'{format_timestamp(self.entries[index].timestamp)}{self.extension}'
+
+    def close(self):
+        with self._lock:
+            if self._mmap is not None:
+                try:
+                    self._mmap.close()
+                except BufferError:
+                    pass  # 仍有 memoryview 在使用，交给垃圾回收
+                self._mmap = None
+                self._mapped_size = 0
+            self._pack_file.close()
+            if self._index_file:
+                self._index_file.close()
+
+
+def main():
+    if len(sys.argv) < 3 or sys.argv[1] not in ('list', 'extract'):
+        print(__doc__)
+        sys.exit(1)
+
+    pack = FramePack(sys.argv[2], writable=False)
+    try:
+        verdict_names = {VERDICT_UNKNOWN: '未分析', VERDICT_SAFE: '安全', VERDICT_RISK: '风险'}
+        if sys.argv[1] == 'list':
+            for entry in pack.entries:
+                print(f"{pack.frame_name(entry.index)}\t{entry.length}\t{entry.sha1.hex()}\t{verdict_names[entry.verdict]}")
+        else:
+            output_dir = sys.argv[3] if len(sys.argv) > 3 else sys.argv[2]
+            os.makedirs(output_dir, exist_ok=True)
+            for entry in pack.entries:
+                with open(os.path.join(output_dir, pack.frame_name(entry.index)), 'wb') as f:
+                    f.write(pack.read(entry.index))
+            print(f"已导出 {len(pack.entries)} 个关键帧到 {output_dir}")
+    finally:
+        pack.close()
+
+
+if __name__ == '__main__':
+    main()
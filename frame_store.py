@@ -0,0 +1,209 @@
+import os
+import threading
+from collections import OrderedDict
+
+
+class _Entry:
+    __slots__ = ('data', 'size', 'offset', 'refs', 'persisted_path', 'timestamp')
+
+    def __init__(self, data, timestamp=None):
+        self.data = data
+        self.timestamp = timestamp
+        self.size = len(data)
+        self.offset = None  # 溢出到磁盘后在溢出文件中的偏移
+        self.refs = 1
+        self.persisted_path = None
+
+
+class FrameStore:
+    """关键帧内存存储
+
+    ffmpeg 输出的帧字节保存在内存中，由预览、AI分析和报告导出共享，
+    只有进入报告或用户选择保留的帧才写入磁盘。
+
+    - 引用计数：put() 时持有一个引用，各使用方 acquire()/release()，
+      计数归零后释放内存
+    - 内存上限：超过 memory_limit 时，把最早的帧溢出到临时文件
+    - 关联 FramePack 后，写入磁盘的帧追加到单文件容器而不是独立的图片文件
+    - 每次处理使用单独的实例；仍有读取方（如风险报告窗口）时 close() 推迟到最后一个读取方关闭
+    """
+
+    def __init__(self, memory_limit=256 * 1024 * 1024, spill_dir=None, pack=None):
+        self.memory_limit = memory_limit
+        self.spill_dir = spill_dir
+        self.pack = pack
+        self._pack_keys = {}  # 帧键 -> 容器中的索引号
+        self.memory_used = 0
+        self.spilled_bytes = 0
+        self._entries = OrderedDict()
+        self._lock = threading.RLock()
+        self._spill_file = None
+        self._spill_path = None
+        self._readers = 0
+        self._close_pending = False
+
+    def attach_pack(self, pack):
+        """关联单文件容器，之后 persist() 写入容器"""
+        self.pack = pack
+
+    def put(self, key, data, timestamp=None):
+        """保存一帧，调用方持有一个引用；timestamp 为帧的时间（秒），写入容器索引"""
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None and old.data is not None:
+                self.memory_used -= old.size
+            entry = _Entry(bytes(data), timestamp)
+            self._entries[key] = entry
+            self.memory_used += entry.size
+            self._enforce_limit()
+        return key
+
+    def acquire(self, key):
+        """增加引用，帧不存在时返回 False"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return False
+            entry.refs += 1
+            return True
+
+    def release(self, key):
+        """减少引用，计数归零后释放该帧"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return
+            entry.refs -= 1
+            if entry.refs <= 0:
+                del self._entries[key]
+                if entry.data is not None:
+                    self.memory_used -= entry.size
+
+    def get(self, key):
+        """返回帧内容的只读 memoryview
+
+        已释放但写入过磁盘的帧从文件读取；找不到时抛出 KeyError。
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry.data is not None:
+                    return memoryview(entry.data)
+                self._spill_file.seek(entry.offset)
+                return memoryview(self._spill_file.read(entry.size))
+            pack_index = self._pack_keys.get(key)
+        if pack_index is not None:
+            return self.pack.read(pack_index)
+        if os.path.exists(key):
+            with open(key, 'rb') as f:
+                return memoryview(f.read())
+        raise KeyError(key)
+
+    def timestamp(self, key):
+        """帧的时间（秒），帧已释放或未记录时返回 None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            return entry.timestamp if entry is not None else None
+
+    def get_bytes(self, key):
+        return self.get(key).tobytes()
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._entries
+
+    def persist(self, key, path=None):
+        """把帧写入磁盘（默认写到 key 对应的路径或关联的容器），返回文件路径"""
+        if self.pack is not None and path is None:
+            with self._lock:
+                if key not in self._pack_keys:
+                    entry = self._entries.get(key)
+                    timestamp = entry.timestamp if entry and entry.timestamp is not None else 0.0
+                    self._pack_keys[key] = self.pack.append(timestamp, self.get(key))
+                    if entry is not None:
+                        entry.persisted_path = self.pack.pack_path
+            return self.pack.pack_path
+        path = path or key
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.persisted_path == path:
+                return path
+            data = self.get(key)
+        if not os.path.exists(path):
+            tmp_path = path + '.part'
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        with self._lock:
+            if entry is not None:
+                entry.persisted_path = path
+        return path
+
+    def is_persisted(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            return bool(key in self._pack_keys or (entry and entry.persisted_path))
+
+    def set_verdict(self, key, is_safe):
+        """把判定结果写入容器索引（帧在容器中时）"""
+        with self._lock:
+            pack_index = self._pack_keys.get(key)
+        if pack_index is not None:
+            self.pack.set_verdict(pack_index, is_safe)
+
+    def _enforce_limit(self):
+        """超过内存上限时，把最早的帧溢出到临时文件（调用方持有锁）"""
+        if self.memory_used <= self.memory_limit:
+            return
+        for entry in self._entries.values():
+            if self.memory_used <= self.memory_limit:
+                break
+            if entry.data is None:
+                continue
+            spill_file = self._open_spill_file()
+            spill_file.seek(0, os.SEEK_END)
+            entry.offset = spill_file.tell()
+            spill_file.write(entry.data)
+            entry.data = None
+            self.memory_used -= entry.size
+            self.spilled_bytes += entry.size
+
+    def _open_spill_file(self):
+        if self._spill_file is None:
+            import tempfile
+            fd, self._spill_path = tempfile.mkstemp(prefix='.frame_spool_', suffix='.tmp', dir=self.spill_dir)
+            self._spill_file = os.fdopen(fd, 'w+b')
+        return self._spill_file
+
+    def open_reader(self):
+        """登记一个读取方，之后的 close() 推迟到 close_reader() 全部调用后执行"""
+        with self._lock:
+            self._readers += 1
+
+    def close_reader(self):
+        with self._lock:
+            self._readers -= 1
+            if self._readers > 0 or not self._close_pending:
+                return
+        self.close()
+
+    def close(self):
+        """释放所有帧并删除溢出文件"""
+        with self._lock:
+            if self._readers > 0:
+                self._close_pending = True
+                return
+            self._close_pending = False
+            self._entries.clear()
+            self._pack_keys.clear()
+            self.memory_used = 0
+            if self.pack is not None:
+                self.pack.close()
+                self.pack = None
+            if self._spill_file is not None:
+                self._spill_file.close()
+                self._spill_file = None
+                try:
+                    os.remove(self._spill_path)
+                except OSError:
+                    pass
@@ -0,0 +1,233 @@
+"""关键帧的CPU密集型处理（进程池）
+
+缩略图缩放、base64 编码、哈希和画面质量检查都是纯 Python / PIL 计算，
+放在线程中执行会受 GIL 限制而串行化。这里用进程池并行处理，
+图片字节通过共享内存传递给子进程，避免序列化复制整张图片。
+"""
+import os
+import time
+import base64
+import hashlib
+from io import BytesIO
+from multiprocessing import shared_memory
+from concurrent.futures import Future, ProcessPoolExecutor
+
+from PIL import Image, ImageFilter, ImageStat
+
+from thumbnail_cache import read_cached_thumbnail, write_cached_thumbnail
+
+
+def _attach(name):
+    """子进程附加到父进程创建的共享内存，不参与其生命周期管理"""
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        # Python 3.13 以前没有 track 参数；进程池子进程与父进程共用资源跟踪器，
+        # 重复登记同一名称不会导致提前删除
+        return shared_memory.SharedMemory(name=name)
+
+
+def _thumbnail(data, max_width, cache_dir=None, digest=None):
+    """按宽度等比缩放，返回 (宽, 高, JPEG编码的缩略图字节)
+
+    缩略图以压缩形式保存，预览界面需要显示时再解码。
+    指定 cache_dir 时按内容哈希读写磁盘缓存。
+    """
+    if cache_dir and digest:
+        cached = read_cached_thumbnail(cache_dir, digest, max_width)
+        if cached:
+            # 只读取 JPEG 头获取尺寸，不解码像素
+            width, height = Image.open(BytesIO(cached)).size
+            return width, height, cached
+
+    img = Image.open(BytesIO(data))
+    width, height = img.size
+    if width <= max_width:
+        # 与 Image.thumbnail 一致，不放大比目标宽度小的图片
+        new_size = (width, height)
+        img = img.convert('RGB')
+    else:
+        ratio = max_width / width
+        new_size = (max(int(width * ratio), 1), max(int(height * ratio), 1))
+        # JPEG 按 DCT 缩放解码（1/2、1/4、1/8），4K 帧只需解码很小的一部分像素；
+        # 解码后的尺寸已接近目标尺寸，用双线性缩放即可
+        img.draft('RGB', new_size)
+        img = img.convert('RGB').resize(new_size, Image.Resampling.BILINEAR, reducing_gap=2.0)
+    buffer = BytesIO()
+    img.save(buffer, 'JPEG', quality=85)
+    thumbnail = buffer.getvalue()
+    if cache_dir and digest:
+        write_cached_thumbnail(cache_dir, digest, max_width, thumbnail)
+    return new_size[0], new_size[1], thumbnail
+
+
+def encode_low_res(data, width):
+    """缩小到指定宽度后重新编码并做 base64，用于低分辨率的初次分析
+
+    图片本身不超过该宽度时返回 None（直接用原图分析）。
+    """
+    if Image.open(BytesIO(data)).size[0] <= width:
+        return None
+    _, _, jpeg = _thumbnail(data, width)
+    return base64.b64encode(jpeg).decode('ascii')
+
+
+def _quality(data):
+    """画面质量指标：亮度均值、对比度和清晰度（边缘强度）"""
+    img = Image.open(BytesIO(data)).convert('L')
+    img.thumbnail((320, 320))
+    stat = ImageStat.Stat(img)
+    edges = ImageStat.Stat(img.filter(ImageFilter.FIND_EDGES))
+    return {
+        'brightness': round(stat.mean[0], 2),
+        'contrast': round(stat.stddev[0], 2),
+        'sharpness': round(edges.mean[0], 2),
+    }
+
+
+def _process_frame_bytes(data, ops, max_width, thumbnail_cache_dir=None, low_res_width=None):
+    """在当前进程中处理图片，data 可以是 bytes 或 memoryview"""
+    result = {}
+    digest = None
+    if 'sha1' in ops or ('thumbnail' in ops and thumbnail_cache_dir):
+        digest = hashlib.sha1(data).hexdigest()
+    if 'sha1' in ops:
+        result['sha1'] = digest
+    if 'base64' in ops:
+        result['base64'] = base64.b64encode(data)
+    # PIL 直接从传入的缓冲区解码，不额外复制
+    if 'thumbnail' in ops:
+        started = time.perf_counter()
+        result['thumbnail'] = _thumbnail(data, max_width, thumbnail_cache_dir, digest)
+        result['thumbnail_seconds'] = time.perf_counter() - started
+    if 'quality' in ops:
+        result['quality'] = _quality(data)
+    if 'low_res' in ops:
+        result['low_res'] = encode_low_res(data, low_res_width)
+    return result
+
+
+def _process_frame(in_name, size, ops, max_width, out_name=None, thumbnail_cache_dir=None,
+                   low_res_width=None):
+    """子进程入口：从共享内存读取图片并执行 ops 中的处理"""
+    shm = _attach(in_name)
+    out_shm = _attach(out_name) if out_name else None
+    try:
+        # memoryview 必须在 close() 之前释放
+        with shm.buf[:size] as data:
+            result = _process_frame_bytes(data, ops, max_width, thumbnail_cache_dir, low_res_width)
+        if 'base64' in result:
+            # 编码结果直接写入输出共享内存，只回传长度
+            encoded = result.pop('base64')
+            out_shm.buf[:len(encoded)] = encoded
+            result['base64_size'] = len(encoded)
+        return result
+    finally:
+        shm.close()
+        if out_shm:
+            out_shm.close()
+
+
+class FrameProcessPool:
+    """关键帧处理进程池
+
+    支持的处理项（ops）：
+        thumbnail  生成预览缩略图，结果为 (宽, 高, JPEG字节)，耗时记录在 thumbnail_seconds
+        sha1       图片内容哈希
+        base64     base64 编码（用于AI接口上传），结果为 str
+        quality    画面质量指标
+        low_res    缩小到 low_res_width 宽的 base64 图片（用于低分辨率初次分析），原图不超过该宽度时为 None
+
+    指定 thumbnail_cache_dir 时，缩略图按内容哈希缓存到该目录。
+    """
+
+    def __init__(self, max_workers=None, thumbnail_cache_dir=None):
+        self.max_workers = max_workers or max(1, (os.cpu_count() or 2) - 1)
+        self.thumbnail_cache_dir = thumbnail_cache_dir
+        self._executor = None
+
+    @property
+    def executor(self):
+        # 延迟创建进程池，避免程序启动时就拉起子进程
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+        return self._executor
+
+    def submit_bytes(self, data, ops=('thumbnail', 'sha1'), max_width=160, low_res_width=512):
+        """提交内存中的图片字节，返回 Future，结果为 dict"""
+        shm = shared_memory.SharedMemory(create=True, size=max(len(data), 1))
+        shm.buf[:len(data)] = data
+        return self._submit(shm, len(data), ops, max_width, low_res_width)
+
+    def submit_file(self, image_path, ops=('thumbnail', 'sha1'), max_width=160, low_res_width=512):
+        """提交图片文件，文件内容直接读入共享内存"""
+        size = os.path.getsize(image_path)
+        shm = shared_memory.SharedMemory(create=True, size=max(size, 1))
+        try:
+            with open(image_path, 'rb') as f, shm.buf[:size] as view:
+                f.readinto(view)
+        except Exception:
+            shm.close()
+            shm.unlink()
+            raise
+        return self._submit(shm, size, ops, max_width, low_res_width)
+
+    def encode_base64(self, image_path):
+        """在子进程中对图片文件做 base64 编码，返回 str"""
+        return self.submit_file(image_path, ops=('base64',)).result()['base64']
+
+    def _submit(self, shm, size, ops, max_width, low_res_width=512):
+        out_shm = None
+        if 'base64' in ops:
+            out_shm = shared_memory.SharedMemory(create=True, size=max(4 * ((size + 2) // 3), 1))
+        try:
+            future = self.executor.submit(
+                _process_frame, shm.name, size, tuple(ops), max_width,
+                out_shm.name if out_shm else None,
+                self.thumbnail_cache_dir,
+                low_res_width
+            )
+        except Exception:
+            self._release(shm, out_shm)
+            raise
+
+        result_future = Future()
+
+        def on_done(f):
+            # 取出 base64 结果后释放共享内存，再交付结果
+            try:
+                if f.cancelled():
+                    result_future.cancel()
+                elif f.exception() is not None:
+                    result_future.set_exception(f.exception())
+                else:
+                    result = f.result()
+                    if out_shm is not None:
+                        size = result.pop('base64_size')
+                        result['base64'] = bytes(out_shm.buf[:size]).decode('ascii')
+                    result_future.set_result(result)
+            except Exception as e:
+                if not result_future.done():
+                    result_future.set_exception(e)
+            finally:
+                self._release(shm, out_shm)
+
+        future.add_done_callback(on_done)
+        return result_future
+
+    @staticmethod
+    def _release(*segments):
+        for shm in segments:
+            if shm is None:
+                continue
+            try:
+                shm.close()
+                shm.unlink()
+            except FileNotFoundError:
+                pass
+
+    def shutdown(self, wait=False):
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait, cancel_futures=True)
+            self._executor = None
+
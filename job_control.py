@@ -0,0 +1,80 @@
+import threading
+import uuid
+
+
+class JobCancelled(Exception):
+    """任务已被取消"""
+    pass
+
+
+class JobControl:
+    """视频处理任务的控制句柄
+
+    由处理线程、分析线程和界面共享，用于取消或暂停一次视频处理：
+    - 取消：终止 ffmpeg 进程，丢弃尚未发出的分析任务
+    - 暂停：暂停分析任务的派发，已解码的关键帧继续保留
+    """
+
+    def __init__(self, job_id=None):
+        self.job_id = job_id or uuid.uuid4().hex[:12]
+        self._lock = threading.Lock()
+        self._cancel_event = threading.Event()
+        self._resume_event = threading.Event()
+        self._resume_event.set()  # 初始为运行状态
+        self._processes = []
+
+    @property
+    def cancelled(self):
+        return self._cancel_event.is_set()
+
+    @property
+    def paused(self):
+        return not self._resume_event.is_set()
+
+    def attach_process(self, process):
+        """登记任务启动的子进程，取消时一并终止"""
+        with self._lock:
+            self._processes.append(process)
+            already_cancelled = self.cancelled
+        if already_cancelled:
+            self._terminate(process)
+
+    def detach_process(self, process):
+        """子进程正常结束后取消登记"""
+        with self._lock:
+            if process in self._processes:
+                self._processes.remove(process)
+
+    def cancel(self):
+        """取消任务并终止所有登记的子进程"""
+        with self._lock:
+            self._cancel_event.set()
+            self._resume_event.set()  # 唤醒所有等待暂停结束的线程
+            processes = list(self._processes)
+        for process in processes:
+            self._terminate(process)
+
+    def pause(self):
+        if not self.cancelled:
+            self._resume_event.clear()
+
+    def resume(self):
+        self._resume_event.set()
+
+    def wait_if_paused(self, timeout=None):
+        """暂停时阻塞等待，返回 False 表示任务已取消"""
+        self._resume_event.wait(timeout)
+        return not self.cancelled
+
+    def check(self):
+        """任务已取消时抛出 JobCancelled"""
+        if self.cancelled:
+            raise JobCancelled(f"任务 {self.job_id} 已取消")
+
+    @staticmethod
+    def _terminate(process):
+        try:
+            if process.poll() is None:
+                process.terminate()
+        except Exception as e:
+            print(f"Error terminating process: {e}")
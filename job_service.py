@@ -0,0 +1,614 @@
+"""本地HTTP任务服务
+
+无界面地提交视频、查询状态，并通过 SSE (server-sent events) 实时接收
+关键帧提取与AI判定事件。所有客户端共享同一个分析线程池和分析缓存。
+
+接口：
+    POST /jobs                  提交任务 {"video_path": ..., "sensitivity": 0.2, "output_dir": ...}
+    GET  /jobs                  任务列表
+    GET  /jobs/<id>             任务状态与结果
+    GET  /jobs/<id>/events      SSE 事件流（支持 Last-Event-ID 续传）
+    POST /jobs/<id>/cancel      取消任务
+    POST /jobs/<id>/pause       暂停分析派发
+    POST /jobs/<id>/resume      继续分析派发
+
+用法：
+    python job_service.py --port 8765
+"""
+import os
+import json
+import time
+import base64
+import argparse
+import ipaddress
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+
+from job_control import JobControl
+from video_pipeline import (find_ffmpeg, make_frames_dir, stream_keyframes, format_timestamp, frame_extension,
+                            frame_time_str, probe_duration)
+from frame_store import FrameStore
+from report_exporter import StreamingReportWriter
+from metrics import MetricsRegistry, describe_pipeline_metrics, sample_derived_metrics
+from results_store import RunRecorder, ResultsDatabase, RESULTS_DB_NAME
+from analysis_cache import AnalysisCache, hash_bytes
+from frame_workers import encode_low_res
+from cost_tracker import BudgetExceededError, day_start, format_estimate
+
+
+TERMINAL_STATES = ('completed', 'failed', 'cancelled')
+
+
+class ServiceJob:
+    """服务中的一次视频处理任务"""
+
+    def __init__(self, video_path, sensitivity, output_dir=None):
+        self.control = JobControl()
+        self.id = self.control.job_id
+        self.video_path = video_path
+        self.sensitivity = sensitivity
+        self.output_dir = output_dir
+        self.state = 'queued'
+        self.error = None
+        self.frames_dir = None
+        self.frame_store = None  # 帧数据保存在内存中，只有风险帧（或 keep_all_frames 时全部帧）写入磁盘
+        self.keep_frames = False
+        self.frames = []
+        self.results = {}
+        self.report_path = None
+        self.report_writer = None
+        self.recorder = None
+        self.spend = None  # 本次处理的 token 用量与预算（SpendTracker）
+        self.estimate = None  # 处理前预估的关键帧数、token 数和费用
+        self.metrics = MetricsRegistry()
+        describe_pipeline_metrics(self.metrics)
+        self.created_at = time.time()
+        self.finished_at = None
+        self.extraction_done = False
+        self.pending = 0
+        self.paused_frames = []  # 暂停期间等待分析的帧，继续时重新提交
+        self.lock = threading.Lock()
+        self._events = []
+        self._events_cond = threading.Condition()
+
+    def emit(self, event_type, data):
+        """追加一个事件并唤醒所有订阅者"""
+        with self._events_cond:
+            self._events.append((len(self._events) + 1, event_type, data))
+            self._events_cond.notify_all()
+
+    def events_after(self, last_id, timeout=None):
+        """返回编号大于 last_id 的事件，没有新事件时最多等待 timeout 秒"""
+        with self._events_cond:
+            if len(self._events) <= last_id and self.state not in TERMINAL_STATES:
+                self._events_cond.wait(timeout)
+            return self._events[last_id:]
+
+    def to_dict(self, include_results=False):
+        # 分析线程会同时写入结果，先在锁内取快照
+        with self.lock:
+            results = dict(self.results)
+            frame_count = len(self.frames)
+        data = {
+            'id': self.id,
+            'video_path': self.video_path,
+            'sensitivity': self.sensitivity,
+            'state': self.state,
+            'paused': self.control.paused,
+            'error': self.error,
+            'frames_dir': self.frames_dir,
+            'frame_count': frame_count,
+            'analyzed_count': len(results),
+            'risk_count': sum(1 for r in results.values() if not r.get('is_safe', True)),
+            'pending_analysis': self.pending,
+            'report_path': self.report_path,
+            'estimate': self.estimate,
+            'usage': self.spend.to_dict() if self.spend else None,
+            'created_at': self.created_at,
+            'finished_at': self.finished_at,
+        }
+        if include_results:
+            data['results'] = [
+                dict(result, frame=os.path.basename(path))
+                for path, result in results.items()
+            ]
+        return data
+
+
+class JobService:
+    """任务调度：提取线程池 + 共享的AI分析线程池与缓存"""
+
+    def __init__(self, ai_manager=None, max_jobs=2, analysis_workers=2, ffmpeg_path=None, results_db=None,
+                 low_res_width=512, keep_all_frames=False, frame_memory_limit=256 * 1024 * 1024):
+        self.ai_manager = ai_manager
+        self.ffmpeg_path = ffmpeg_path
+        self.results_db = results_db
+        self.jobs = {}
+        self.jobs_lock = threading.Lock()
+        self.cache = AnalysisCache()
+        self.extract_pool = ThreadPoolExecutor(max_workers=max_jobs, thread_name_prefix='extract')
+        self.analysis_workers = analysis_workers
+        self.low_res_width = low_res_width  # 低分辨率初次分析的图片宽度，0 为直接用原图分析
+        self.keep_all_frames = keep_all_frames
+        self.frame_memory_limit = frame_memory_limit  # 每个任务的帧内存上限，超过后溢出到临时文件
+        self.analysis_pool = ThreadPoolExecutor(max_workers=analysis_workers, thread_name_prefix='analyze')
+
+    def ai_enabled(self):
+        return bool(self.ai_manager and self.ai_manager.current_analyzer
+                    and self.ai_manager.current_analyzer.is_configured())
+
+    def submit(self, video_path, sensitivity=0.2, output_dir=None):
+        if not os.path.isfile(video_path):
+            raise ValueError(f"视频文件不存在: {video_path}")
+        job = ServiceJob(video_path, float(sensitivity), output_dir)
+        with self.jobs_lock:
+            self.jobs[job.id] = job
+        job.emit('queued', job.to_dict())
+        self.extract_pool.submit(self._run_job, job)
+        return job
+
+    def get(self, job_id):
+        with self.jobs_lock:
+            return self.jobs.get(job_id)
+
+    def list_jobs(self):
+        with self.jobs_lock:
+            return list(self.jobs.values())
+
+    def cancel(self, job_id):
+        job = self.get(job_id)
+        if job and job.state not in TERMINAL_STATES:
+            job.control.cancel()
+            self._finish(job, 'cancelled')
+        return job
+
+    def pause(self, job_id):
+        """暂停任务的分析派发，已提交的帧回到该任务的等待队列，不占用共享的分析线程"""
+        job = self.get(job_id)
+        if job:
+            with job.lock:
+                job.control.pause()
+        return job
+
+    def resume(self, job_id):
+        """继续分析派发，重新提交暂停期间等待的帧"""
+        job = self.get(job_id)
+        if job:
+            with job.lock:
+                job.control.resume()
+                frames, job.paused_frames = job.paused_frames, []
+            for frame_path in frames:
+                self.analysis_pool.submit(self._analyze_frame, job, frame_path)
+        return job
+
+    def shutdown(self):
+        for job in self.list_jobs():
+            job.control.cancel()
+        self.extract_pool.shutdown(wait=False, cancel_futures=True)
+        self.analysis_pool.shutdown(wait=False, cancel_futures=True)
+
+    def _run_job(self, job):
+        if job.control.cancelled:
+            return
+        try:
+            job.state = 'extracting'
+            job.frames_dir = make_frames_dir(job.video_path, job.output_dir)
+            job.frame_store = FrameStore(memory_limit=self.frame_memory_limit)
+            # 未启用AI分析时关键帧就是最终产物，始终写入磁盘
+            job.keep_frames = self.keep_all_frames or not self.ai_enabled()
+            job.report_writer = StreamingReportWriter(job.frames_dir, read_frame=job.frame_store.get)
+            duration = probe_duration(job.video_path, self.ffmpeg_path)
+            job.recorder = RunRecorder(job.frames_dir, job.video_path, job.sensitivity, database=self.results_db,
+                                       duration=duration)
+            if self.ai_enabled():
+                job.spend = self.ai_manager.new_run_spend()
+                job.estimate = self._estimate(job, duration)
+            job.emit('started', {'frames_dir': job.frames_dir, 'estimate': job.estimate})
+            if self.ai_enabled():
+                # ffmpeg 解码第一个关键帧期间提前建立到AI接口的连接
+                threading.Thread(target=self.ai_manager.prewarm, args=(self.analysis_workers,), daemon=True).start()
+
+            # 帧数据通过管道直接读入内存
+            stream_keyframes(
+                job.video_path,
+                job.sensitivity,
+                job=job.control,
+                on_frame=lambda timestamp, data: self._on_frame(job, timestamp, data),
+                ffmpeg_path=self.ffmpeg_path,
+                metrics=job.metrics
+            )
+            if job.control.cancelled:
+                return
+
+            with job.lock:
+                job.extraction_done = True
+                if job.pending:
+                    job.state = 'analyzing'
+            job.emit('extracted', {'frame_count': len(job.frames)})
+            self._maybe_complete(job)
+        except Exception as e:
+            if not job.control.cancelled:
+                job.error = str(e)
+                self._finish(job, 'failed')
+
+    def _estimate(self, job, duration):
+        """按结果库中的历史记录预估本次处理的关键帧数和用量"""
+        if self.results_db is None:
+            return None
+        try:
+            history = self.results_db.usage_history(job.sensitivity)
+        except Exception as e:
+            print(f"Error reading usage history: {e}")
+            return None
+        estimate = self.ai_manager.estimate_run(duration, history)
+        if estimate['frames'] is not None:
+            print(f"{os.path.basename(job.video_path)}: {format_estimate(estimate)}")
+        return estimate
+
+    def _on_frame(self, job, timestamp, data):
+        # 以时间码文件名作为帧的键，帧写入磁盘时也使用这个路径
+        frame_name = format_timestamp(timestamp) + frame_extension('jpeg')
+        frame_path = os.path.join(job.frames_dir, frame_name)
+        job.frame_store.put(frame_path, data, timestamp)
+        if job.keep_frames:
+            with job.metrics.time('frame_persist_seconds'):
+                job.frame_store.persist(frame_path)
+        with job.lock:
+            job.frames.append(frame_path)
+        job.recorder.add_frame(frame_path, timestamp=timestamp)
+        job.emit('frame', {
+            'index': len(job.frames),
+            'frame': os.path.basename(frame_path),
+            'path': frame_path,
+            'time': frame_time_str(frame_path),
+        })
+        if self.ai_enabled():
+            with job.lock:
+                job.pending += 1
+                if job.control.paused:
+                    job.paused_frames.append(frame_path)
+                    return
+            self.analysis_pool.submit(self._analyze_frame, job, frame_path)
+        else:
+            job.recorder.set_result(frame_path, status='not_analyzed')
+            job.frame_store.release(frame_path)
+
+    def _analyze_frame(self, job, frame_path):
+        requeued = False
+        try:
+            # 任务取消后丢弃排队中的分析；排队期间被暂停的帧放回该任务的等待队列，不阻塞共享的分析线程
+            if job.control.cancelled:
+                return
+            with job.lock:
+                if job.control.paused:
+                    job.paused_frames.append(frame_path)
+                    requeued = True
+                    return
+            started = time.time()
+            data = job.frame_store.get(frame_path)
+            key = hash_bytes(data)
+            result = self.cache.get(key)
+            cached = result is not None
+            job.metrics.inc('analysis_cache_hits_total' if cached else 'analysis_cache_misses_total')
+            if not cached:
+                # 先分析低分辨率图片，需要时再用原图重新分析
+                low_res_base64 = encode_low_res(data, self.low_res_width) if self.low_res_width else None
+                result = self.ai_manager.analyze_verdict(
+                    frame_path, image_base64=base64.b64encode(data).decode('ascii'),
+                    low_res_base64=low_res_base64, spend=job.spend)
+                self.cache.put(key, result)
+            if job.control.cancelled:
+                return
+            with job.lock:
+                job.results[frame_path] = result
+            job.recorder.set_result(frame_path, result, elapsed=time.time() - started, cached=cached)
+            # 风险帧写入磁盘并立即追加到报告
+            if not result['is_safe']:
+                job.frame_store.persist(frame_path)
+            job.frame_store.set_verdict(frame_path, result['is_safe'])
+            if job.report_writer.add(frame_path, result):
+                job.report_path = job.report_writer.report_path
+            job.emit('verdict', {
+                'frame': os.path.basename(frame_path),
+                'is_safe': result['is_safe'],
+                'risk_type': result['risk_type'],
+                'description': result['description'],
+                'confidence': result.get('confidence'),
+                'tokens': 0 if cached else (result.get('prompt_tokens') or 0) + (result.get('completion_tokens') or 0),
+                'cost': 0 if cached else result.get('cost'),
+                'cached': cached,
+                'elapsed': round(time.time() - started, 3),
+            })
+        except Exception as e:
+            if job.control.cancelled:
+                return
+            print(f"Error in analysis for {frame_path}: {e}")
+            job.emit('verdict_error', {'frame': os.path.basename(frame_path), 'error': str(e)})
+            job.recorder.set_result(frame_path, error=e)
+            if "账户已欠费" in str(e) or "认证失败" in str(e) or isinstance(e, BudgetExceededError):
+                # 所有密钥都欠费或认证失败、达到费用预算时后续请求都会失败，直接结束任务
+                job.error = str(e)
+                job.control.cancel()
+                self._finish(job, 'failed')
+                return
+        finally:
+            if not requeued:
+                job.frame_store.release(frame_path)
+                with job.lock:
+                    job.pending -= 1
+        self._maybe_complete(job)
+
+    def _maybe_complete(self, job):
+        with job.lock:
+            if not job.extraction_done or job.pending > 0 or job.state in TERMINAL_STATES:
+                return
+            job.state = 'exporting'
+        try:
+            # 报告已在分析过程中逐条写入，这里只取最终路径
+            if job.report_writer:
+                job.report_path = job.report_writer.finish()
+            self._finish(job, 'completed')
+        except Exception as e:
+            job.error = f"导出报告失败：{e}"
+            self._finish(job, 'failed')
+
+    def _finish(self, job, state):
+        with job.lock:
+            if job.state in TERMINAL_STATES:
+                return
+            job.state = state
+            job.finished_at = time.time()
+        if job.frame_store:
+            job.frame_store.close()
+        if job.recorder:
+            try:
+                job.recorder.finish(state, usage=job.spend.to_dict() if job.spend else None)
+                sample_derived_metrics(job.metrics)
+                job.metrics.export(job.frames_dir)
+            except Exception as e:
+                print(f"Error exporting results for job {job.id}: {e}")
+        job.emit(state, job.to_dict())
+
+
+class JobRequestHandler(BaseHTTPRequestHandler):
+    """任务服务的HTTP接口"""
+
+    server_version = "VideoSecurityCheck/1.0"
+    # SSE 保活间隔（秒）
+    keepalive_interval = 15
+
+    @property
+    def service(self):
+        return self.server.service
+
+    def log_message(self, format, *args):
+        print(f"[job_service] {self.address_string()} {format % args}")
+
+    def _send_json(self, status, data):
+        body = json.dumps(data, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_json(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        if not length:
+            return {}
+        return json.loads(self.rfile.read(length).decode('utf-8'))
+
+    def _route(self):
+        parts = [p for p in urlparse(self.path).path.split('/') if p]
+        if not parts or parts[0] != 'jobs':
+            return None, None, parts
+        job_id = parts[1] if len(parts) > 1 else None
+        action = parts[2] if len(parts) > 2 else None
+        return job_id, action, parts
+
+    def do_GET(self):
+        job_id, action, parts = self._route()
+        if not parts:
+            self._send_json(200, {'status': 'ok', 'ai_enabled': self.service.ai_enabled()})
+            return
+        if parts[0] != 'jobs':
+            self._send_json(404, {'error': 'not found'})
+            return
+        if job_id is None:
+            self._send_json(200, {'jobs': [job.to_dict() for job in self.service.list_jobs()]})
+            return
+        job = self.service.get(job_id)
+        if not job:
+            self._send_json(404, {'error': f'unknown job: {job_id}'})
+        elif action is None:
+            self._send_json(200, job.to_dict(include_results=True))
+        elif action == 'events':
+            self._stream_events(job)
+        else:
+            self._send_json(404, {'error': 'not found'})
+
+    def do_POST(self):
+        job_id, action, parts = self._route()
+        if not parts or parts[0] != 'jobs':
+            self._send_json(404, {'error': 'not found'})
+            return
+        try:
+            if job_id is None:
+                data = self._read_json()
+                if not data.get('video_path'):
+                    self._send_json(400, {'error': 'video_path is required'})
+                    return
+                job = self.service.submit(
+                    data['video_path'],
+                    data.get('sensitivity', 0.2),
+                    data.get('output_dir')
+                )
+                self._send_json(201, job.to_dict())
+                return
+
+            job = self.service.get(job_id)
+            if not job:
+                self._send_json(404, {'error': f'unknown job: {job_id}'})
+            elif action == 'cancel':
+                self._send_json(200, self.service.cancel(job_id).to_dict())
+            elif action == 'pause':
+                self._send_json(200, self.service.pause(job_id).to_dict())
+            elif action == 'resume':
+                self._send_json(200, self.service.resume(job_id).to_dict())
+            else:
+                self._send_json(404, {'error': 'not found'})
+        except (ValueError, json.JSONDecodeError) as e:
+            self._send_json(400, {'error': str(e)})
+
+    def _stream_events(self, job):
+        """以 SSE 格式推送任务事件，任务结束后关闭连接"""
+        try:
+            last_id = int(self.headers.get('Last-Event-ID') or 0)
+        except ValueError:
+            last_id = 0
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream; charset=utf-8')
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('Connection', 'close')
+        self.end_headers()
+        self.close_connection = True
+
+        try:
+            while True:
+                events = job.events_after(last_id, timeout=self.keepalive_interval)
+                if not events:
+                    if job.state in TERMINAL_STATES:
+                        break
+                    self.wfile.write(b': keepalive\n\n')
+                    self.wfile.flush()
+                    continue
+                for event_id, event_type, data in events:
+                    payload = json.dumps(data, ensure_ascii=False)
+                    self.wfile.write(f"id: {event_id}\nevent: {event_type}\ndata: {payload}\n\n".encode('utf-8'))
+                    last_id = event_id
+                self.wfile.flush()
+                if job.state in TERMINAL_STATES and len(job.events_after(last_id, timeout=0)) == 0:
+                    break
+        except (BrokenPipeError, ConnectionResetError):
+            # 客户端断开连接
+            pass
+
+
+def _ensure_loopback(host):
+    """服务只允许绑定本机地址"""
+    if host == 'localhost':
+        return
+    try:
+        if ipaddress.ip_address(host).is_loopback:
+            return
+    except ValueError:
+        pass
+    raise ValueError(f"任务服务只能绑定本机地址，拒绝绑定: {host}")
+
+
+def create_server(service, host='127.0.0.1', port=8765):
+    """创建HTTP服务器（port=0 时由系统分配端口）"""
+    _ensure_loopback(host)
+    server = ThreadingHTTPServer((host, port), JobRequestHandler)
+    server.daemon_threads = True
+    server.service = service
+    return server
+
+
+def create_ai_manager_from_config(config, results_db=None):
+    """按用户配置创建AI管理器，未启用AI时返回 None；results_db 用于读取今天已用的费用"""
+    from ai_analyzer import AIManager
+
+    if not config.get('enable_ai'):
+        return None
+    ai_manager = AIManager()
+    available = ai_manager.get_available_analyzers()
+    model_key = next((key for key, name in available if name == config.get('current_model')),
+                     available[0][0] if available else None)
+    if not model_key or (ai_manager.requires_api_key(model_key) and not config.get('api_key')):
+        return None
+    ai_manager.configure_analyzer(
+        model_key, config.get('api_key', ''),
+        base_url=config.get('api_base_url'),
+        model=config.get('api_model'),
+        http2=config.get('api_http2', False),
+        key_rpm=config.get('api_key_rpm', 0),
+        key_concurrency=config.get('api_key_concurrency', 0)
+    )
+    ai_manager.set_current_analyzer(model_key)
+    ai_manager.configure_circuit_breaker(
+        failure_threshold=config.get('circuit_failure_threshold', 5),
+        reset_timeout=config.get('circuit_reset_seconds', 5),
+        max_wait=config.get('circuit_max_wait', 300)
+    )
+    ai_manager.configure_reanalysis(
+        threshold=config.get('reanalysis_confidence', 0.7),
+        audit_rate=config.get('reanalysis_audit_rate', 0.05)
+    )
+    spent_today = None
+    if results_db is not None:
+        try:
+            spent_today = results_db.spend_since(day_start())
+        except Exception as e:
+            print(f"Error reading today's usage: {e}")
+    ai_manager.configure_budget(
+        prices=config.get('token_prices'),
+        run_cost=config.get('budget_run_yuan', 0),
+        run_tokens=config.get('budget_run_tokens', 0),
+        daily_cost=config.get('budget_daily_yuan', 0),
+        daily_tokens=config.get('budget_daily_tokens', 0),
+        throttle_ratio=config.get('budget_throttle_ratio', 0.8),
+        spent_today=spent_today
+    )
+    ai_manager.configure_providers(config.get('ai_providers'), hedge_max_ratio=config.get('hedge_max_ratio', 0.1))
+    return ai_manager
+
+
+def main():
+    parser = argparse.ArgumentParser(description="视频安全检查本地任务服务")
+    parser.add_argument('--host', default='127.0.0.1', help="绑定地址（仅限本机）")
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--max-jobs', type=int, default=2, help="同时处理的视频数")
+    parser.add_argument('--analysis-workers', type=int, default=None,
+                        help="共享的AI分析并发数（默认按密钥数量 × ai_concurrency_per_key）")
+    parser.add_argument('--no-ai', action='store_true', help="只提取关键帧，不进行AI分析")
+    args = parser.parse_args()
+
+    from config_manager import ConfigManager
+    config_manager = ConfigManager()
+    results_db = ResultsDatabase(os.path.join(config_manager.get_config_dir(), RESULTS_DB_NAME))
+    ai_manager = None
+    if not args.no_ai:
+        ai_manager = create_ai_manager_from_config(config_manager.config, results_db)
+
+    analysis_workers = args.analysis_workers
+    if analysis_workers is None:
+        per_key = config_manager.config.get('ai_concurrency_per_key', 2)
+        analysis_workers = max(2, per_key * ai_manager.key_count()) if ai_manager else 2
+
+    service = JobService(
+        ai_manager=ai_manager,
+        max_jobs=args.max_jobs,
+        analysis_workers=analysis_workers,
+        ffmpeg_path=find_ffmpeg(),
+        results_db=results_db,
+        low_res_width=config_manager.config.get('analysis_low_res_width', 512),
+        keep_all_frames=config_manager.config.get('keep_all_frames', False),
+        frame_memory_limit=config_manager.config.get('frame_memory_limit_mb', 256) * 1024 * 1024
+    )
+    server = create_server(service, args.host, args.port)
+    print(f"任务服务已启动: http://{args.host}:{server.server_address[1]} (AI分析: {'开启' if service.ai_enabled() else '关闭'})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        service.shutdown()
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
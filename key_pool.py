@@ -0,0 +1,139 @@
+"""API密钥池
+
+一个分析器可以配置多个API密钥（设置中用逗号或换行分隔），突破单个密钥的并发和每分钟请求数限制。
+每个密钥单独统计最近一分钟的请求数、进行中的请求数和健康状态：
+    - 请求发往剩余额度最多的密钥，全部没有额度时等待
+    - 返回 429 的密钥在 Retry-After 时间内不再使用
+    - 欠费或认证失败的密钥自动停用，其余密钥继续工作；全部停用时才报错
+"""
+import re
+import time
+import threading
+from collections import deque
+
+
+RATE_WINDOW = 60  # 每分钟请求数的统计窗口（秒）
+
+
+def parse_api_keys(value):
+    """把设置中的密钥文本（逗号、分号、空白分隔）或列表拆成去重后的密钥列表"""
+    if not value:
+        return []
+    if isinstance(value, str):
+        value = re.split(r'[\s,;，；]+', value)
+    keys = []
+    for key in value:
+        key = key.strip()
+        if key and key not in keys:
+            keys.append(key)
+    return keys
+
+
+def mask_key(key):
+    """日志和统计中只显示密钥首尾几位"""
+    if len(key) <= 8:
+        return '*' * len(key)
+    return f"{key[:4]}…{key[-4:]}"
+
+
+class ApiKeyState:
+    """一个密钥的额度与健康状态"""
+
+    def __init__(self, key, rpm=0, max_in_flight=0):
+        self.key = key
+        self.rpm = rpm  # 每分钟请求数上限，0 为不限
+        self.max_in_flight = max_in_flight  # 并发上限，0 为不限
+        self.in_flight = 0
+        self.sent = deque()  # 最近一分钟内发出请求的时间
+        self.cooldown_until = 0.0
+        self.disabled = None  # 停用原因
+        self.requests = 0
+        self.rate_limited = 0
+
+    @property
+    def name(self):
+        return mask_key(self.key)
+
+    def headroom(self, now):
+        """剩余额度：每分钟剩余请求数与剩余并发数中较小的一个"""
+        while self.sent and now - self.sent[0] >= RATE_WINDOW:
+            self.sent.popleft()
+        room = float('inf')
+        if self.rpm:
+            room = min(room, self.rpm - len(self.sent))
+        if self.max_in_flight:
+            room = min(room, self.max_in_flight - self.in_flight)
+        return room
+
+    def available_at(self, now):
+        """预计恢复额度的时间"""
+        times = [self.cooldown_until]
+        if self.rpm and len(self.sent) >= self.rpm:
+            times.append(self.sent[0] + RATE_WINDOW)
+        return max(times)
+
+    def to_dict(self):
+        return {
+            'key': self.name,
+            'requests': self.requests,
+            'in_flight': self.in_flight,
+            'rate_limited': self.rate_limited,
+            'disabled': self.disabled,
+        }
+
+
+class KeyPool:
+    """线程安全的密钥池，acquire() 取得密钥，请求结束后 release()"""
+
+    def __init__(self, keys, rpm=0, max_in_flight=0):
+        self.keys = [ApiKeyState(key, rpm, max_in_flight) for key in keys]
+        self.last_error = None
+        self._cond = threading.Condition()
+
+    def __len__(self):
+        return len(self.keys)
+
+    def active_count(self):
+        with self._cond:
+            return sum(1 for key in self.keys if key.disabled is None)
+
+    def acquire(self):
+        """取得剩余额度最多的可用密钥，没有额度时等待；全部停用时抛出最后一次停用的原因"""
+        with self._cond:
+            while True:
+                active = [key for key in self.keys if key.disabled is None]
+                if not active:
+                    raise Exception(self.last_error or "没有可用的API密钥")
+                now = time.monotonic()
+                ready = [key for key in active if key.cooldown_until <= now and key.headroom(now) > 0]
+                if ready:
+                    key = max(ready, key=lambda k: (k.headroom(now), -k.in_flight))
+                    key.in_flight += 1
+                    key.requests += 1
+                    key.sent.append(now)
+                    return key
+                # 等到最早恢复额度的密钥，或有请求结束
+                wait = min(key.available_at(now) for key in active) - now
+                self._cond.wait(min(max(wait, 0.01), 1.0))
+
+    def release(self, key, cooldown=None):
+        """请求结束；cooldown 为 429 时该密钥暂停使用的秒数"""
+        with self._cond:
+            key.in_flight -= 1
+            if cooldown:
+                key.rate_limited += 1
+                key.cooldown_until = max(key.cooldown_until, time.monotonic() + cooldown)
+            self._cond.notify_all()
+
+    def disable(self, key, reason):
+        """停用欠费或认证失败的密钥"""
+        with self._cond:
+            if key.disabled is None:
+                key.disabled = reason
+                self.last_error = reason
+                print(f"API密钥 {key.name} 已停用：{reason}")
+            self._cond.notify_all()
+
+    def stats(self):
+        with self._cond:
+            return [key.to_dict() for key in self.keys]
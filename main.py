@@ -1,28 +1,39 @@
 import tkinter as tk
 from tkinter import ttk
 import os
-import subprocess
 from tkinter import messagebox
-from PIL import Image, ImageTk
-import glob
 import threading
-import re
-import queue
 import base64
 import requests
 import json
-from io import BytesIO
 import time
 from zhipuai import ZhipuAI
 from abc import ABC, abstractmethod
 from config_manager import ConfigManager
 from tkinter import filedialog
 from ai_analyzer import AIManager  # 从 ai_analyzer 导入 AIManager
+from job_control import JobControl
+from video_pipeline import (find_ffmpeg, make_frames_dir, stream_keyframes, format_timestamp,
+                            frame_extension, frame_time_str, probe_duration, DEFAULT_QUALITY)
+from report_exporter import StreamingReportWriter
+from risk_viewer import RiskReportViewer
+from metrics import MetricsRegistry, describe_pipeline_metrics, sample_derived_metrics
+from tracing import Tracer
+from results_store import RunRecorder, ResultsDatabase, RESULTS_DB_NAME
+from analysis_cache import AnalysisCache
+from cost_tracker import day_start, format_estimate
+from frame_workers import FrameProcessPool
+from frame_store import FrameStore
+from frame_pack import FramePack
+from preview_grid import VirtualPreviewGrid
+from ui_events import UIEventBus
+from thumbnail_cache import THUMBNAIL_CACHE_DIR_NAME, prune_thumbnail_cache
 import shutil
 import webbrowser
 from packaging import version
 import sys
 import socket
+import multiprocessing
 from img.logo import imgBase64
 
 
@@ -72,11 +83,71 @@ class VideoAnalyzer(tk.Tk):
         self.concurrent_limit = 2
         self.request_semaphore = threading.Semaphore(self.concurrent_limit)
         self.analysis_results = {}
+        self.analysis_results_lock = threading.Lock()  # 分析线程写入结果，界面线程和报告窗口读取
         self.pending_analysis = 0  # 添加待分析计数器
+        self.pending_lock = threading.Lock()
         self.auto_export_report = True  # 添加自动导出标志
+        self.current_job = None  # 当前正在处理的任务
+        self.report_writer = None  # 当前任务的增量风险报告
+        self.run_recorder = None  # 当前任务的结构化结果（JSONL/CSV/结果库）
+        self.extraction_done = False
+        self.metrics = None  # 当前任务的运行指标
+        self.tracer = None  # 当前任务的关键帧生命周期追踪
+        self.run_spend = None  # 当前任务的 token 用量与预算
+        self.budget_warned_job = None  # 已提示过达到预算的任务，每个任务只提示一次
+        # 相同内容的关键帧（按哈希）复用分析结果
+        self.analysis_cache = AnalysisCache()
+        try:
+            self.results_db = ResultsDatabase(
+                os.path.join(self.config_manager.get_config_dir(), RESULTS_DB_NAME)
+            )
+        except Exception as e:
+            print(f"Error opening results database: {e}")
+            self.results_db = None
+
+        # 缩略图、哈希、base64 等CPU密集型处理放到进程池中执行
+        # 缩略图缓存在配置目录下，启动时在后台清理超出上限的旧缓存
+        thumbnail_cache_dir = os.path.join(self.config_manager.get_config_dir(), THUMBNAIL_CACHE_DIR_NAME)
+        self.frame_pool = FrameProcessPool(thumbnail_cache_dir=thumbnail_cache_dir)
+        threading.Thread(
+            target=prune_thumbnail_cache,
+            args=(thumbnail_cache_dir, self.config_manager.config.get('thumbnail_cache_mb', 200) * 1024 * 1024),
+            daemon=True
+        ).start()
+        self.frame_hashes = {}  # 关键帧路径 -> 内容哈希
+        # 关键帧字节保存在内存中，只有风险帧或用户选择保留的帧才写入磁盘
+        self.frame_store = None
 
         # 初始化 AI 管理器
         self.ai_manager = AIManager()
+        self.ai_manager.configure_circuit_breaker(
+            failure_threshold=self.config_manager.config.get('circuit_failure_threshold', 5),
+            reset_timeout=self.config_manager.config.get('circuit_reset_seconds', 5),
+            max_wait=self.config_manager.config.get('circuit_max_wait', 300)
+        )
+        self.ai_manager.configure_reanalysis(
+            threshold=self.config_manager.config.get('reanalysis_confidence', 0.7),
+            audit_rate=self.config_manager.config.get('reanalysis_audit_rate', 0.05)
+        )
+        spent_today = None
+        if self.results_db is not None:
+            try:
+                spent_today = self.results_db.spend_since(day_start())
+            except Exception as e:
+                print(f"Error reading today's usage: {e}")
+        self.ai_manager.configure_budget(
+            prices=self.config_manager.config.get('token_prices'),
+            run_cost=self.config_manager.config.get('budget_run_yuan', 0),
+            run_tokens=self.config_manager.config.get('budget_run_tokens', 0),
+            daily_cost=self.config_manager.config.get('budget_daily_yuan', 0),
+            daily_tokens=self.config_manager.config.get('budget_daily_tokens', 0),
+            throttle_ratio=self.config_manager.config.get('budget_throttle_ratio', 0.8),
+            spent_today=spent_today
+        )
+        self.ai_manager.configure_providers(
+            self.config_manager.config.get('ai_providers'),
+            hedge_max_ratio=self.config_manager.config.get('hedge_max_ratio', 0.1)
+        )
         self.available_models = self.ai_manager.get_available_analyzers()
 
         # 创建 UI 变量
@@ -94,10 +165,10 @@ class VideoAnalyzer(tk.Tk):
         self._load_saved_config()
 
         # 在创建窗口后添加以下代码
-        self.createTempLogo()
-        self.wm_iconbitmap("temp.ico")  # 设置窗口图标
-        if os.path.exists("temp.ico"):
-            os.remove("temp.ico")  # 删除临时图标文件
+        try:
+            self.wm_iconbitmap(self._get_icon_path())  # 设置窗口图标
+        except tk.TclError as e:
+            print(f"Error setting window icon: {e}")
 
         # 添加延迟检查更新
         self.after(3000, lambda: self.check_for_updates(silent=True))
@@ -173,44 +244,24 @@ class VideoAnalyzer(tk.Tk):
         )
         self.preview_frame.pack(padx=10, pady=5, fill=tk.BOTH, expand=True)
 
-        # 创建画布和滚动条的容器
-        self.canvas_container = ttk.Frame(self.preview_frame, style='OuterBorder.TFrame')
-        self.canvas_container.pack(fill=tk.BOTH, expand=True, padx=1, pady=1)
-
-        # 创建画布
-        self.canvas = tk.Canvas(
-            self.canvas_container,
-            highlightthickness=0,
-            bd=0
-        )
-        self.canvas.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
-
-        # 创建垂直滚动条
-        self.v_scrollbar = ttk.Scrollbar(
-            self.canvas_container, 
-            orient="vertical", 
-            command=self.canvas.yview
-        )
-        self.v_scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
-
-        # 配置画布
-        self.canvas.configure(yscrollcommand=self.v_scrollbar.set)
-        self.scrollable_frame = ttk.Frame(self.canvas)
-        self.canvas_frame = self.canvas.create_window((0, 0), window=self.scrollable_frame, anchor="nw")
-
         # 设置每行显示的列数和图片尺寸
         self.columns_per_row = 6   # 每行显示6列
         self.max_preview_width = 160  # 最大预览宽度
-        self.current_row = 0
-        self.current_col = 0
 
-        # 分别存储文件路径和图片对象
-        self.processed_files = []  # 存储已处理的文件路径
-        self.preview_images = []   # 存储 PhotoImage 对象和对应的标签
+        # 虚拟化预览网格：只为可见行创建控件，滚动时复用
+        self.preview_grid = VirtualPreviewGrid(
+            self.preview_frame,
+            columns=self.columns_per_row,
+            thumb_width=self.max_preview_width,
+            thumb_height=self.max_preview_width * 9 // 16,
+            show_tooltip=self._show_tooltip,
+            hide_tooltip=self._hide_tooltip,
+            style='OuterBorder.TFrame'
+        )
+        self.preview_grid.pack(fill=tk.BOTH, expand=True, padx=1, pady=1)
 
-        # 绑定画布大小变化事件
-        self.canvas.bind('<Configure>', self.on_frame_configure)
-        self.scrollable_frame.bind('<Configure>', self.on_frame_configure)
+        # 存储已处理的文件路径
+        self.processed_files = []
 
         # 底部状态栏区域
         status_frame = ttk.Frame(main_container)
@@ -251,6 +302,29 @@ class VideoAnalyzer(tk.Tk):
         self.progress_frame = ttk.Frame(inner_status_frame)
         self.progress_frame.pack(side=tk.RIGHT)
 
+        # 实时运行指标（吞吐量、AI延迟、缓存命中率）
+        self.metrics_label = ttk.Label(self.progress_frame, text="", foreground="gray")
+        self.metrics_label.pack(side=tk.LEFT, padx=(0, 10))
+
+        # 暂停 / 取消按钮（处理过程中可用）
+        self.pause_button = ttk.Button(
+            self.progress_frame,
+            text="暂停",
+            command=self._toggle_pause,
+            state='disabled',
+            width=6
+        )
+        self.pause_button.pack(side=tk.LEFT, padx=(0, 5))
+
+        self.cancel_button = ttk.Button(
+            self.progress_frame,
+            text="取消",
+            command=self._cancel_current_job,
+            state='disabled',
+            width=6
+        )
+        self.cancel_button.pack(side=tk.LEFT, padx=(0, 5))
+
         self.progress_label = ttk.Label(
             self.progress_frame, 
             text="",
@@ -265,16 +339,16 @@ class VideoAnalyzer(tk.Tk):
         )
         self.progress_bar.pack(side=tk.LEFT)
 
-        # 创建队列用于线程间通信
-        self.preview_queue = queue.Queue()
+        # 工作线程通过事件总线通知界面，界面线程按固定帧率批量处理
+        self.ui_events = UIEventBus(self, fps=30)
+        self.ui_events.subscribe('preview', self._on_preview_events)
+        self.ui_events.subscribe('status', self._on_status_events)
+        self.ui_events.subscribe('verdict', self._on_verdict_events)
+        self.ui_events.subscribe('analysis_error', self._on_analysis_error_events)
+        self.ui_events.subscribe('analysis_idle', self._on_analysis_idle_events)
+        self.ui_events.subscribe('job_end', self._on_job_end_events)
+        self.ui_events.start()
 
-        # 绑定鼠标滚轮事件
-        self.canvas.bind_all("<MouseWheel>", self._on_mousewheel)
-
-        # 绑定进入离开事件
-        self.canvas.bind('<Enter>', lambda e: self.canvas.bind_all("<MouseWheel>", self._on_mousewheel))
-        self.canvas.bind('<Leave>', lambda e: self.canvas.unbind_all("<MouseWheel>"))
-        
         # 修改预览容器样式
         style = ttk.Style()
         style.configure("Risk.TFrame", background="red")
@@ -331,6 +405,60 @@ class VideoAnalyzer(tk.Tk):
         )
         self.use_video_dir_check.pack(padx=5, pady=2, anchor='w')
 
+        # 保存全部关键帧的选项（关闭时只保存进入报告的风险帧）
+        self.keep_all_frames = tk.BooleanVar(value=self.config_manager.config.get('keep_all_frames', False))
+        self.keep_all_frames_check = ttk.Checkbutton(
+            self.output_frame,
+            text="保存全部关键帧（未启用AI分析时始终保存）",
+            variable=self.keep_all_frames,
+            command=self._save_config
+        )
+        self.keep_all_frames_check.pack(padx=5, pady=2, anchor='w')
+
+        # 关键帧存储方式和编码格式
+        self.frame_format_frame = ttk.Frame(self.output_frame)
+        self.frame_format_frame.pack(fill=tk.X, padx=5, pady=2)
+
+        ttk.Label(self.frame_format_frame, text="存储方式:").pack(side=tk.LEFT)
+        self.frame_storage_names = {'files': '独立图片文件', 'pack': '单文件打包'}
+        self.frame_storage = tk.StringVar(
+            value=self.frame_storage_names.get(self.config_manager.config.get('frame_storage', 'files'), '独立图片文件')
+        )
+        storage_combobox = ttk.Combobox(
+            self.frame_format_frame,
+            textvariable=self.frame_storage,
+            values=list(self.frame_storage_names.values()),
+            state='readonly',
+            width=12
+        )
+        storage_combobox.pack(side=tk.LEFT, padx=5)
+        storage_combobox.bind('<<ComboboxSelected>>', lambda e: self._save_config())
+
+        ttk.Label(self.frame_format_frame, text="编码:").pack(side=tk.LEFT, padx=(10, 0))
+        self.output_encoding = tk.StringVar(value=self.config_manager.config.get('output_encoding', 'jpeg'))
+        encoding_combobox = ttk.Combobox(
+            self.frame_format_frame,
+            textvariable=self.output_encoding,
+            values=['jpeg', 'webp'],
+            state='readonly',
+            width=6
+        )
+        encoding_combobox.pack(side=tk.LEFT, padx=5)
+        encoding_combobox.bind('<<ComboboxSelected>>', lambda e: self._save_config())
+
+        ttk.Label(self.frame_format_frame, text="质量:").pack(side=tk.LEFT, padx=(10, 0))
+        self.output_quality = tk.IntVar(value=self.config_manager.config.get('output_quality', DEFAULT_QUALITY))
+        quality_spinbox = ttk.Spinbox(
+            self.frame_format_frame,
+            from_=1,
+            to=100,
+            textvariable=self.output_quality,
+            width=5,
+            command=self._save_config
+        )
+        quality_spinbox.pack(side=tk.LEFT, padx=5)
+        quality_spinbox.bind('<FocusOut>', lambda e: self._save_config())
+
         # 输出目录选择
         self.output_dir_frame = ttk.Frame(self.output_frame)
         self.output_dir_frame.pack(fill=tk.X, padx=5, pady=2)
@@ -405,6 +533,29 @@ class VideoAnalyzer(tk.Tk):
         self.api_key_entry.bind('<KeyRelease>', lambda e: self._save_config())
         self.api_key_entry.bind('<FocusOut>', lambda e: self._save_config())
 
+        # 自定义接口地址（留空使用官方地址，压测时可填本地模拟服务地址）
+        self.api_base_url_frame = ttk.Frame(self.ai_settings_frame)
+        self.api_base_url_frame.pack(fill=tk.X, padx=5, pady=5)
+        ttk.Label(self.api_base_url_frame, text="接口地址:").pack(side=tk.LEFT)
+        self.api_base_url_entry = ttk.Entry(self.api_base_url_frame)
+        self.api_base_url_entry.pack(side=tk.LEFT, padx=5, fill=tk.X, expand=True)
+        self.api_base_url_entry.insert(0, self.config_manager.config.get('api_base_url', ''))
+        if not self.enable_ai.get():
+            self.api_base_url_entry.config(state='disabled')
+        # 修改地址后重新配置分析器
+        self.api_base_url_entry.bind('<FocusOut>', lambda e: self._toggle_ai_settings())
+
+        # 模型名称（OpenAI 兼容接口必填，留空使用分析器默认模型）
+        self.api_model_frame = ttk.Frame(self.ai_settings_frame)
+        self.api_model_frame.pack(fill=tk.X, padx=5, pady=5)
+        ttk.Label(self.api_model_frame, text="模型名称:").pack(side=tk.LEFT)
+        self.api_model_entry = ttk.Entry(self.api_model_frame)
+        self.api_model_entry.pack(side=tk.LEFT, padx=5, fill=tk.X, expand=True)
+        self.api_model_entry.insert(0, self.config_manager.config.get('api_model', ''))
+        if not self.enable_ai.get():
+            self.api_model_entry.config(state='disabled')
+        self.api_model_entry.bind('<FocusOut>', lambda e: self._toggle_ai_settings())
+
         # 场景检测设置区域
         self.detection_frame = ttk.LabelFrame(settings_tab, text="场景检测设置", style='Borderless.TLabelframe')
         self.detection_frame.pack(padx=10, pady=10, fill=tk.X)
@@ -447,9 +598,11 @@ class VideoAnalyzer(tk.Tk):
             try:
                 model_key = next(key for key, name in self.available_models 
                                if name == self.current_model.get())
-                # 如果启用了 AI 且有 API 密钥，配置分析器
-                if self.enable_ai.get() and config.get('api_key'):
-                    self.ai_manager.configure_analyzer(model_key, config['api_key'])
+                # 如果启用了 AI 且有 API 密钥（自建的 OpenAI 兼容接口可不填），配置分析器
+                if self.enable_ai.get() and (config.get('api_key')
+                                             or not self.ai_manager.requires_api_key(model_key)):
+                    self.ai_manager.configure_analyzer(
+                        model_key, config.get('api_key', ''), **self._analyzer_options())
                     self.ai_manager.set_current_analyzer(model_key)
             except StopIteration:
                 print("Warning: Saved model not found in available models")
@@ -468,20 +621,51 @@ class VideoAnalyzer(tk.Tk):
     def _save_config(self):
         """保存当前配置"""
         # 检查必要的控件是否已创建
-        if not hasattr(self, 'api_key_entry') or not hasattr(self, 'output_dir_entry'):
+        if not hasattr(self, 'api_model_entry') or not hasattr(self, 'output_dir_entry'):
             return
 
-        config = {
+        # 界面上没有的配置项（内存上限、缓存大小等）保留配置文件中的值
+        config = dict(self.config_manager.config)
+        config.update({
             'enable_ai': self.enable_ai.get(),
             'current_model': self.current_model.get(),
             'api_key': self.api_key_entry.get().strip(),
+            'api_base_url': self.api_base_url_entry.get().strip(),
+            'api_model': self.api_model_entry.get().strip(),
             'sensitivity': float(self.sensitivity_scale.get()),
             'output_dir': self.output_dir_entry.get().strip(),
-            'use_video_dir': self.use_video_dir.get()
-        }
+            'use_video_dir': self.use_video_dir.get(),
+            'keep_all_frames': self.keep_all_frames.get(),
+            'frame_storage': self._get_frame_storage(),
+            'output_encoding': self.output_encoding.get(),
+            'output_quality': self._get_output_quality()
+        })
         print("Saving config:", config)  # 添加调试输出
         self.config_manager.save_config(config)
 
+    def _analyzer_options(self):
+        """分析器的接口地址、模型名称等设置，留空的项使用分析器默认值"""
+        return {
+            'base_url': self.api_base_url_entry.get().strip() or None,
+            'model': self.api_model_entry.get().strip() or None,
+            'http2': self.config_manager.config.get('api_http2', False),
+            'key_rpm': self.config_manager.config.get('api_key_rpm', 0),
+            'key_concurrency': self.config_manager.config.get('api_key_concurrency', 0),
+        }
+
+    def _get_frame_storage(self):
+        """当前选择的关键帧存储方式（files / pack）"""
+        for key, name in self.frame_storage_names.items():
+            if name == self.frame_storage.get():
+                return key
+        return 'files'
+
+    def _get_output_quality(self):
+        try:
+            return max(1, min(100, int(self.output_quality.get())))
+        except (tk.TclError, ValueError):
+            return DEFAULT_QUALITY
+
     def _toggle_ai_settings(self):
         """切换AI设置的启用状态"""
         # 修改状态设置逻辑
@@ -490,19 +674,21 @@ class VideoAnalyzer(tk.Tk):
         
         self.model_combobox.config(state=combobox_state)  # combobox使用readonly/disabled
         self.api_key_entry.config(state=entry_state)  # entry使用normal/disabled
+        self.api_base_url_entry.config(state=entry_state)
+        self.api_model_entry.config(state=entry_state)
         
         # 如果禁用了 AI，清除当前分析器
         if not self.enable_ai.get():
             self.ai_manager.current_analyzer = None
-        # 如果启用了 AI，且有选择模型和 API 密钥，则配置分析器
-        elif self.current_model.get() and self.api_key_entry.get().strip():
-            try:
-                model_key = next(key for key, name in self.available_models 
-                               if name == self.current_model.get())
-                self.ai_manager.configure_analyzer(model_key, self.api_key_entry.get().strip())
+        # 如果启用了 AI，且有选择模型和 API 密钥（自建的 OpenAI 兼容接口可不填），则配置分析器
+        elif self.current_model.get():
+            model_key = next((key for key, name in self.available_models
+                              if name == self.current_model.get()), None)
+            if model_key and (self.api_key_entry.get().strip()
+                              or not self.ai_manager.requires_api_key(model_key)):
+                self.ai_manager.configure_analyzer(
+                    model_key, self.api_key_entry.get().strip(), **self._analyzer_options())
                 self.ai_manager.set_current_analyzer(model_key)
-            except StopIteration:
-                pass
         
         # 保存配置
         self._save_config()
@@ -547,20 +733,20 @@ class VideoAnalyzer(tk.Tk):
                 if not self.current_model.get():
                     messagebox.showerror("错误", "请选择AI模型！")
                     return
-                if not self.api_key_entry.get():
+                model_key = next((key for key, name in self.available_models
+                                  if name == self.current_model.get()), None)
+                if model_key is None:
+                    messagebox.showerror("错误", "无效的AI模型选择！")
+                    return
+                if self.ai_manager.requires_api_key(model_key) and not self.api_key_entry.get():
                     messagebox.showerror("错误", "请输入API密钥！")
                     return
                 
-                try:
-                    # 配置AI分析器并保存配置
-                    model_key = next(key for key, name in self.available_models 
-                                   if name == self.current_model.get())
-                    self.ai_manager.configure_analyzer(model_key, self.api_key_entry.get())
-                    self.ai_manager.set_current_analyzer(model_key)
-                    self._save_config()
-                except StopIteration:
-                    messagebox.showerror("错误", "无效的AI模型选择！")
-                    return
+                # 配置AI分析器并保存配置
+                self.ai_manager.configure_analyzer(
+                    model_key, self.api_key_entry.get(), **self._analyzer_options())
+                self.ai_manager.set_current_analyzer(model_key)
+                self._save_config()
             
             self.process_video(file_path)
 
@@ -589,340 +775,564 @@ class VideoAnalyzer(tk.Tk):
         ffmpeg_path = self._get_ffmpeg_path()
         if not ffmpeg_path:
             return
-        
-        # 修改 ffmpeg 命令调用，使用完整路径
-        command = [
-            ffmpeg_path,  # 使用完整路径
-            '-i', video_path,
-            '-vf', f"select='gt(scene,{self.sensitivity_value.get()})'",
-            '-vsync', 'vfr',
-            '-q:v', '2',
-            os.path.join(os.path.dirname(video_path), 'temp_%04d.jpg')
-        ]
+
+        # 取消上一个尚未结束的任务，避免与新任务争用分析结果
+        if self.current_job:
+            self.current_job.cancel()
+        job = JobControl()
+        self.current_job = job
+        if self.frame_store:
+            self.frame_store.close()
+        memory_limit_mb = self.config_manager.config.get('frame_memory_limit_mb', 256)
+        self.frame_store = FrameStore(memory_limit=memory_limit_mb * 1024 * 1024)
+        with self.pending_lock:
+            self.pending_analysis = 0
+        self.report_writer = None
+        self.run_recorder = None
+        self.run_spend = None
+        self.extraction_done = False
+        # 每个任务单独统计运行指标
+        metrics = MetricsRegistry()
+        describe_pipeline_metrics(metrics)
+        self.metrics = metrics
+        self.ai_manager.set_metrics(metrics)
+        tracer = Tracer(
+            name=os.path.basename(video_path),
+            capacity=self.config_manager.config.get('trace_capacity', 50000),
+            sample_rate=self.config_manager.config.get('trace_sample_rate', 1.0)
+        )
+        self.tracer = tracer
+        self.metrics_label.config(text="")
+        self.after(1000, self._update_metrics_label, job)
+        if self._ai_ready():
+            # 并发请求数随密钥数量增加（上一个任务未结束的请求仍释放到旧的信号量上）
+            per_key = self.config_manager.config.get('ai_concurrency_per_key', 2)
+            self.concurrent_limit = max(2, per_key * self.ai_manager.key_count())
+            self.request_semaphore = threading.Semaphore(self.concurrent_limit)
+            # 本次处理的 token 用量，同时计入当天的用量和预算
+            self.run_spend = self.ai_manager.new_run_spend()
+            # ffmpeg 解码第一个关键帧期间提前建立到AI接口的连接
+            threading.Thread(
+                target=self.ai_manager.prewarm, args=(self.concurrent_limit,), daemon=True
+            ).start()
 
         self.status_label.config(text="正在处理视频，请稍候...")
         self.progress_label.config(text="准备处理...")
         self.progress_bar.start(10)  # 启动进度条动画
+        self.pause_button.config(text="暂停", state='normal')
+        self.cancel_button.config(state='normal')
         
         # 隐藏打开链接
         self.open_link.pack_forget()
         
         # 清理预览区域和分析结果
-        for _, container in self.preview_images:
-            container.destroy()
-        self.preview_images.clear()
+        self.preview_grid.clear()
         self.processed_files.clear()
-        self.analysis_results.clear()  # 清除旧的分析结果
+        self.frame_hashes.clear()
+        with self.analysis_results_lock:
+            self.analysis_results.clear()  # 清除旧的分析结果
         
         # 禁用风险报告按钮
         self.report_button.config(state='disabled')
 
-        # 重置行列计数
-        self.current_row = 0
-        self.current_col = 0
-
         # 创建处理线程
         thread = threading.Thread(
             target=self._process_video_thread,
-            args=(video_path,),
+            args=(video_path, job, self.frame_store, metrics, tracer),
             daemon=True
         )
         thread.start()
 
-        # 启动预览更新检查
-        self.after(100, self._check_preview_queue)
-
-    def _process_video_thread(self, video_path):
+    def _toggle_pause(self):
+        """暂停或继续当前任务的AI分析派发"""
+        job = self.current_job
+        if not job or job.cancelled:
+            return
+        if job.paused:
+            job.resume()
+            self.pause_button.config(text="暂停")
+            self.status_label.config(text="已继续分析")
+        else:
+            job.pause()
+            self.pause_button.config(text="继续")
+            self.status_label.config(text="已暂停分析，关键帧提取继续进行")
+
+    def _cancel_current_job(self):
+        """取消当前任务：终止 ffmpeg 并丢弃排队中的分析"""
+        job = self.current_job
+        if not job or job.cancelled:
+            return
+        job.cancel()
+        with self.pending_lock:
+            self.pending_analysis = 0
+        self.pause_button.config(text="暂停", state='disabled')
+        self.cancel_button.config(state='disabled')
+        self.progress_bar.stop()
+        self.progress_label.config(text="已取消")
+        self.status_label.config(text="任务已取消")
+
+    def _finish_job_controls(self):
+        """任务结束后禁用暂停 / 取消按钮"""
+        self.pause_button.config(text="暂停", state='disabled')
+        self.cancel_button.config(state='disabled')
+
+    def _ai_ready(self):
+        """是否启用了AI分析且分析器已正确配置"""
+        return bool(self.enable_ai.get() and
+                    self.ai_manager.current_analyzer and
+                    self.ai_manager.current_analyzer.is_configured())
+
+    def _process_video_thread(self, video_path, job, frame_store, metrics=None, tracer=None):
+        tracer = tracer or Tracer(sample_rate=0)
         try:
             ffmpeg_path = self._get_ffmpeg_path()
             print(f"Using ffmpeg path: {ffmpeg_path}")  # 调试输出
-            print(f"ffmpeg exists: {os.path.exists(ffmpeg_path)}")  # 检查文件是否存在
-            
-            # 获取视频文件名（不含扩展名）和时间戳
-            video_name = os.path.splitext(os.path.basename(video_path))[0]
-            timestamp = time.strftime("%Y%m%d_%H%M%S")
-            
-            # 创建输出目录名称（只包含视频名和时间戳）
-            frames_dir_name = f"{video_name}_{timestamp}"
-            # 清理目录名中的非法字符
-            frames_dir_name = re.sub(r'[<>:"/\\|?*]', '_', frames_dir_name)
-            
+
             # 根据设置选择基础目录
             if self.use_video_dir.get():
                 # 使用视频所在目录
-                base_dir = os.path.dirname(os.path.abspath(video_path))
+                base_dir = None
             else:
                 # 使用自定义目录，如果未设置则默认使用视频所在目录
-                custom_dir = self.output_dir_entry.get().strip()
-                base_dir = custom_dir if custom_dir else os.path.dirname(os.path.abspath(video_path))
-            
-            # 组合完整的输出路径
-            frames_dir = os.path.join(base_dir, frames_dir_name)
-            
-            # 创建目录
-            if not os.path.exists(frames_dir):
-                os.makedirs(frames_dir)
-
-            # 更新状态显示（只显示目录名，不显示完整路径）
-            self.preview_queue.put(('update_status', f"正在处理: {frames_dir_name}"))
-
-            # 获取当前灵敏度值
-            sensitivity = self.sensitivity_value.get()
-            
-            # 使用ffmpeg提取关键帧
-            temp_pattern = os.path.join(frames_dir, 'temp_%04d.jpg').replace('\\', '/')
-            
-            # 使用完整的 ffmpeg 路径
-            ffmpeg_path = self._get_ffmpeg_path()
-            
-            # 修改提取命令
-            extract_command = [
-                ffmpeg_path,  # 使用完整路径而不是 'ffmpeg'
-                '-i', video_path,
-                '-vf', f"select='gt(scene,{sensitivity})'",
-                '-vsync', 'vfr',
-                '-q:v', '2',
-                temp_pattern
-            ]
+                base_dir = self.output_dir_entry.get().strip() or None
+
+            frames_dir = make_frames_dir(video_path, base_dir)
+            duration = probe_duration(video_path, ffmpeg_path)
+            # 风险帧在判定到达时逐条写入报告，不等全部分析结束
+            self.run_recorder = RunRecorder(
+                frames_dir, video_path,
+                sensitivity=self.sensitivity_value.get(),
+                database=self.results_db,
+                duration=duration
+            )
+            self.report_writer = StreamingReportWriter(
+                frames_dir,
+                read_frame=frame_store.get,
+                page_size=self.config_manager.config.get('report_page_size', 200)
+            )
 
-            print(f"Running command: {' '.join(extract_command)}")  # 打印完整命令
-            
-            # 执行提取命令
-            process = subprocess.Popen(
-                extract_command,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                universal_newlines=True,
-                encoding='utf-8',
-                errors='replace',
-                creationflags=0x08000000  # Windows下隐藏控制台窗口
+            # 更新状态显示（只显示目录名，不显示完整路径），附上按历史记录预估的关键帧数和费用
+            status_text = f"正在处理: {os.path.basename(frames_dir)}"
+            estimate = self._estimate_run(duration)
+            if estimate:
+                status_text += f"（{estimate}）"
+            self.ui_events.post('status', (job, status_text))
+
+            # 未启用AI分析时关键帧就是最终产物，始终写入磁盘
+            keep_frames = self.keep_all_frames.get() or not self._ai_ready()
+            encoding = self.output_encoding.get()
+            extension = frame_extension(encoding)
+
+            # 单文件打包时，写入磁盘的帧追加到 frames.pack
+            if self._get_frame_storage() == 'pack':
+                frame_store.attach_pack(FramePack(frames_dir, encoding))
+
+            def on_frame(timestamp, data):
+                # 以时间码文件名作为帧的键，帧数据先保存在内存中
+                frame_path = os.path.join(frames_dir, f'{format_timestamp(timestamp)}{extension}')
+                frame_store.put(frame_path, data, timestamp)
+                tracer.instant('extracted', frame_path, timestamp=round(timestamp, 3), bytes=len(data))
+                if keep_frames:
+                    with metrics.time('frame_persist_seconds'), tracer.span('persisted', frame_path):
+                        frame_store.persist(frame_path)
+                # 在进程池中生成缩略图和内容哈希，完成后由界面线程显示
+                submitted = tracer.now()
+                try:
+                    frame_future = self.frame_pool.submit_bytes(
+                        data, ops=('thumbnail', 'sha1'), max_width=self.max_preview_width
+                    )
+                    frame_future.add_done_callback(
+                        lambda future: tracer.add_span('thumbnailed', frame_path, submitted)
+                    )
+                except Exception as e:
+                    print(f"Error submitting frame {frame_path}: {e}")
+                    frame_future = None
+                # 通知界面添加预览
+                self.ui_events.post('preview', (job, frame_path, frame_future, tracer.now()))
+                self.processed_files.append(frame_path)
+
+            # 使用ffmpeg提取关键帧，帧数据通过管道直接读入内存
+            stream_keyframes(
+                video_path,
+                self.sensitivity_value.get(),
+                job=job,
+                on_frame=on_frame,
+                ffmpeg_path=ffmpeg_path,
+                encoding=encoding,
+                quality=self._get_output_quality(),
+                metrics=metrics
             )
 
-            # 读取输出并更新进度
-            while True:
-                line = process.stderr.readline()
-                if not line and process.poll() is not None:
-                    break
-                
-                # 检查是否生成了新的图片
-                frame_files = sorted(glob.glob(os.path.join(frames_dir, 'temp_*.jpg')))
-                for frame_file in frame_files:
-                    if frame_file not in self.processed_files:
-                        # 获取帧号
-                        frame_num = int(os.path.basename(frame_file).replace('temp_', '').replace('.jpg', ''))
-                        
-                        try:
-                            # 计算大致时间戳（这是一个估算）
-                            fps = 25  # 假设视频是25帧每秒
-                            timestamp = frame_num / fps
-                            
-                            # 格式化时间戳
-                            hours = int(timestamp // 3600)
-                            minutes = int((timestamp % 3600) // 60)
-                            seconds = int(timestamp % 60)
-                            milliseconds = int((timestamp % 1) * 1000)
-                            
-                            # 创建新的文件名，去掉 "frame_" 前缀
-                            new_filename = f'{hours:02d}-{minutes:02d}-{seconds:02d}.{milliseconds:03d}.jpg'
-                            new_filepath = os.path.join(frames_dir, new_filename)
-                            
-                            # 重命名文件
-                            os.rename(frame_file, new_filepath)
-                            
-                            # 添加到预览队列
-                            self.preview_queue.put(('add_preview', new_filepath))
-                            self.processed_files.append(new_filepath)
-                        except Exception as e:
-                            print(f"Error processing frame {frame_file}: {e}")
-
-            if process.returncode != 0:
-                raise subprocess.CalledProcessError(process.returncode, extract_command)
+            if job.cancelled:
+                self.ui_events.post('job_end', (job, 'cancelled', None))
+                return
 
             # 处理完成
-            self.preview_queue.put(('complete', None))
+            self.ui_events.post('job_end', (job, 'complete', None))
 
         except Exception as e:
-            self.preview_queue.put(('error', str(e)))
+            if job.cancelled:
+                self.ui_events.post('job_end', (job, 'cancelled', None))
+            else:
+                self.ui_events.post('job_end', (job, 'error', str(e)))
 
-    def _check_preview_queue(self):
+    def _estimate_run(self, duration):
+        """按结果库中的历史记录预估本次处理的关键帧数和费用，没有记录时返回空字符串"""
+        if not (self.results_db and self._ai_ready()):
+            return ""
         try:
-            while True:
-                action, data = self.preview_queue.get_nowait()
-                
-                if action == 'add_preview':
-                    self._add_preview_image(data)
-                    self.progress_label.config(text=f"已提取 {len(self.processed_files)} 个关键帧")
-                elif action == 'update_status':
-                    self.status_label.config(text=data)
-                elif action == 'complete':
-                    self.progress_bar.stop()
-                    
-                    # 获取输出目录
-                    if self.processed_files:
-                        output_dir = os.path.dirname(self.processed_files[0])
-                        # 更新状态栏显示完整信息
-                        self.status_label.config(
-                            text=f"处理完成 - 共提取 {len(self.processed_files)} 个关键帧 - 保存位置：{output_dir}"
-                        )
-                        self.progress_label.config(text="完成！")
-                        
-                        # 如果启用了AI分析且有风险项，启用风险报告按钮
-                        if self.enable_ai.get() and any(
-                            not result.get('is_safe', True) 
-                            for result in self.analysis_results.values()
-                        ):
-                            self.report_button.config(state='normal')
-                        else:
-                            self.report_button.config(state='disabled')
-                    return
-                elif action == 'error':
-                    self.progress_bar.stop()
-                    self.progress_label.config(text="处理失败")
-                    self.status_label.config(text=f"处理失败 - {data}")
-                    messagebox.showerror("错误", f"视频处理失败！\n错误信息：{data}")
-                    return
+            history = self.results_db.usage_history(float(self.sensitivity_value.get()))
+        except Exception as e:
+            print(f"Error reading usage history: {e}")
+            return ""
+        return format_estimate(self.ai_manager.estimate_run(duration, history))
+
+    def _on_preview_events(self, events):
+        """批量添加预览；缩略图尚未生成的帧及其后的事件留到下一帧，保持顺序"""
+        entries = []
+        leftover = None
+        for i, (job, image_path, frame_future, posted) in enumerate(events):
+            # 已被新任务取代的事件直接丢弃
+            if job is not self.current_job:
+                continue
+            if frame_future and not frame_future.done():
+                leftover = events[i:]
+                break
+            frame_info = None
+            if frame_future:
+                try:
+                    frame_info = frame_future.result()
+                except Exception as e:
+                    print(f"Error processing frame {image_path}: {e}")
+            entry = self._add_preview_image(image_path, frame_info)
+            self.tracer.add_span('preview_queued', image_path, posted)
+            if entry:
+                entries.append(entry)
+
+        if entries:
+            # 整批只做一次布局更新
+            self.preview_grid.add_items(entries)
+            progress_text = f"已提取 {len(self.preview_grid)} 个关键帧"
+            # 事件积压较多时显示队列深度
+            if self.ui_events.depth >= 100:
+                progress_text += f"（队列 {self.ui_events.depth}）"
+            self.progress_label.config(text=progress_text)
+        return leftover
+
+    def _on_status_events(self, events):
+        # 只显示最新的一条状态
+        for job, text in events:
+            if job is self.current_job:
+                self.status_label.config(text=text)
+
+    def _on_verdict_events(self, events):
+        for job, image_path, result, posted in events:
+            if job is self.current_job:
+                self._update_analysis_result(
+                    image_path,
+                    result['is_safe'],
+                    result['risk_type'],
+                    result['description']
+                )
+                # 从判定发出到界面显示
+                self.tracer.add_span('ui_updated', image_path, posted)
+
+    def _on_analysis_error_events(self, events):
+        for job, image_path, error_msg in events:
+            if job is not self.current_job:
+                continue
+            if "费用预算" in error_msg:
+                # 达到预算后剩余的帧不再发送请求，每个任务只提示一次
+                self.preview_grid.set_status(image_path, "超出预算", "red")
+                if self.budget_warned_job is not job:
+                    self.budget_warned_job = job
+                    messagebox.showwarning("提示", error_msg)
+            # 处理欠费错误（所有密钥都已欠费或认证失败时才会出现，单个密钥出错会自动换用其他密钥）
+            elif "账户已欠费" in error_msg or "认证失败" in error_msg:
+                self.preview_grid.set_status(image_path, "AI服务已欠费" if "欠费" in error_msg else "API密钥无效", "red")
+                if self.enable_ai.get():
+                    # 同一批中多个请求欠费时只提示一次
+                    messagebox.showerror("错误", error_msg)
+                    # 禁用 AI 分析功能
+                    self.enable_ai.set(False)
+                    self._toggle_ai_settings()
+            else:
+                # 其他错误的处理
+                self.preview_grid.set_status(image_path, "分析出错", "red")
 
-        except queue.Empty:
-            # 继续检查队列
-            self.after(100, self._check_preview_queue)
+    def _has_risk_results(self):
+        with self.analysis_results_lock:
+            return any(not result.get('is_safe', True) for result in self.analysis_results.values())
 
-    def _add_preview_image(self, image_path):
+    def _on_analysis_idle_events(self, events):
+        if not any(job is self.current_job for job in events):
+            return
+        # 如果有风险项，自动导出报告
+        if self._has_risk_results() and self.auto_export_report:
+            self._auto_export_report()
+        self._maybe_finish_run()
+
+    def _maybe_finish_run(self, status='completed'):
+        """提取结束且分析全部完成后，写出结构化结果"""
+        recorder = self.run_recorder
+        if not recorder or recorder.finished:
+            return
+        if status == 'completed':
+            with self.pending_lock:
+                if not self.extraction_done or self.pending_analysis > 0:
+                    return
         try:
-            # 打开图片
-            img = Image.open(image_path)
-            
-            # 计算等比例缩放尺寸，以宽度为基准
-            width, height = img.size
-            ratio = self.max_preview_width / width
-            new_width = int(width * ratio)
-            new_height = int(height * ratio)
-            
-            # 调整图片大小
-            img = img.resize((new_width, new_height), Image.Resampling.LANCZOS)
-            photo = ImageTk.PhotoImage(img)
+            recorder.finish(status, usage=self.run_spend.to_dict() if self.run_spend else None)
+        except Exception as e:
+            print(f"Error exporting results: {e}")
+        # 运行指标与结果放在同一目录
+        if self.metrics:
+            self._sample_metrics()
+            try:
+                self.metrics.export(recorder.frames_dir)
+            except Exception as e:
+                print(f"Error exporting metrics: {e}")
+            self._update_metrics_label(self.current_job)
+        # 关键帧生命周期追踪（chrome://tracing 或 Perfetto 打开）
+        if self.tracer and self.tracer.sample_rate > 0:
+            try:
+                self.tracer.export(recorder.frames_dir)
+            except Exception as e:
+                print(f"Error exporting trace: {e}")
+
+    def _sample_metrics(self):
+        """采样队列深度、内存占用等仪表值"""
+        metrics = self.metrics
+        metrics.set('ui_event_queue_depth', self.ui_events.depth)
+        metrics.set('pending_analysis', self.pending_analysis)
+        if self.frame_store:
+            metrics.set('frame_store_memory_bytes', self.frame_store.memory_used)
+        sample_derived_metrics(metrics)
+
+    def _update_metrics_label(self, job):
+        """每秒刷新状态栏中的运行指标，任务被取代后停止"""
+        if job is not self.current_job or not self.metrics:
+            return
+        self._sample_metrics()
+        metrics = self.metrics
+        parts = [f"{metrics.gauge('extraction_fps') or 0:.1f} 帧/秒"]
+        if metrics.counter('ai_requests_total'):
+            parts.append(f"AI p95 {metrics.quantile('ai_request_seconds', 0.95):.1f}s")
+        if metrics.counter('ai_rate_limited_total'):
+            parts.append(f"429×{metrics.counter('ai_rate_limited_total')}")
+        if metrics.counter('ai_hedged_total'):
+            parts.append(f"对冲×{metrics.counter('ai_hedged_total')}")
+        if metrics.counter('ai_circuit_opened_total'):
+            parts.append(f"熔断×{metrics.counter('ai_circuit_opened_total')}")
+        if metrics.counter('analysis_cache_hits_total'):
+            parts.append(f"缓存命中 {metrics.gauge('analysis_cache_hit_rate'):.0%}")
+        if metrics.counter('ai_parse_failures_total'):
+            parts.append(f"解析失败 {metrics.gauge('ai_parse_failure_rate') or 0:.0%}")
+        if self.run_spend and self.run_spend.requests:
+            usage = self.run_spend.to_dict()
+            text = f"{usage['prompt_tokens'] + usage['completion_tokens']} token"
+            if usage['cost']:
+                text += f" ¥{usage['cost']:.2f}"
+            parts.append(text)
+        self.metrics_label.config(text=" · ".join(parts))
+        if not (self.run_recorder and self.run_recorder.finished):
+            self.after(1000, self._update_metrics_label, job)
+
+    def _on_job_end_events(self, events):
+        for job, action, data in events:
+            if job is not self.current_job:
+                continue
+            if action == 'cancelled':
+                self._finish_job_controls()
+                self._maybe_finish_run('cancelled')
+            elif action == 'complete':
+                self.progress_bar.stop()
+                self._finish_job_controls()
+                with self.pending_lock:
+                    self.extraction_done = True
+                self._maybe_finish_run()
+                
+                # 获取输出目录
+                if self.processed_files:
+                    output_dir = os.path.dirname(self.processed_files[0])
+                    # 更新状态栏显示完整信息
+                    self.status_label.config(
+                        text=f"处理完成 - 共提取 {len(self.processed_files)} 个关键帧 - 保存位置：{output_dir}"
+                    )
+                    self.progress_label.config(text="完成！")
+                    
+                    # 如果启用了AI分析且有风险项，启用风险报告按钮
+                    if self.enable_ai.get() and self._has_risk_results():
+                        self.report_button.config(state='normal')
+                    else:
+                        self.report_button.config(state='disabled')
+            elif action == 'error':
+                self.progress_bar.stop()
+                self._finish_job_controls()
+                self._maybe_finish_run('failed')
+                self.progress_label.config(text="处理失败")
+                self.status_label.config(text=f"处理失败 - {data}")
+                messagebox.showerror("错误", f"视频处理失败！\n错误信息：{data}")
+
+    def _add_preview_image(self, image_path, frame_info=None):
+        """为一帧准备预览项并启动分析，返回交给预览网格的条目"""
+        try:
+            # 缩略图在进程池中生成，界面线程不解码原图；生成失败时只显示时间码和状态
+            thumbnail = None
+            if frame_info and frame_info.get('thumbnail'):
+                _, _, thumbnail = frame_info['thumbnail']
+                if self.metrics and 'thumbnail_seconds' in frame_info:
+                    self.metrics.observe('thumbnail_seconds', frame_info['thumbnail_seconds'])
+                self.frame_hashes[image_path] = frame_info.get('sha1')
+            if self.run_recorder:
+                self.run_recorder.add_frame(
+                    image_path,
+                    timestamp=self.frame_store.timestamp(image_path),
+                    sha1=self.frame_hashes.get(image_path)
+                )
 
             # 从文件名中提取时间码（去掉了 frame_ 前缀的处理）
-            time_str = os.path.basename(image_path).replace('.jpg', '')
-            
-            # 创建预览容器
-            preview_container = ttk.Frame(self.scrollable_frame)
-            preview_container.grid(row=self.current_row, column=self.current_col, padx=5, pady=5, sticky='nsew')
-            
-            # 创建图片标签
-            image_label = ttk.Label(preview_container, image=photo)
-            image_label.pack(pady=(0, 2))
-            
-            # 创建时间码标签
-            time_label = ttk.Label(preview_container, text=time_str)
-            time_label.pack()
-
-            # 创建分析状态标签
-            analysis_label = ttk.Label(preview_container, text="")
-            analysis_label.pack()
-
-            # 保存引用
-            self.preview_images.append((photo, preview_container))
+            time_str = frame_time_str(image_path)
 
             # 只在启用 AI 分析且正确配置了分析器时才启动分析线程
-            if (self.enable_ai.get() and 
-                self.ai_manager.current_analyzer and 
-                self.ai_manager.current_analyzer.is_configured()):
-                analysis_label.config(text="正在分析...")
-                self.pending_analysis += 1  # 增加待分析计数
+            if self._ai_ready():
+                status = "正在分析..."
+                with self.pending_lock:
+                    self.pending_analysis += 1  # 增加待分析计数
+                # 帧的引用交给分析线程，分析结束后释放
                 analysis_thread = threading.Thread(
                     target=self._analyze_image_thread,
-                    args=(image_path, preview_container, analysis_label),
+                    args=(image_path, self.current_job, self.frame_store, self.report_writer,
+                          self.run_recorder, self.tracer, self.run_spend),
                     daemon=True
                 )
                 analysis_thread.start()
-
-            # 更新行列位置
-            self.current_col += 1
-            if self.current_col >= self.columns_per_row:
-                self.current_col = 0
-                self.current_row += 1
-
-            # 配置网格列的权重，使其均匀分布
-            for i in range(self.columns_per_row):
-                self.scrollable_frame.grid_columnconfigure(i, weight=1)
-
-            # 更新画布滚动区域
-            self.scrollable_frame.update_idletasks()
-            self.canvas.configure(scrollregion=self.canvas.bbox("all"))
-            
-            # 自动滚动到最新的图片
-            self.canvas.yview_moveto(1.0)
-            
-            # 强制更新显示
-            self.update_idletasks()
+            else:
+                status = ""
+                if self.run_recorder:
+                    self.run_recorder.set_result(image_path, status='not_analyzed')
+                self.frame_store.release(image_path)
+            return (image_path, time_str, thumbnail, status, "")
         except Exception as e:
             print(f"Error adding preview: {e}")
             messagebox.showerror("错误", f"添加预览图片失败：{str(e)}")
 
-    def _analyze_image_thread(self, image_path, container, label):
+    def _analyze_image_thread(self, image_path, job, frame_store, report_writer=None, run_recorder=None,
+                              tracer=None, spend=None):
+        tracer = tracer or Tracer(sample_rate=0)
+        queued = tracer.now()
         try:
-            # 使用 AI 管理器进行分析
-            response = self.ai_manager.analyze_image(image_path)
-            result = self.ai_manager.current_analyzer.parse_response(response)
-            
+            # 暂停时等待；任务取消后直接丢弃，不再发出请求
+            if not job.wait_if_paused():
+                return
+
+            # 内容相同的帧直接复用之前的分析结果
+            cache_key = self.frame_hashes.get(image_path)
+            result = self.analysis_cache.get(cache_key) if cache_key else None
+            cached = result is not None
+            if self.metrics and job is self.current_job:
+                self.metrics.inc('analysis_cache_hits_total' if cached else 'analysis_cache_misses_total')
+            if cached:
+                tracer.instant('cache_hit', image_path)
+            started = time.time()
+            if not cached:
+                # 限制同时进行的请求数，排队中的任务在取消后不再发出
+                with self.request_semaphore:
+                    if not job.wait_if_paused():
+                        return
+                    tracer.add_span('queued', image_path, queued)
+                    started = time.time()
+                    # base64 编码（和低分辨率图片）在进程池中完成，帧数据直接从内存传入共享内存
+                    low_res_width = self.config_manager.config.get('analysis_low_res_width', 512)
+                    with tracer.span('encoded', image_path):
+                        encoded = self.frame_pool.submit_bytes(
+                            frame_store.get(image_path),
+                            ops=('base64', 'low_res') if low_res_width else ('base64',),
+                            low_res_width=low_res_width
+                        ).result()
+                    image_base64 = encoded['base64']
+                    low_res_base64 = encoded.get('low_res')
+                    # 从发出请求到收到响应（包含重试）；先分析低分辨率图片
+                    with tracer.span('request', image_path):
+                        response = self.ai_manager.analyze_image(
+                            image_path, spend=spend, image_base64=low_res_base64 or image_base64)
+                with tracer.span('parse_response', image_path):
+                    result = self.ai_manager.parse_response(response)
+                if low_res_base64:
+                    first = result
+                    result, reanalyze = self.ai_manager.review_first_pass(first)
+                    if reanalyze:
+                        # 置信度低或判定有风险，用原图重新分析
+                        with self.request_semaphore:
+                            with tracer.span('reanalysis', image_path):
+                                full = self.ai_manager.analyze_verdict(image_path, image_base64=image_base64,
+                                                                       spend=spend)
+                        result = self.ai_manager.merge_reanalysis(first, full)
+                if cache_key:
+                    self.analysis_cache.put(cache_key, result)
+            elapsed = time.time() - started
+
+            # 任务在请求期间被取消或被新任务取代，丢弃结果
+            if job.cancelled or job is not self.current_job:
+                return
+
+            # 风险帧会进入报告，写入磁盘并追加到报告中
+            if not result['is_safe']:
+                frame_store.persist(image_path)
+                if report_writer:
+                    try:
+                        with tracer.span('exported', image_path):
+                            report_writer.add(image_path, result)
+                    except Exception as e:
+                        print(f"Error appending {image_path} to report: {e}")
+            frame_store.set_verdict(image_path, result['is_safe'])
+
             # 更新界面
-            self.after(0, lambda: self._update_analysis_result(
-                container, label, 
-                result['is_safe'], 
-                result['risk_type'], 
-                result['description']
-            ))
+            self.ui_events.post('verdict', (job, image_path, result, tracer.now()))
             
             # 存储结果
-            self.analysis_results[image_path] = result
+            with self.analysis_results_lock:
+                self.analysis_results[image_path] = result
+            if run_recorder:
+                run_recorder.set_result(image_path, result, elapsed=elapsed, cached=cached)
             
             # 更新待分析计数并检查是否所有分析都完成
-            self.pending_analysis -= 1
-            if self.pending_analysis == 0:
-                # 如果有风险项，自动导出报告
-                has_risks = any(not result.get('is_safe', True) 
-                              for result in self.analysis_results.values())
-                
-                if has_risks and self.auto_export_report:
-                    self.after(0, self._auto_export_report)
+            with self.pending_lock:
+                self.pending_analysis -= 1
+                remaining = self.pending_analysis
+            if remaining == 0:
+                # 导出报告和结构化结果在界面线程中完成
+                self.ui_events.post('analysis_idle', job)
 
         except Exception as e:
+            if job.cancelled or job is not self.current_job:
+                return
             error_msg = str(e)
             print(f"Error in analysis thread for {image_path}: {e}")
             
-            # 处理欠费错误
-            if "账户已欠费" in error_msg:
-                self.after(0, lambda: [
-                    label.config(text="AI服务已欠费", foreground="red"),
-                    messagebox.showerror("错误", "AI服务账户已欠费，请充值后重试"),
-                    # 禁用 AI 分析功能
-                    self.enable_ai.set(False),
-                    self._toggle_ai_settings()
-                ])
-            else:
-                # 其他错误的处理
-                self.after(0, lambda: label.config(
-                    text="分析出错", 
-                    foreground="red"
-                ))
-            self.pending_analysis -= 1  # 确保在出错时也减少计数
-
-    def _update_analysis_result(self, container, label, is_safe, risk_type, description):
+            self.ui_events.post('analysis_error', (job, image_path, error_msg))
+            if run_recorder:
+                run_recorder.set_result(image_path, error=error_msg)
+            with self.pending_lock:
+                self.pending_analysis -= 1  # 确保在出错时也减少计数
+                remaining = self.pending_analysis
+            if remaining == 0:
+                self.ui_events.post('analysis_idle', job)
+        finally:
+            frame_store.release(image_path)
+
+    def _update_analysis_result(self, image_path, is_safe, risk_type, description):
         try:
             if is_safe:
                 # 移除背景色设置，只使用文字颜色
-                label.config(
-                    text="安全",
-                    foreground="green")
+                self.preview_grid.set_status(image_path, "安全", "green", tooltip=description)
             else:
                 # 移除背景色设置，只使用文字颜色
-                label.config(
-                    text=f"风险: {risk_type}" if risk_type else "风险",
-                    foreground="red")
-            
-            # 添加提示信息
-            label.bind('<Enter>', lambda e: self._show_tooltip(e, description))
-            label.bind('<Leave>', lambda e: self._hide_tooltip())
+                self.preview_grid.set_status(
+                    image_path,
+                    f"风险: {risk_type}" if risk_type else "风险",
+                    "red",
+                    tooltip=description)
             
             print(f"Updated UI - is_safe: {is_safe}, risk_type: {risk_type}")  # 调试输出
         except Exception as e:
@@ -946,22 +1356,6 @@ class VideoAnalyzer(tk.Tk):
         if hasattr(self, 'tooltip'):
             self.tooltip.destroy()
 
-    def on_frame_configure(self, event=None):
-        # 确保滚动区域覆盖所有内容
-        self.canvas.configure(scrollregion=self.canvas.bbox("all"))
-        
-        # 设置固定宽度，考虑到边距和滚动条
-        width = self.preview_frame.winfo_width() - 25  # 减去边距和滚动条宽度
-        self.canvas.itemconfig(self.canvas_frame, width=width)
-        
-        # 重新配置所有列的权重
-        for i in range(self.columns_per_row):
-            self.scrollable_frame.grid_columnconfigure(i, weight=1)
-
-    def _on_mousewheel(self, event):
-        # 调整垂直滚动
-        self.canvas.yview_scroll(int(-1 * (event.delta / 60)), "units")
-
     def _toggle_output_dir(self):
         """切换输出目录设置的启用状态"""
         state = 'disabled' if self.use_video_dir.get() else 'normal'
@@ -982,211 +1376,34 @@ class VideoAnalyzer(tk.Tk):
 
     def _show_risk_report(self):
         """显示风险报告窗口"""
-        # 创建报告窗口
-        report_window = tk.Toplevel(self)
-        report_window.title("风险分析报告")
-        report_window.geometry("800x600")
-        report_window.resizable(False, False)  # 禁止调整窗口大小
-        
-        # 设置子窗口图标
-        self.createTempLogo()
-        report_window.iconbitmap("temp.ico")  # 设置窗口图标
-        if os.path.exists("temp.ico"):
-            os.remove("temp.ico")  # 删除临时图标文件
-
-        # 创建报告内容
-        report_frame = ttk.Frame(report_window)
-        report_frame.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
-        
-        # 添加标题
-        title_label = ttk.Label(
-            report_frame, 
-            text="风险分析报告", 
-            font=('Arial', 16, 'bold')
+        # 窗口持有本次处理的帧存储，开始新的处理后仍可预览，窗口关闭后才释放
+        frame_store = self.frame_store
+        frame_store.open_reader()
+        RiskReportViewer(
+            self,
+            self.analysis_results,
+            read_frame=frame_store.get,
+            results_lock=self.analysis_results_lock,
+            icon_path=self._get_icon_path(),
+            on_close=frame_store.close_reader
         )
-        title_label.pack(pady=10)
-        
-        # 创建左右分栏的容器
-        content_frame = ttk.Frame(report_frame)
-        content_frame.pack(fill=tk.BOTH, expand=True, pady=(10, 0))
-        
-        # 左侧列表区域
-        list_frame = ttk.Frame(content_frame)
-        list_frame.pack(side=tk.LEFT, fill=tk.BOTH, expand=True, padx=(0, 10))
-        
-        # 创建风险列表（使用Treeview实现表格效果）
-        columns = ('时间点', '风险类型', '详细说明')
-        tree = ttk.Treeview(list_frame, columns=columns, show='headings')
-        
-        # 设置列标题和宽度
-        tree.heading('时间点', text='时间点')
-        tree.heading('风险类型', text='风险类型')
-        tree.heading('详细说明', text='详细说明')
-        
-        tree.column('时间点', width=100)
-        tree.column('风险类型', width=100)
-        tree.column('详细说明', width=200)
-        
-        # 添加滚动条
-        scrollbar = ttk.Scrollbar(list_frame, orient=tk.VERTICAL, command=tree.yview)
-        tree.configure(yscrollcommand=scrollbar.set)
-        
-        # 放置树形视图和滚动条
-        tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
-        scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
-        
-        # 右侧预览区域
-        preview_frame = ttk.LabelFrame(content_frame, text="图片预览")
-        preview_frame.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
-        
-        # 预览内容容器
-        preview_content = ttk.Frame(preview_frame)
-        preview_content.pack(fill=tk.BOTH, expand=True, padx=10, pady=5)
-        
-        # 用于显示选中图片的标签
-        preview_label = ttk.Label(preview_content)
-        preview_label.pack(pady=5)
-        
-        # 修改风险详情标签的显示方式
-        detail_label = ttk.Label(
-            preview_content, 
-            wraplength=300,  # 调整文字换行宽度
-            justify='left',  # 文字左对齐
-            anchor='w'  # 整体左对齐
-        )
-        detail_label.pack(fill=tk.X, pady=5)
-        
-        # 填充风险数据
-        risk_items = []
-        for image_path, result in self.analysis_results.items():
-            if not result.get('is_safe', True):
-                # 从文件名提取时间点
-                time_str = os.path.basename(image_path).replace('.jpg', '')
-                risk_items.append({
-                    'time': time_str,
-                    'path': image_path,
-                    'risk_type': result.get('risk_type', '未知风险'),
-                    'description': result.get('description', '无详细说明')
-                })
-        
-        # 按时间排序
-        risk_items.sort(key=lambda x: x['time'])
-        
-        # 添加到树形视图
-        for item in risk_items:
-            tree.insert('', tk.END, values=(
-                item['time'],
-                item['risk_type'],
-                item['description']
-            ), tags=(item['path'],))
-        
-        # 修改选择事件处理
-        def on_select(event):
-            selected = tree.selection()
-            if selected:
-                item = tree.item(selected[0])
-                path = tree.item(selected[0])['tags'][0]
-                
-                # 显示图片
-                img = Image.open(path)
-                # 调整图片大小
-                img.thumbnail((400, 300))
-                photo = ImageTk.PhotoImage(img)
-                preview_label.configure(image=photo)
-                preview_label.image = photo  # 保持引用
-                
-                # 显示详细信息
-                result = self.analysis_results[path]
-                detail_text = f"风险类型：{result['risk_type']}\n\n详细说明：{result['description']}"
-                detail_label.configure(text=detail_text)
-                
-                # 确保标签完全展示
-                preview_frame.update_idletasks()
-        
-        tree.bind('<<TreeviewSelect>>', on_select)
 
     def _auto_export_report(self):
-        """自动导出风险报告"""
+        """自动导出风险报告
+
+        报告在分析过程中已逐条写入磁盘，这里只更新界面状态。
+        """
         try:
-            # 获取第一个处理过的文件所在目录作为基准目录
-            if not self.processed_files:
+            if not self.report_writer:
                 print("错误：没有可用的图片数据")
                 return
             
-            base_dir = os.path.dirname(self.processed_files[0])
-            
-            # 使用固定的报告文件名
-            file_path = os.path.join(base_dir, "安全分析报告.html")
-            report_dir = os.path.join(base_dir, "report_files")
-            
-            # 创建报告目录（如果已存在则先删除）
-            if os.path.exists(report_dir):
-                shutil.rmtree(report_dir)
-            os.makedirs(report_dir)
-            
-            # 复制风险图片到报告目录并收集风险项
-            risk_items = []
-            for image_path, result in self.analysis_results.items():
-                if not result.get('is_safe', True):
-                    # 复制图片
-                    new_image_path = os.path.join(report_dir, os.path.basename(image_path))
-                    shutil.copy2(image_path, new_image_path)
-                    
-                    risk_items.append({
-                        'time': os.path.basename(image_path).replace('.jpg', ''),
-                        'image': os.path.basename(image_path),
-                        'risk_type': result.get('risk_type', '未知风险'),
-                        'description': result.get('description', '无详细说明')
-                    })
+            base_dir = self.report_writer.base_dir
             
+            file_path = self.report_writer.finish()
             # 如果没有风险项，不生成报告
-            if not risk_items:
+            if not file_path:
                 return
-
-            # 生成HTML报告
-            html_content = f"""
-            <html>
-            <head>
-                <meta charset="utf-8">
-                <style>
-                    body {{ font-family:Arial,sans-serif;margin:20px; }}
-                    h1 {{ text-align:center; color:#333; }}
-                    p {{ text-align:center; color:#666; }}
-                    .risk-list {{ display:flex; flex-wrap:wrap; justify-content:flex-start; }}
-                    .risk-item {{ width:calc(16.666% - 20px);margin-bottom:30px;border:1px solid #ccc;border-radius:5px;padding:10px;box-sizing:border-box;box-shadow:0 2px 4px rgba(0,0,0,0.1);margin-right:20px; }}
-                    .risk-item:nth-child(6n) {{ margin-right:0; }}
-                    .risk-image {{ max-width:100%; height:auto; display:block; margin:0 auto; }}
-                    .risk-info {{ margin-top: 10px; }}
-                    .risk-type {{ color: red; font-weight: bold; }}
-                </style>
-            </head>
-            <body>
-                <h1>视频安全分析风险报告</h1>
-                <p>生成时间：{time.strftime('%Y-%m-%d %H:%M:%S')}</p>
-                <div class="risk-list">
-            """
-            
-            for item in sorted(risk_items, key=lambda x: x['time']):
-                html_content += f"""
-                    <div class="risk-item">
-                        <h3>时间点：{item['time']}</h3>
-                        <img class="risk-image" src="{os.path.basename(report_dir)}/{item['image']}">
-                        <div class="risk-info">
-                            <p class="risk-type">风险类型：{item['risk_type']}</p>
-                            <p>详细说明：{item['description']}</p>
-                        </div>
-                    </div>
-                """
-            
-            html_content += """
-                </div>
-            </body>
-            </html>
-            """
-            
-            # 保存HTML文件
-            with open(file_path, 'w', encoding='utf-8') as f:
-                f.write(html_content)
             
             # 保存当前输出目录路径
             self.current_output_dir = base_dir
@@ -1218,38 +1435,9 @@ class VideoAnalyzer(tk.Tk):
 
     def _get_ffmpeg_path(self):
         """获取 ffmpeg 可执行文件路径"""
-        try:
-            # 如果是打包后的程序，优先使用打包的 ffmpeg
-            if getattr(sys, 'frozen', False):
-                if hasattr(sys, '_MEIPASS'):
-                    # PyInstaller 打包环境
-                    bundled_ffmpeg = os.path.join(sys._MEIPASS, 'bin', 'ffmpeg.exe')
-                else:
-                    # 其他打包环境
-                    bundled_ffmpeg = os.path.join(os.path.dirname(sys.executable), 'bin', 'ffmpeg.exe')
-            else:
-                # 开发环境
-                bundled_ffmpeg = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'bin', 'ffmpeg.exe')
-            
-            if os.path.exists(bundled_ffmpeg):
-                return bundled_ffmpeg
-            
-            # 如果找不到打包的 ffmpeg，尝试系统路径（这部分代码可以保留但不会被使用）
-            if os.name == 'nt':
-                result = subprocess.run(['where', 'ffmpeg'], 
-                                     capture_output=True, 
-                                     text=True)
-                if result.returncode == 0:
-                    return 'ffmpeg'
-            else:
-                result = subprocess.run(['which', 'ffmpeg'], 
-                                     capture_output=True, 
-                                     text=True)
-                if result.returncode == 0:
-                    return 'ffmpeg'
-                
-        except Exception as e:
-            print(f"Error finding ffmpeg: {e}")
+        ffmpeg_path = find_ffmpeg()
+        if ffmpeg_path:
+            return ffmpeg_path
         
         # 如果找不到 ffmpeg，显示错误消息并退出程序
         messagebox.showerror(
@@ -1326,10 +1514,10 @@ class VideoAnalyzer(tk.Tk):
         about_window.resizable(False, False)
         
         # 设置子窗口图标
-        self.createTempLogo()
-        about_window.iconbitmap("temp.ico")  # 设置窗口图标
-        if os.path.exists("temp.ico"):
-            os.remove("temp.ico")  # 删除临时图标文件
+        try:
+            about_window.iconbitmap(self._get_icon_path())  # 设置窗口图标
+        except tk.TclError:
+            pass
         
         # 设置模态对话框
         about_window.transient(self)
@@ -1395,17 +1583,33 @@ class VideoAnalyzer(tk.Tk):
         about_window.geometry(f'+{x}+{y}')
 
     def destroy(self):
+        # 关闭程序时终止仍在运行的任务
+        if getattr(self, 'current_job', None):
+            self.current_job.cancel()
+        if hasattr(self, 'ui_events'):
+            self.ui_events.stop()
+        if hasattr(self, 'frame_pool'):
+            self.frame_pool.shutdown()
+        if getattr(self, 'frame_store', None):
+            self.frame_store.close()
         # 关闭程序时释放socket
         if hasattr(self, 'socket'):
             self.socket.close()
         super().destroy()
 
-    def createTempLogo(self):
-        tmp = open("temp.ico", "wb+")  # 创建temp.ico临时文件
-        tmp.write(base64.b64decode(imgBase64))  # 写入img的base64
-        tmp.close()
+    def _get_icon_path(self):
+        """图标文件只在配置目录中写入一次，各窗口共用"""
+        icon_path = os.path.join(self.config_manager.get_config_dir(), 'logo.ico')
+        if not os.path.exists(icon_path):
+            tmp_path = icon_path + '.part'
+            with open(tmp_path, 'wb') as f:
+                f.write(base64.b64decode(imgBase64))  # 写入img的base64
+            os.replace(tmp_path, icon_path)
+        return icon_path
 
 
 if __name__ == '__main__':
+    # 打包后的程序需要支持进程池子进程的启动
+    multiprocessing.freeze_support()
     app = VideoAnalyzer()
     app.mainloop()
@@ -0,0 +1,235 @@
+"""处理流水线的运行指标
+
+计数器、仪表和耗时分布（p50/p95/p99），线程安全。
+每次处理使用一个 MetricsRegistry，结束时导出为 JSON 和 Prometheus 文本格式。
+"""
+import os
+import json
+import time
+import threading
+from contextlib import contextmanager
+
+
+METRICS_JSON_NAME = "metrics.json"
+METRICS_PROM_NAME = "metrics.prom"
+METRIC_PREFIX = "video_security_"
+
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+class Histogram:
+    """耗时分布：保留最近 max_samples 个样本计算分位数，总数和总和不受样本上限影响"""
+
+    def __init__(self, max_samples=10000):
+        self.max_samples = max_samples
+        self.samples = []
+        self.count = 0
+        self.total = 0.0
+        self._next = 0
+
+    def observe(self, value):
+        self.count += 1
+        self.total += value
+        if len(self.samples) < self.max_samples:
+            self.samples.append(value)
+        else:
+            # 环形覆盖最早的样本
+            self.samples[self._next] = value
+            self._next = (self._next + 1) % self.max_samples
+
+    def quantiles(self):
+        if not self.samples:
+            return {q: 0.0 for q in QUANTILES}
+        ordered = sorted(self.samples)
+        last = len(ordered) - 1
+        return {q: ordered[min(last, int(round(q * last)))] for q in QUANTILES}
+
+    def to_dict(self):
+        result = {'count': self.count, 'sum': round(self.total, 6)}
+        for q, value in self.quantiles().items():
+            result[f'p{int(q * 100)}'] = round(value, 6)
+        return result
+
+
+class MetricsRegistry:
+    """一次处理的全部指标"""
+
+    def __init__(self):
+        self.started_at = time.time()
+        self._counters = {}
+        self._gauges = {}
+        self._histograms = {}
+        self._help = {}
+        self._lock = threading.Lock()
+
+    def describe(self, name, text):
+        self._help[name] = text
+
+    def inc(self, name, value=1):
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def set(self, name, value):
+        with self._lock:
+            self._gauges[name] = value
+
+    def observe(self, name, value):
+        with self._lock:
+            histogram = self._histograms.get(name)
+            if histogram is None:
+                histogram = self._histograms[name] = Histogram()
+            histogram.observe(value)
+
+    @contextmanager
+    def time(self, name):
+        """记录代码块耗时（秒）"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started)
+
+    def counter(self, name):
+        with self._lock:
+            return self._counters.get(name, 0)
+
+    def gauge(self, name):
+        with self._lock:
+            return self._gauges.get(name)
+
+    def quantile(self, name, q):
+        with self._lock:
+            histogram = self._histograms.get(name)
+            return histogram.quantiles().get(q, 0.0) if histogram else 0.0
+
+    def ratio(self, numerator, denominator_extra):
+        """numerator / (numerator + denominator_extra)，用于命中率"""
+        hits = self.counter(numerator)
+        total = hits + self.counter(denominator_extra)
+        return hits / total if total else 0.0
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'started_at': self.started_at,
+                'elapsed': round(time.time() - self.started_at, 3),
+                'counters': dict(self._counters),
+                'gauges': dict(self._gauges),
+                'histograms': {name: h.to_dict() for name, h in self._histograms.items()},
+            }
+
+    def to_json(self):
+        return json.dumps(self.snapshot(), ensure_ascii=False, indent=2)
+
+    def to_prometheus(self):
+        """Prometheus 文本格式：计数器、仪表，耗时分布导出为 summary"""
+        snapshot = self.snapshot()
+        lines = []
+
+        def header(name, kind):
+            full_name = METRIC_PREFIX + name
+            if name in self._help:
+                lines.append(f"# HELP {full_name} {self._help[name]}")
+            lines.append(f"# TYPE {full_name} {kind}")
+            return full_name
+
+        for name, value in sorted(snapshot['counters'].items()):
+            full_name = header(name, 'counter')
+            lines.append(f"{full_name} {value}")
+        for name, value in sorted(snapshot['gauges'].items()):
+            if isinstance(value, (int, float)):
+                full_name = header(name, 'gauge')
+                lines.append(f"{full_name} {value}")
+        for name, data in sorted(snapshot['histograms'].items()):
+            full_name = header(name, 'summary')
+            for q in QUANTILES:
+                lines.append(f'{full_name}{{quantile="{q}"}} {data[f"p{int(q * 100)}"]}')
+            lines.append(f"{full_name}_sum {data['sum']}")
+            lines.append(f"{full_name}_count {data['count']}")
+        return '\n'.join(lines) + '\n'
+
+    def export(self, directory):
+        """写出 metrics.json 和 metrics.prom，返回两个文件路径"""
+        json_path = os.path.join(directory, METRICS_JSON_NAME)
+        prom_path = os.path.join(directory, METRICS_PROM_NAME)
+        with open(json_path, 'w', encoding='utf-8') as f:
+            f.write(self.to_json())
+        with open(prom_path, 'w', encoding='utf-8') as f:
+            f.write(self.to_prometheus())
+        return json_path, prom_path
+
+
+def sample_derived_metrics(registry):
+    """由计数器计算比例类仪表值（缓存命中率、解析失败率、重新分析比例、平均输出 token 数），导出前调用"""
+    registry.set('analysis_cache_hit_rate', round(
+        registry.ratio('analysis_cache_hits_total', 'analysis_cache_misses_total'), 4))
+    parsed = registry.counter('ai_responses_parsed_total')
+    if parsed:
+        registry.set('ai_parse_failure_rate', round(registry.counter('ai_parse_failures_total') / parsed, 4))
+        registry.set('ai_parse_fallback_rate', round(registry.counter('ai_parse_fallback_total') / parsed, 4))
+    low_res = registry.counter('ai_low_res_total')
+    if low_res:
+        registry.set('ai_reanalysis_rate', round(registry.counter('ai_reanalyzed_total') / low_res, 4))
+    with_usage = registry.counter('ai_responses_with_usage_total')
+    if with_usage:
+        registry.set('ai_output_tokens_avg', round(registry.counter('ai_output_tokens_total') / with_usage, 1))
+
+
+def describe_pipeline_metrics(registry):
+    """流水线各阶段指标的说明（导出到 Prometheus 的 HELP）"""
+    for name, text in {
+        'frames_extracted_total': 'Keyframes extracted by ffmpeg',
+        'frame_bytes_total': 'Encoded keyframe bytes read from ffmpeg',
+        'ffmpeg_wait_seconds_total': 'Time blocked waiting for ffmpeg output (decode + scene scoring)',
+        'extraction_fps': 'Keyframes extracted per second of wall time',
+        'frame_persist_seconds': 'Time to write a keyframe to disk or the frame pack',
+        'thumbnail_seconds': 'Thumbnail generation time in the worker pool',
+        'ui_event_queue_depth': 'UI events drained in the latest tick',
+        'pending_analysis': 'Frames waiting for AI analysis',
+        'frame_store_memory_bytes': 'Keyframe bytes held in memory',
+        'ai_requests_total': 'AI API requests sent',
+        'ai_request_seconds': 'AI API request latency',
+        'ai_retries_total': 'AI API retries',
+        'ai_rate_limited_total': 'AI API responses with HTTP 429',
+        'ai_sensitive_total': 'AI API requests rejected as sensitive content (HTTP 400)',
+        'ai_errors_total': 'AI API requests that failed',
+        'ai_upload_bytes_total': 'Base64 image bytes uploaded to the AI API',
+        'ai_hedged_total': 'Duplicate requests sent to a second provider after the p95 latency',
+        'ai_hedge_wins_total': 'Hedged requests answered before the original',
+        'ai_failover_total': 'Requests resent to another provider after a failure',
+        'ai_keys_active': 'API keys still in use (keys are dropped on billing or auth errors)',
+        'ai_keys_disabled_total': 'API keys dropped after billing or auth errors',
+        'ai_errors_rate_limited_total': 'AI API errors classified as rate limiting',
+        'ai_errors_billing_total': 'AI API errors classified as billing (account in arrears)',
+        'ai_errors_auth_total': 'AI API errors classified as authentication failures',
+        'ai_errors_sensitive_total': 'AI API errors classified as sensitive content',
+        'ai_errors_server_total': 'AI API errors classified as server failures (5xx, 408)',
+        'ai_errors_network_total': 'AI API errors without a response (connection dropped, timeout)',
+        'ai_errors_bad_response_total': 'AI API responses that were not valid JSON',
+        'ai_errors_client_total': 'AI API errors classified as other client errors (4xx)',
+        'ai_circuit_opened_total': 'Times a provider circuit breaker opened after repeated failures',
+        'ai_circuit_waits_total': 'Requests paused because every provider circuit was open',
+        'ai_circuit_wait_seconds': 'Time requests waited for a provider to recover',
+        'ai_parse_failures_total': 'AI responses that could not be parsed',
+        'ai_parse_fallback_total': 'AI responses that did not match the compact verdict schema',
+        'ai_parse_fallback_seconds': 'Time spent in the lenient fallback parser',
+        'ai_responses_parsed_total': 'AI responses passed to the verdict parser',
+        'ai_parse_failure_rate': 'Share of AI responses that could not be parsed',
+        'ai_parse_fallback_rate': 'Share of AI responses that needed the fallback parser',
+        'ai_output_tokens_total': 'Completion tokens reported by the AI API',
+        'ai_responses_with_usage_total': 'AI responses that reported token usage',
+        'ai_output_tokens_avg': 'Average completion tokens per AI response',
+        'ai_prompt_tokens_total': 'Prompt tokens reported by the AI API, including hedged duplicates',
+        'ai_cost_yuan_total': 'AI API spend in yuan at the configured token prices',
+        'ai_budget_throttled_total': 'Requests sent one at a time because spend neared a budget',
+        'ai_budget_exceeded_total': 'Requests not sent because a spend budget was reached',
+        'ai_low_res_total': 'Frames analyzed at reduced resolution first',
+        'ai_reanalyzed_total': 'Frames re-analyzed at full resolution',
+        'ai_reanalysis_audits_total': 'Confident low-resolution verdicts re-analyzed as a calibration sample',
+        'ai_reanalysis_flips_total': 'Re-analyzed frames whose verdict changed at full resolution',
+        'ai_reanalysis_rate': 'Share of low-resolution verdicts re-analyzed at full resolution',
+        'analysis_cache_hits_total': 'Analysis results served from the cache',
+        'analysis_cache_misses_total': 'Analysis cache misses',
+        'analysis_cache_hit_rate': 'Analysis cache hit rate',
+    }.items():
+        registry.describe(name, text)
@@ -0,0 +1,454 @@
+"""本地模拟AI服务
+
+模拟智谱 chat-completions 接口（POST .../chat/completions），用于基准测试和离线压测，
+不需要API密钥，也不消耗额度。在“软件设置”的接口地址中填入本服务地址即可使用。
+
+可以按比例注入线上出现过的各种情况：
+    - 响应延迟（固定、正态、对数正态、指数、均匀分布）
+    - 429 并发限制（带 Retry-After），超过 --max-concurrency 时也返回 429
+    - 400 敏感内容（智谱错误码 1301）
+    - 500 服务端错误
+    - 模型返回格式错误的 JSON
+    - 不返回响应直接断开连接
+也可以用脚本文件按请求顺序指定每个请求的结果（JSON 数组），例如：
+    [
+      {"verdict": {"is_safe": false, "risk_type": "暴力", "description": "打斗场面"}},
+      {"status": 429, "retry_after": 2},
+      {"status": 429, "code": "1113", "message": "您的账户已欠费，请充值后重试。"},
+      {"status": 400},
+      {"malformed": "这张图片是安全的 {is_safe: true"},
+      {"raw_body": "{not json"},
+      {"drop": true},
+      {"latency_ms": 5000}
+    ]
+脚本用完后按 --script-cycle 循环，或回到按比例随机注入。
+判定结果缺省由图片内容的哈希决定，同一张图片每次得到相同的结果。
+提示词要求紧凑格式（{"v":3,...}）时按紧凑格式回复，否则按旧的 is_safe / risk_type / description 格式回复；
+usage 中的 token 数按文字长度和图片大小粗略估算，超过请求的 max_tokens 时截断内容。
+
+接口：
+    POST .../chat/completions   返回与智谱接口格式相同的响应
+    GET  .../models             模型列表（OpenAI 兼容接口）
+    GET  /stats                 请求统计
+    POST /reset                 清空统计并从头执行脚本
+
+用法：
+    python mock_ai_server.py --port 8780 --latency-ms 800 --jitter-ms 200 --latency-dist lognormal
+    python mock_ai_server.py --rate-limit-rate 0.05 --retry-after 2 --max-concurrency 5
+    python mock_ai_server.py --script failures.json --script-cycle
+"""
+import json
+import math
+import time
+import random
+import hashlib
+import base64
+import binascii
+import argparse
+import threading
+from io import BytesIO
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+
+RISK_TYPES = ['暴力', '恐怖', '政治', '地图']
+# 紧凑判定格式的风险代码
+COMPACT_RISK_CODES = {'暴力': 'V', '恐怖': 'T', '政治': 'P', '地球': 'G', '地图': 'M'}
+
+LATENCY_DISTRIBUTIONS = ('fixed', 'normal', 'lognormal', 'exponential', 'uniform')
+
+SENSITIVE_MESSAGE = "系统检测到输入或生成内容可能包含不安全或敏感内容，请您避免输入易产生敏感内容的提示语，感谢您的配合。"
+
+# 模型偶尔返回的几种无法直接按 JSON 解析的内容
+MALFORMED_CONTENTS = [
+    "{is_safe: true, risk_type: 无, description: 画面正常}",
+    "```json\n{\"is_safe\": false, \"risk_type\": \"暴力\", \"description\": \"画面中有打斗\"",
+    "这张图片内容安全，适合儿童观看。",
+    "{'is_safe': 'false', 'risk_type': '恐怖', 'description': '阴暗场景'}",
+]
+
+
+class MockAIState:
+    """模拟服务的配置与请求统计"""
+
+    def __init__(self, latency_ms=500, jitter_ms=0, latency_dist='normal', error_rate=0.0,
+                 rate_limit_rate=0.0, retry_after=1, sensitive_rate=0.0, malformed_rate=0.0,
+                 drop_rate=0.0, max_concurrency=None, risk_rate=0.1, script=None,
+                 script_cycle=False, seed=None):
+        if latency_dist not in LATENCY_DISTRIBUTIONS:
+            raise ValueError(f"未知的延迟分布: {latency_dist}")
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.latency_dist = latency_dist
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.retry_after = retry_after
+        self.sensitive_rate = sensitive_rate
+        self.malformed_rate = malformed_rate
+        self.drop_rate = drop_rate
+        self.max_concurrency = max_concurrency
+        self.risk_rate = risk_rate
+        self.script = list(script or [])
+        self.script_cycle = script_cycle
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.requests = 0
+            self.errors = 0
+            self.in_flight = 0
+            self.max_in_flight = 0
+            self.upload_bytes = 0
+            self.outcomes = {}
+
+    def stats(self):
+        with self.lock:
+            return {
+                'requests': self.requests,
+                'errors': self.errors,
+                'in_flight': self.in_flight,
+                'max_in_flight': self.max_in_flight,
+                'upload_bytes': self.upload_bytes,
+                'outcomes': dict(self.outcomes),
+            }
+
+    def _latency(self):
+        mean, jitter = self.latency_ms, self.jitter_ms
+        if self.latency_dist == 'fixed' or mean <= 0:
+            value = mean
+        elif self.latency_dist == 'normal':
+            value = self.random.gauss(mean, jitter)
+        elif self.latency_dist == 'lognormal':
+            # 按给定的均值和标准差换算对数正态分布的参数，长尾明显
+            sigma2 = math.log(1 + (jitter / mean) ** 2)
+            value = self.random.lognormvariate(math.log(mean) - sigma2 / 2, math.sqrt(sigma2))
+        elif self.latency_dist == 'exponential':
+            value = self.random.expovariate(1 / mean)
+        else:
+            value = self.random.uniform(mean - jitter, mean + jitter)
+        return max(0.0, value) / 1000
+
+    def _random_outcome(self):
+        roll = self.random.random()
+        for kind, rate in (('drop', self.drop_rate), ('rate_limited', self.rate_limit_rate),
+                           ('sensitive', self.sensitive_rate), ('error', self.error_rate),
+                           ('malformed', self.malformed_rate)):
+            if roll < rate:
+                return {kind: True}
+            roll -= rate
+        return {}
+
+    def begin(self, size):
+        """登记一个请求，返回 (延迟秒数, 本次请求的结果描述)"""
+        with self.lock:
+            index = self.requests
+            self.requests += 1
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+            self.upload_bytes += size
+            if self.script and (self.script_cycle or index < len(self.script)):
+                outcome = dict(self.script[index % len(self.script)])
+            else:
+                outcome = self._random_outcome()
+            if self.max_concurrency and self.in_flight > self.max_concurrency and not outcome:
+                outcome = {'rate_limited': True}
+            latency = outcome['latency_ms'] / 1000 if 'latency_ms' in outcome else self._latency()
+            kind = self.outcome_kind(outcome)
+            self.outcomes[kind] = self.outcomes.get(kind, 0) + 1
+            if kind not in ('ok', 'malformed'):
+                self.errors += 1
+        return latency, outcome
+
+    @staticmethod
+    def outcome_kind(outcome):
+        if outcome.get('drop'):
+            return 'drop'
+        if outcome.get('rate_limited') or outcome.get('status') == 429:
+            return 'rate_limited'
+        if outcome.get('sensitive') or outcome.get('status') == 400:
+            return 'sensitive'
+        if outcome.get('error') or outcome.get('status', 200) >= 400:
+            return 'error'
+        if outcome.get('malformed') or 'raw_body' in outcome:
+            return 'malformed'
+        return 'ok'
+
+    def end(self):
+        with self.lock:
+            self.in_flight -= 1
+
+    def verdict(self, image):
+        """按图片内容确定判定结果，同一画面的不同分辨率得到相同的判定"""
+        digest = hashlib.sha1(_image_key(image)).digest()
+        # 大多数画面置信度 70-99，约十分之一为 40-69，用于测试低置信度帧的重新分析
+        confidence = (70 if digest[6] % 10 else 40) + digest[5] % 30
+        if int.from_bytes(digest[:4], 'big') % 10000 < self.risk_rate * 10000:
+            return {
+                'is_safe': False,
+                'risk_type': RISK_TYPES[digest[4] % len(RISK_TYPES)],
+                'description': '模拟服务判定的风险内容',
+                'confidence': confidence
+            }
+        return {'is_safe': True, 'risk_type': '', 'description': '模拟服务判定为安全', 'confidence': confidence}
+
+    def malformed_content(self):
+        with self.lock:
+            return self.random.choice(MALFORMED_CONTENTS)
+
+
+def _image_key(image):
+    """图片的内容标识：能解码时用缩小到 8x8 的灰度均值哈希（不随分辨率变化），否则用原始字符串"""
+    if Image is not None:
+        try:
+            data = base64.b64decode(image.split(',', 1)[-1], validate=False)
+            img = Image.open(BytesIO(data))
+            img.draft('L', (64, 64))
+            pixels = list(img.convert('L').resize((8, 8)).getdata())
+            mean = sum(pixels) / len(pixels)
+            return bytes(1 if p > mean else 0 for p in pixels)
+        except (binascii.Error, OSError, ValueError):
+            pass
+    return image.encode('utf-8')
+
+
+def _part_from_request(data, part_type):
+    for message in data.get('messages') or []:
+        content = message.get('content')
+        if isinstance(content, list):
+            for part in content:
+                if part.get('type') == part_type:
+                    return part
+    return {}
+
+
+def _image_from_request(data):
+    return (_part_from_request(data, 'image_url').get('image_url') or {}).get('url') or ''
+
+
+def _prompt_from_request(data):
+    return _part_from_request(data, 'text').get('text') or ''
+
+
+def estimate_tokens(text):
+    """粗略估算 token 数：非 ASCII 字符每个 1 个，ASCII 字符每 4 个 1 个"""
+    non_ascii = sum(1 for ch in text if ord(ch) > 127)
+    return non_ascii + (len(text) - non_ascii + 3) // 4
+
+
+def image_tokens(image):
+    """按 base64 图片大小粗略估算图片占用的 token 数"""
+    return 64 + len(image) // 750
+
+
+def compact_verdict(verdict):
+    """把 is_safe / risk_type / description 格式的判定转换为紧凑格式"""
+    is_safe = bool(verdict.get('is_safe', True))
+    return {
+        'v': 3,
+        's': 1 if is_safe else 0,
+        'r': 'N' if is_safe else COMPACT_RISK_CODES.get(verdict.get('risk_type'), 'O'),
+        'c': verdict.get('confidence', 90),
+        'd': (verdict.get('description') or '')[:20],
+    }
+
+
+def completion_response(model, content, prompt_tokens=0, max_tokens=None):
+    finish_reason = 'stop'
+    completion_tokens = estimate_tokens(content)
+    if max_tokens and completion_tokens > max_tokens:
+        # 输出达到 max_tokens 时模型停止生成，内容不完整
+        while content and estimate_tokens(content) > max_tokens:
+            content = content[:-1]
+        completion_tokens = estimate_tokens(content)
+        finish_reason = 'length'
+    return {
+        'id': f'mock-{time.time_ns()}',
+        'created': int(time.time()),
+        'model': model,
+        'choices': [{
+            'index': 0,
+            'finish_reason': finish_reason,
+            'message': {'role': 'assistant', 'content': content}
+        }],
+        'usage': {
+            'prompt_tokens': prompt_tokens,
+            'completion_tokens': completion_tokens,
+            'total_tokens': prompt_tokens + completion_tokens
+        }
+    }
+
+
+def error_response(code, message):
+    return {'error': {'code': code, 'message': message}}
+
+
+class MockAIRequestHandler(BaseHTTPRequestHandler):
+    """模拟服务的HTTP接口"""
+
+    server_version = "MockAI/1.0"
+    protocol_version = "HTTP/1.1"  # 支持客户端保持连接
+
+    @property
+    def state(self):
+        return self.server.state
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_body(self, status, body, headers=None):
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_json(self, status, data, headers=None):
+        self._send_body(status, json.dumps(data, ensure_ascii=False).encode('utf-8'), headers)
+
+    def do_GET(self):
+        path = urlparse(self.path).path
+        if path == '/stats':
+            self._send_json(200, self.state.stats())
+        elif path.endswith('/models'):
+            # OpenAI 兼容接口的模型列表，客户端预热连接时使用
+            self._send_json(200, {'object': 'list', 'data': [{'id': 'mock', 'object': 'model'}]})
+        else:
+            self._send_json(404, {'error': 'not found'})
+
+    def do_POST(self):
+        path = urlparse(self.path).path
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length) if length else b''
+        if path == '/reset':
+            self.state.reset()
+            self._send_json(200, self.state.stats())
+            return
+        if not path.endswith('/chat/completions'):
+            self._send_json(404, {'error': 'not found'})
+            return
+        try:
+            data = json.loads(body.decode('utf-8') or '{}')
+        except (ValueError, UnicodeDecodeError):
+            self._send_json(400, error_response('1214', 'invalid json'))
+            return
+
+        latency, outcome = self.state.begin(len(body))
+        try:
+            time.sleep(latency)
+            self._respond(data, outcome)
+        finally:
+            self.state.end()
+
+    def _respond(self, data, outcome):
+        kind = self.state.outcome_kind(outcome)
+        if kind == 'drop':
+            # 不返回任何响应直接断开
+            self.close_connection = True
+            return
+        if kind == 'rate_limited':
+            retry_after = outcome.get('retry_after', self.state.retry_after)
+            self._send_json(
+                429,
+                error_response(outcome.get('code', '1302'), outcome.get('message', '您当前使用该API的并发数过高，请降低并发，或联系客服增加限额。')),
+                headers={'Retry-After': str(retry_after)}
+            )
+            return
+        if kind == 'sensitive':
+            self._send_json(400, error_response(outcome.get('code', '1301'), outcome.get('message', SENSITIVE_MESSAGE)))
+            return
+        if kind == 'error':
+            status = outcome.get('status', 500)
+            self._send_json(status, error_response(outcome.get('code', str(status)), outcome.get('message', '模拟的服务端错误')))
+            return
+        if 'raw_body' in outcome:
+            # HTTP 响应体本身不是合法 JSON
+            self._send_body(200, outcome['raw_body'].encode('utf-8'))
+            return
+        image = _image_from_request(data)
+        prompt = _prompt_from_request(data)
+        if outcome.get('malformed'):
+            content = outcome['malformed'] if isinstance(outcome['malformed'], str) else self.state.malformed_content()
+        else:
+            verdict = outcome.get('verdict') or self.state.verdict(image)
+            if '"v":' in prompt and 'is_safe' in verdict:
+                verdict = compact_verdict(verdict)
+            elif 'is_safe' in verdict:
+                verdict = {key: value for key, value in verdict.items() if key != 'confidence'}
+            content = json.dumps(verdict, ensure_ascii=False, separators=(',', ':'))
+        prompt_tokens = estimate_tokens(prompt) + image_tokens(image)
+        self._send_json(200, completion_response(data.get('model', 'mock'), content,
+                                                 prompt_tokens, data.get('max_tokens')))
+
+
+def load_script(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        script = json.load(f)
+    if not isinstance(script, list):
+        raise ValueError("脚本文件应为 JSON 数组")
+    return script
+
+
+def create_server(host='127.0.0.1', port=8780, **options):
+    """创建模拟服务（port=0 时由系统分配端口），options 传给 MockAIState"""
+    server = ThreadingHTTPServer((host, port), MockAIRequestHandler)
+    server.daemon_threads = True
+    server.state = MockAIState(**options)
+    return server
+
+
+def start_in_thread(host='127.0.0.1', port=0, **options):
+    """在后台线程中启动模拟服务，返回 (server, base_url)"""
+    server = create_server(host, port, **options)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}/api/paas/v4"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="本地模拟AI服务（智谱 chat-completions 接口）")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8780)
+    parser.add_argument('--latency-ms', type=float, default=500, help="平均响应延迟（毫秒）")
+    parser.add_argument('--jitter-ms', type=float, default=0, help="延迟的标准差（毫秒）")
+    parser.add_argument('--latency-dist', choices=LATENCY_DISTRIBUTIONS, default='normal', help="延迟分布")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="返回 HTTP 500 的比例")
+    parser.add_argument('--rate-limit-rate', type=float, default=0.0, help="返回 HTTP 429 的比例")
+    parser.add_argument('--retry-after', type=float, default=1, help="429 响应的 Retry-After（秒）")
+    parser.add_argument('--sensitive-rate', type=float, default=0.0, help="返回 HTTP 400 敏感内容的比例")
+    parser.add_argument('--malformed-rate', type=float, default=0.0, help="模型返回格式错误 JSON 的比例")
+    parser.add_argument('--drop-rate', type=float, default=0.0, help="直接断开连接的比例")
+    parser.add_argument('--max-concurrency', type=int, default=None, help="超过该并发数的请求返回 429")
+    parser.add_argument('--risk-rate', type=float, default=0.1, help="判定为风险的比例")
+    parser.add_argument('--script', default=None, help="按请求顺序指定结果的 JSON 脚本文件")
+    parser.add_argument('--script-cycle', action='store_true', help="脚本用完后从头循环")
+    parser.add_argument('--seed', type=int, default=None)
+    args = parser.parse_args()
+
+    server = create_server(
+        args.host, args.port,
+        latency_ms=args.latency_ms, jitter_ms=args.jitter_ms, latency_dist=args.latency_dist,
+        error_rate=args.error_rate, rate_limit_rate=args.rate_limit_rate, retry_after=args.retry_after,
+        sensitive_rate=args.sensitive_rate, malformed_rate=args.malformed_rate, drop_rate=args.drop_rate,
+        max_concurrency=args.max_concurrency, risk_rate=args.risk_rate,
+        script=load_script(args.script) if args.script else None, script_cycle=args.script_cycle,
+        seed=args.seed
+    )
+    print(f"模拟AI服务已启动: http://{args.host}:{server.server_address[1]}/api/paas/v4")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,269 @@
+import math
+import tkinter as tk
+from tkinter import ttk
+from io import BytesIO
+from collections import OrderedDict
+
+from PIL import Image, ImageTk
+
+
+class ThumbnailCache:
+    """已解码缩略图（PhotoImage）的 LRU 缓存，按估算的内存占用淘汰"""
+
+    def __init__(self, max_bytes=32 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.used_bytes = 0
+        self._items = OrderedDict()  # 索引 -> (PhotoImage, 字节数)
+
+    def get(self, index):
+        item = self._items.get(index)
+        if item is None:
+            return None
+        self._items.move_to_end(index)
+        return item[0]
+
+    def put(self, index, photo, pinned=()):
+        size = photo.width() * photo.height() * 4
+        old = self._items.pop(index, None)
+        if old is not None:
+            self.used_bytes -= old[1]
+        self._items[index] = (photo, size)
+        self.used_bytes += size
+        # 正在显示的缩略图不淘汰，否则对应的标签会变成空白
+        for key in list(self._items):
+            if self.used_bytes <= self.max_bytes:
+                break
+            if key == index or key in pinned:
+                continue
+            self.used_bytes -= self._items.pop(key)[1]
+
+    def clear(self):
+        self._items.clear()
+        self.used_bytes = 0
+
+
+class _PreviewItem:
+    __slots__ = ('key', 'time_str', 'thumbnail', 'status', 'color', 'tooltip')
+
+    def __init__(self, key, time_str, thumbnail, status, color):
+        self.key = key
+        self.time_str = time_str
+        self.thumbnail = thumbnail  # 压缩后的缩略图字节（JPEG）
+        self.status = status
+        self.color = color
+        self.tooltip = None
+
+
+class _Cell:
+    """一个可复用的预览格子：图片、时间码、分析状态"""
+
+    def __init__(self, grid):
+        self.frame = ttk.Frame(grid.canvas)
+        self.frame.pack_propagate(False)
+        self.image_label = ttk.Label(self.frame, anchor='center')
+        self.image_label.pack(pady=(0, 2))
+        self.time_label = ttk.Label(self.frame)
+        self.time_label.pack()
+        self.status_label = ttk.Label(self.frame, text="")
+        self.status_label.pack()
+        self.window = grid.canvas.create_window(0, 0, window=self.frame, anchor='nw', state='hidden')
+        self.index = None
+        self.status_label.bind('<Enter>', lambda e: grid._on_status_enter(e, self))
+        self.status_label.bind('<Leave>', lambda e: grid._on_status_leave())
+
+
+class VirtualPreviewGrid(ttk.Frame):
+    """虚拟化的关键帧预览网格
+
+    只为可见行（上下各多留 buffer_rows 行）创建控件，滚动时复用这些格子，
+    长视频提取出上千个关键帧时控件数量和内存占用保持不变。
+    缩略图以压缩字节保存，显示时才解码为 PhotoImage，解码结果放在有内存上限的 LRU 缓存中。
+    """
+
+    def __init__(self, master, columns=6, thumb_width=160, thumb_height=90,
+                 buffer_rows=2, cache_bytes=32 * 1024 * 1024,
+                 show_tooltip=None, hide_tooltip=None, **kwargs):
+        super().__init__(master, **kwargs)
+        self.columns = columns
+        self.thumb_width = thumb_width
+        self.thumb_height = thumb_height
+        self.buffer_rows = buffer_rows
+        self.row_height = thumb_height + 60  # 缩略图 + 时间码 + 状态 + 边距
+        self.show_tooltip = show_tooltip
+        self.hide_tooltip = hide_tooltip
+
+        self.items = []
+        self._index_by_key = {}
+        self._cells = []          # 已创建的全部格子
+        self._bound = {}          # 条目索引 -> 正在显示它的格子
+        self._cache = ThumbnailCache(cache_bytes)
+        self._refresh_pending = False
+
+        self.canvas = tk.Canvas(self, highlightthickness=0, bd=0)
+        self.canvas.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        self.v_scrollbar = ttk.Scrollbar(self, orient="vertical", command=self._on_yview)
+        self.v_scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        self.canvas.configure(yscrollcommand=self.v_scrollbar.set)
+
+        self.canvas.bind('<Configure>', lambda e: self._layout_changed())
+        self.canvas.bind('<Enter>', lambda e: self.canvas.bind_all("<MouseWheel>", self._on_mousewheel))
+        self.canvas.bind('<Leave>', lambda e: self.canvas.unbind_all("<MouseWheel>"))
+
+    def __len__(self):
+        return len(self.items)
+
+    def add_item(self, key, time_str, thumbnail, status="", color=""):
+        """追加一个预览项；thumbnail 为压缩后的缩略图字节"""
+        self.add_items([(key, time_str, thumbnail, status, color)])
+
+    def add_items(self, entries):
+        """批量追加预览项，entries 为 (key, time_str, thumbnail, status, color) 列表
+
+        整批只更新一次滚动区域和可见格子。
+        """
+        if not entries:
+            return
+        follow = self._at_bottom()
+        for key, time_str, thumbnail, status, color in entries:
+            self._index_by_key[key] = len(self.items)
+            self.items.append(_PreviewItem(key, time_str, thumbnail, status, color))
+        self._update_scrollregion()
+        if follow:
+            # 用户停留在底部时自动滚动到最新的图片；向上翻看时不打断
+            self.canvas.yview_moveto(1.0)
+        self._schedule_refresh()
+
+    def set_status(self, key, text, color="", tooltip=None):
+        """更新某一项的分析状态，只有可见时才会触及控件"""
+        index = self._index_by_key.get(key)
+        if index is None:
+            return
+        item = self.items[index]
+        item.status = text
+        item.color = color
+        item.tooltip = tooltip
+        cell = self._bound.get(index)
+        if cell is not None:
+            cell.status_label.config(text=text, foreground=color)
+
+    def clear(self):
+        self.items.clear()
+        self._index_by_key.clear()
+        self._cache.clear()
+        for cell in self._bound.values():
+            self._unbind(cell)
+        self._bound.clear()
+        self.canvas.yview_moveto(0)
+        self._update_scrollregion()
+
+    def _on_yview(self, *args):
+        self.canvas.yview(*args)
+        self._schedule_refresh()
+
+    def _on_mousewheel(self, event):
+        self.canvas.yview_scroll(int(-1 * (event.delta / 60)), "units")
+        self._schedule_refresh()
+
+    def _at_bottom(self):
+        return not self.items or self.canvas.yview()[1] >= 0.999
+
+    def _layout_changed(self):
+        self._update_scrollregion()
+        # 宽度变化后所有格子需要重新定位
+        for index, cell in self._bound.items():
+            self._place(cell, index)
+        self._schedule_refresh()
+
+    def _update_scrollregion(self):
+        rows = math.ceil(len(self.items) / self.columns)
+        width = max(self.canvas.winfo_width(), 1)
+        height = max(rows * self.row_height, self.canvas.winfo_height(), 1)
+        self.canvas.configure(scrollregion=(0, 0, width, height), yscrollincrement=self.row_height // 3)
+
+    def _schedule_refresh(self):
+        # 同一轮事件中的多次滚动/追加合并为一次刷新
+        if not self._refresh_pending:
+            self._refresh_pending = True
+            self.after_idle(self._refresh)
+
+    def _visible_range(self):
+        rows = math.ceil(len(self.items) / self.columns)
+        top = self.canvas.canvasy(0)
+        bottom = top + self.canvas.winfo_height()
+        first_row = max(0, int(top // self.row_height) - self.buffer_rows)
+        last_row = min(rows - 1, int(bottom // self.row_height) + self.buffer_rows)
+        return range(first_row * self.columns, min(len(self.items), (last_row + 1) * self.columns))
+
+    def _refresh(self):
+        self._refresh_pending = False
+        if not self.winfo_exists():
+            return
+        visible = self._visible_range()
+
+        # 回收滚出可见范围的格子
+        for index in list(self._bound):
+            if index not in visible:
+                self._unbind(self._bound.pop(index))
+        free = [cell for cell in self._cells if cell.index is None]
+
+        for index in visible:
+            if index in self._bound:
+                continue
+            cell = free.pop() if free else self._create_cell()
+            self._bind(cell, index)
+
+    def _create_cell(self):
+        cell = _Cell(self)
+        self._cells.append(cell)
+        return cell
+
+    def _place(self, cell, index):
+        width = max(self.canvas.winfo_width(), self.columns) / self.columns
+        row, col = divmod(index, self.columns)
+        self.canvas.coords(cell.window, col * width + 5, row * self.row_height + 5)
+        self.canvas.itemconfigure(cell.window, width=max(int(width) - 10, 1), height=self.row_height - 10)
+
+    def _bind(self, cell, index):
+        item = self.items[index]
+        cell.index = index
+        self._bound[index] = cell
+        cell.image_label.config(image=self._photo(index, item))
+        cell.time_label.config(text=item.time_str)
+        cell.status_label.config(text=item.status, foreground=item.color)
+        self._place(cell, index)
+        self.canvas.itemconfigure(cell.window, state='normal')
+
+    def _unbind(self, cell):
+        cell.index = None
+        cell.image_label.config(image='')
+        self.canvas.itemconfigure(cell.window, state='hidden')
+
+    def _photo(self, index, item):
+        """取缓存中的 PhotoImage，没有时从压缩字节解码"""
+        photo = self._cache.get(index)
+        if photo is not None:
+            return photo
+        if not item.thumbnail:
+            return ''
+        try:
+            img = Image.open(BytesIO(item.thumbnail))
+            if img.height > self.thumb_height:
+                # 竖屏视频的缩略图缩放到格子高度以内
+                img.thumbnail((self.thumb_width, self.thumb_height))
+            photo = ImageTk.PhotoImage(img)
+        except Exception as e:
+            print(f"Error decoding thumbnail {item.key}: {e}")
+            return ''
+        self._cache.put(index, photo, pinned=self._bound)
+        return photo
+
+    def _on_status_enter(self, event, cell):
+        if cell.index is None or not self.show_tooltip:
+            return
+        tooltip = self.items[cell.index].tooltip
+        if tooltip:
+            self.show_tooltip(event, tooltip)
+
+    def _on_status_leave(self):
+        if self.hide_tooltip:
+            self.hide_tooltip()
@@ -0,0 +1,280 @@
+import os
+import glob
+import time
+import shutil
+import threading
+from io import BytesIO
+from html import escape
+
+from PIL import Image
+
+from video_pipeline import frame_time_str, parse_timestamp
+
+
+REPORT_FILE_NAME = "安全分析报告.html"
+REPORT_DIR_NAME = "report_files"
+
+# 报告中的缩略图尺寸和精灵图布局（每张精灵图 10 列 x 5 行）
+THUMB_SIZE = (160, 90)
+SPRITE_COLUMNS = 10
+SPRITE_ROWS = 5
+DEFAULT_PAGE_SIZE = 200
+
+REPORT_HEAD = """
+            <html>
+            <head>
+                <meta charset="utf-8">
+                <style>
+                    body {{ font-family:Arial,sans-serif;margin:20px; }}
+                    h1 {{ text-align:center; color:#333; }}
+                    p {{ text-align:center; color:#666; }}
+                    .risk-list {{ display:flex; flex-wrap:wrap; justify-content:flex-start; }}
+                    .risk-item {{ width:calc(16.666% - 20px);margin-bottom:30px;border:1px solid #ccc;border-radius:5px;padding:10px;box-sizing:border-box;box-shadow:0 2px 4px rgba(0,0,0,0.1);margin-right:20px; }}
+                    .risk-image {{ width:{thumb_width}px; height:{thumb_height}px; object-fit:none; display:block; margin:0 auto; }}
+                    .report-nav a {{ margin:0 10px; }}
+                    .risk-info {{ margin-top: 10px; }}
+                    .risk-type {{ color: red; font-weight: bold; }}
+                </style>
+            </head>
+            <body>
+                <h1>视频安全分析风险报告</h1>
+                <p>生成时间：{generated}</p>
+                <div class="risk-list">
+            """
+
+REPORT_ITEM = """
+                    <div class="risk-item" style="order:{order}">
+                        <h3>时间点：{time}</h3>
+                        <a href="{full}" target="_blank"><img class="risk-image" loading="lazy" src="{src}" style="object-position:{position}" alt="{time}"></a>
+                        <div class="risk-info">
+                            <p class="risk-type">风险类型：{risk_type}</p>
+                            <p>详细说明：{description}</p>
+                        </div>
+                    </div>
+                """
+
+REPORT_TAIL = """
+                </div>
+                {nav}
+            </body>
+            </html>
+            """
+
+
+def collect_risk_items(analysis_results):
+    """从分析结果中筛选风险项，按时间点排序"""
+    risk_items = []
+    for image_path, result in analysis_results.items():
+        if not result.get('is_safe', True):
+            risk_items.append(_risk_item(image_path, result))
+    risk_items.sort(key=lambda x: x['time'])
+    return risk_items
+
+
+def _risk_item(image_path, result):
+    return {
+        'time': frame_time_str(image_path),
+        'path': image_path,
+        'image': os.path.basename(image_path),
+        'risk_type': result.get('risk_type', '未知风险'),
+        'description': result.get('description', '无详细说明')
+    }
+
+
+def _time_order(time_str):
+    """时间码 HH-MM-SS.mmm 转为毫秒，用作 CSS order，报告按时间排序显示"""
+    seconds = parse_timestamp(time_str)
+    return int(round(seconds * 1000)) if seconds is not None else 0
+
+
+def report_page_name(page):
+    """第一页沿用原报告文件名，之后的页加序号"""
+    if page == 1:
+        return REPORT_FILE_NAME
+    name, ext = os.path.splitext(REPORT_FILE_NAME)
+    return f"{name}_{page}{ext}"
+
+
+def link_or_copy(source, target):
+    """优先创建硬链接（不占用额外空间），跨磁盘或不支持时退回复制"""
+    try:
+        os.link(source, target)
+    except OSError:
+        shutil.copy2(source, target)
+
+
+class StreamingReportWriter:
+    """增量写入的HTML风险报告
+
+    每出现一个风险帧就追加一项：新内容覆盖在文档结尾标签的位置，
+    再重新写出结尾标签，磁盘上的报告在任何时刻都是完整可打开的文档。
+    风险项按判定到达的顺序追加，页内显示顺序由 CSS order（时间码毫秒数）决定。
+    第一个风险项出现时才创建报告，没有风险项时不生成任何文件。
+
+    报告只内嵌缩略图：缩略图拼成精灵图，每项用 object-position 显示其中一格，
+    点击后才打开原图；每页超过 page_size 项时另起一页。
+    """
+
+    def __init__(self, base_dir, read_frame=None, page_size=DEFAULT_PAGE_SIZE):
+        self.base_dir = base_dir
+        self.read_frame = read_frame
+        self.page_size = max(1, page_size)
+        self.report_path = os.path.join(base_dir, REPORT_FILE_NAME)
+        self.report_dir = os.path.join(base_dir, REPORT_DIR_NAME)
+        self.count = 0
+        self.page = 0
+        self._page_items = 0
+        self._page_path = None
+        self._paths = set()
+        self._tail_offset = None
+        self._sprite = None
+        self._sprite_index = 0
+        self._sprite_slot = 0
+        self._lock = threading.Lock()
+
+    def add(self, image_path, result):
+        """追加一个分析结果，安全帧直接忽略；返回是否写入了报告"""
+        if result.get('is_safe', True):
+            return False
+        item = _risk_item(image_path, result)
+        with self._lock:
+            if image_path in self._paths:
+                return False
+            if self._tail_offset is None:
+                self._start()
+            elif self._page_items >= self.page_size:
+                self._new_page()
+            data = self._copy_image(item)
+            full_src = f"{REPORT_DIR_NAME}/{item['image']}"
+            try:
+                src, position = self._add_to_sprite(data)
+            except Exception as e:
+                # 无法生成缩略图时直接显示原图
+                print(f"Error creating report thumbnail for {image_path}: {e}")
+                src, position = full_src, 'center'
+            entry = REPORT_ITEM.format(
+                order=_time_order(item['time']),
+                time=escape(item['time']),
+                full=escape(full_src),
+                src=escape(src),
+                position=position,
+                risk_type=escape(str(item['risk_type'])),
+                description=escape(str(item['description']))
+            ).encode('utf-8')
+            with open(self._page_path, 'r+b') as f:
+                # 新内容比原结尾长，直接覆盖结尾标签即可，不需要截断
+                f.seek(self._tail_offset)
+                f.write(entry)
+                f.write(self._tail(self.page, has_next=False))
+            self._tail_offset += len(entry)
+            self._paths.add(image_path)
+            self._page_items += 1
+            self.count += 1
+        return True
+
+    def _start(self):
+        # 创建报告目录（如果已存在则先删除），并清理上次留下的分页
+        if os.path.exists(self.report_dir):
+            shutil.rmtree(self.report_dir)
+        os.makedirs(self.report_dir)
+        name, ext = os.path.splitext(REPORT_FILE_NAME)
+        for old_page in glob.glob(os.path.join(glob.escape(self.base_dir), f"{name}_*{ext}")):
+            os.remove(old_page)
+        self._open_page(1)
+
+    def _new_page(self):
+        # 给上一页补上"下一页"链接，结尾长度可能变化，写完后截断
+        with open(self._page_path, 'r+b') as f:
+            f.seek(self._tail_offset)
+            f.write(self._tail(self.page, has_next=True))
+            f.truncate()
+        self._open_page(self.page + 1)
+
+    def _open_page(self, page):
+        self.page = page
+        self._page_items = 0
+        self._page_path = os.path.join(self.base_dir, report_page_name(page))
+        head = REPORT_HEAD.format(
+            generated=time.strftime('%Y-%m-%d %H:%M:%S'),
+            thumb_width=THUMB_SIZE[0],
+            thumb_height=THUMB_SIZE[1]
+        ).encode('utf-8')
+        tmp_path = self._page_path + '.part'
+        with open(tmp_path, 'wb') as f:
+            f.write(head)
+            f.write(self._tail(page, has_next=False))
+        os.replace(tmp_path, self._page_path)
+        self._tail_offset = len(head)
+
+    @staticmethod
+    def _tail(page, has_next):
+        links = []
+        if page > 1:
+            links.append(f'<a href="{escape(report_page_name(page - 1))}">上一页</a>')
+        if page > 1 or has_next:
+            links.append(f'第 {page} 页')
+        if has_next:
+            links.append(f'<a href="{escape(report_page_name(page + 1))}">下一页</a>')
+        nav = f'<p class="report-nav">{"".join(links)}</p>' if links else ''
+        return REPORT_TAIL.format(nav=nav).encode('utf-8')
+
+    def _copy_image(self, item):
+        """把原图放入报告目录，返回帧内容（用于生成缩略图）"""
+        target_path = os.path.join(self.report_dir, item['image'])
+        if os.path.exists(target_path):
+            os.remove(target_path)
+        if self.read_frame is not None and not os.path.exists(item['path']):
+            data = bytes(self.read_frame(item['path']))
+            with open(target_path, 'wb') as f:
+                f.write(data)
+            return data
+        link_or_copy(item['path'], target_path)
+        with open(target_path, 'rb') as f:
+            return f.read()
+
+    def _add_to_sprite(self, data):
+        """把缩略图放入当前精灵图，返回 (精灵图路径, object-position)"""
+        img = Image.open(BytesIO(data))
+        # JPEG 按 DCT 缩放解码，只需要缩略图大小的像素
+        img.draft('RGB', THUMB_SIZE)
+        img = img.convert('RGB')
+        img.thumbnail(THUMB_SIZE, Image.Resampling.BILINEAR)
+
+        if self._sprite is None or self._sprite_slot >= SPRITE_COLUMNS * SPRITE_ROWS:
+            self._sprite_index += 1
+            self._sprite_slot = 0
+            self._sprite = Image.new('RGB', (THUMB_SIZE[0] * SPRITE_COLUMNS, THUMB_SIZE[1] * SPRITE_ROWS), 'white')
+        row, col = divmod(self._sprite_slot, SPRITE_COLUMNS)
+        # 缩略图在格子中居中
+        x = col * THUMB_SIZE[0] + (THUMB_SIZE[0] - img.width) // 2
+        y = row * THUMB_SIZE[1] + (THUMB_SIZE[1] - img.height) // 2
+        self._sprite.paste(img, (x, y))
+        self._sprite_slot += 1
+
+        sprite_name = f"sprite_{self._sprite_index:03d}.jpg"
+        sprite_path = os.path.join(self.report_dir, sprite_name)
+        tmp_path = sprite_path + '.part'
+        self._sprite.save(tmp_path, 'JPEG', quality=80)
+        os.replace(tmp_path, sprite_path)
+        position = f"-{col * THUMB_SIZE[0]}px -{row * THUMB_SIZE[1]}px"
+        return f"{REPORT_DIR_NAME}/{sprite_name}", position
+
+    def finish(self):
+        """返回报告路径（第一页），没有风险项时返回 None"""
+        with self._lock:
+            return self.report_path if self.count else None
+
+
+def export_risk_report(base_dir, analysis_results, read_frame=None, page_size=DEFAULT_PAGE_SIZE):
+    """一次性导出HTML风险报告
+
+    风险图片链接到 base_dir/report_files，报告写入 base_dir/安全分析报告.html。
+    read_frame(path) 返回帧内容，用于帧不在独立文件中的情况（内存或单文件容器）。
+
+    Returns:
+        str: 报告文件路径，没有风险项时返回 None
+    """
+    writer = StreamingReportWriter(base_dir, read_frame=read_frame, page_size=page_size)
+    for item in collect_risk_items(analysis_results):
+        writer.add(item['path'], analysis_results[item['path']])
+    return writer.finish()
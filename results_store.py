@@ -0,0 +1,425 @@
+"""分析结果的结构化导出
+
+每次处理除HTML报告外，还在关键帧目录下生成：
+    分析结果.jsonl  每个关键帧一行，判定到达时立即追加
+    分析结果.csv    处理结束时按时间排序写出
+并把整次处理写入配置目录下的 SQLite 结果库（results.db），
+按视频、风险类型和时间建立索引，便于跨视频查询。
+
+用法（查询结果库）：
+    python results_store.py query [--video 路径或文件名] [--risk-type 类型] [--risky] [--limit N]
+    python results_store.py runs [--limit N]
+    python results_store.py usage [--by day|video|run] [--limit N]
+"""
+import os
+import csv
+import sys
+import json
+import time
+import uuid
+import sqlite3
+import argparse
+import threading
+
+from video_pipeline import frame_time_str, parse_timestamp
+
+
+RESULTS_JSONL_NAME = "分析结果.jsonl"
+RESULTS_CSV_NAME = "分析结果.csv"
+RESULTS_DB_NAME = "results.db"
+
+CSV_FIELDS = [
+    'time', 'timestamp', 'frame', 'sha1', 'status', 'is_safe',
+    'risk_type', 'description', 'confidence', 'analysis_pass', 'prompt_tokens', 'completion_tokens', 'cost',
+    'elapsed', 'cached', 'error'
+]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_id TEXT PRIMARY KEY,
+    video_path TEXT NOT NULL,
+    video_name TEXT NOT NULL,
+    frames_dir TEXT,
+    sensitivity REAL,
+    status TEXT,
+    started_at REAL,
+    finished_at REAL,
+    frame_count INTEGER,
+    risk_count INTEGER,
+    duration REAL,
+    prompt_tokens INTEGER,
+    completion_tokens INTEGER,
+    cost REAL
+);
+CREATE TABLE IF NOT EXISTS frames (
+    run_id TEXT NOT NULL,
+    video_path TEXT NOT NULL,
+    video_name TEXT NOT NULL,
+    frame TEXT NOT NULL,
+    timestamp REAL,
+    sha1 TEXT,
+    status TEXT,
+    is_safe INTEGER,
+    risk_type TEXT,
+    description TEXT,
+    elapsed REAL,
+    cached INTEGER,
+    error TEXT,
+    confidence REAL,
+    analysis_pass TEXT,
+    prompt_tokens INTEGER,
+    completion_tokens INTEGER,
+    cost REAL,
+    PRIMARY KEY (run_id, frame)
+);
+CREATE INDEX IF NOT EXISTS idx_runs_video ON runs (video_path);
+CREATE INDEX IF NOT EXISTS idx_runs_started ON runs (started_at);
+CREATE INDEX IF NOT EXISTS idx_frames_video ON frames (video_path, timestamp);
+CREATE INDEX IF NOT EXISTS idx_frames_video_name ON frames (video_name);
+CREATE INDEX IF NOT EXISTS idx_frames_risk_type ON frames (risk_type, timestamp);
+CREATE INDEX IF NOT EXISTS idx_frames_time ON frames (timestamp);
+"""
+
+# 旧版本结果库中没有的列，打开时补上
+ADDED_COLUMNS = {
+    'runs': [('duration', 'REAL'), ('prompt_tokens', 'INTEGER'), ('completion_tokens', 'INTEGER'),
+             ('cost', 'REAL')],
+    'frames': [('confidence', 'REAL'), ('analysis_pass', 'TEXT'), ('prompt_tokens', 'INTEGER'),
+               ('completion_tokens', 'INTEGER'), ('cost', 'REAL')],
+}
+RUN_COLUMNS = [
+    'run_id', 'video_path', 'video_name', 'frames_dir', 'sensitivity', 'status', 'started_at',
+    'finished_at', 'frame_count', 'risk_count', 'duration', 'prompt_tokens', 'completion_tokens', 'cost'
+]
+FRAME_COLUMNS = [
+    'run_id', 'video_path', 'video_name', 'frame', 'timestamp', 'sha1', 'status', 'is_safe',
+    'risk_type', 'description', 'elapsed', 'cached', 'error', 'confidence', 'analysis_pass',
+    'prompt_tokens', 'completion_tokens', 'cost'
+]
+# usage 查询的分组方式
+USAGE_GROUPS = {
+    'day': "date(started_at, 'unixepoch', 'localtime')",
+    'video': "video_path",
+    'run': "run_id",
+}
+
+
+class ResultsDatabase:
+    """本地 SQLite 结果库，每次写入使用独立连接，可在任意线程调用"""
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        with self._connect() as conn:
+            conn.executescript(SCHEMA)
+            for table, columns in ADDED_COLUMNS.items():
+                existing = {row['name'] for row in conn.execute(f"PRAGMA table_info({table})")}
+                for name, kind in columns:
+                    if name not in existing:
+                        conn.execute(f"ALTER TABLE {table} ADD COLUMN {name} {kind}")
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def upsert_run(self, run, frames):
+        """写入一次处理及其全部关键帧；同一 run_id 重复写入时覆盖"""
+        conn = self._connect()
+        try:
+            with conn:
+                conn.execute(
+                    f"INSERT OR REPLACE INTO runs ({', '.join(RUN_COLUMNS)}) "
+                    f"VALUES ({', '.join(':' + name for name in RUN_COLUMNS)})",
+                    run
+                )
+                conn.execute("DELETE FROM frames WHERE run_id = ?", (run['run_id'],))
+                conn.executemany(
+                    f"INSERT INTO frames ({', '.join(FRAME_COLUMNS)}) "
+                    f"VALUES ({', '.join(':' + name for name in FRAME_COLUMNS)})",
+                    [dict(frame, run_id=run['run_id'], video_path=run['video_path'],
+                          video_name=run['video_name']) for frame in frames]
+                )
+        finally:
+            conn.close()
+
+    def query_frames(self, video=None, risk_type=None, risky_only=False, limit=1000):
+        """按视频（完整路径或文件名）、风险类型查询关键帧，按视频和时间排序"""
+        conditions = []
+        params = []
+        if video:
+            conditions.append("(video_path = ? OR video_name = ?)")
+            params += [video, video]
+        if risk_type:
+            conditions.append("risk_type = ?")
+            params.append(risk_type)
+        if risky_only:
+            conditions.append("is_safe = 0")
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        conn = self._connect()
+        try:
+            rows = conn.execute(
+                f"SELECT * FROM frames {where} ORDER BY video_path, timestamp LIMIT ?",
+                params + [limit]
+            ).fetchall()
+            return [dict(row) for row in rows]
+        finally:
+            conn.close()
+
+    def list_runs(self, limit=100):
+        conn = self._connect()
+        try:
+            rows = conn.execute(
+                "SELECT * FROM runs ORDER BY started_at DESC LIMIT ?", (limit,)
+            ).fetchall()
+            return [dict(row) for row in rows]
+        finally:
+            conn.close()
+
+    def usage_summary(self, by='day', limit=30):
+        """按天、视频或每次处理汇总 token 用量和费用，最近的在前"""
+        group = USAGE_GROUPS[by]
+        conn = self._connect()
+        try:
+            rows = conn.execute(
+                f"SELECT {group} AS {by}, COUNT(*) AS runs, SUM(frame_count) AS frames, "
+                "SUM(prompt_tokens) AS prompt_tokens, SUM(completion_tokens) AS completion_tokens, "
+                "ROUND(SUM(cost), 6) AS cost, MAX(started_at) AS last_started_at "
+                f"FROM runs WHERE prompt_tokens IS NOT NULL GROUP BY {group} "
+                "ORDER BY last_started_at DESC LIMIT ?",
+                (limit,)
+            ).fetchall()
+            return [dict(row) for row in rows]
+        finally:
+            conn.close()
+
+    def spend_since(self, since):
+        """since（时间戳）之后开始的处理已用的 (token 数, 费用)，用于当天的预算"""
+        conn = self._connect()
+        try:
+            row = conn.execute(
+                "SELECT COALESCE(SUM(prompt_tokens + completion_tokens), 0), COALESCE(SUM(cost), 0) "
+                "FROM runs WHERE started_at >= ?",
+                (since,)
+            ).fetchone()
+            return int(row[0]), float(row[1])
+        finally:
+            conn.close()
+
+    def usage_history(self, sensitivity=None, recent_frames=2000):
+        """历史上每分钟视频的关键帧数，以及最近 recent_frames 个已分析关键帧的平均 token 数、
+        单帧分析耗时和原图复查比例，用于处理前预估用量和耗时
+
+        有相同灵敏度的记录时只按相同灵敏度统计关键帧数（灵敏度决定关键帧的多少）。
+        每帧 token 数包括用原图重新分析和缓存命中（0 token）的帧；单帧耗时不含缓存命中的帧。
+        """
+        conn = self._connect()
+        try:
+            condition = "status = 'completed' AND duration > 0"
+            params = []
+            if sensitivity is not None:
+                same = conn.execute(
+                    f"SELECT COUNT(*) FROM runs WHERE {condition} AND ABS(sensitivity - ?) < 0.005",
+                    (sensitivity,)
+                ).fetchone()[0]
+                if same:
+                    condition += " AND ABS(sensitivity - ?) < 0.005"
+                    params.append(sensitivity)
+            runs, frames, duration = conn.execute(
+                f"SELECT COUNT(*), SUM(frame_count), SUM(duration) FROM runs WHERE {condition}", params
+            ).fetchone()
+            analyzed, prompt_tokens, completion_tokens, sent, elapsed, reanalyzed, low_res = conn.execute(
+                "SELECT COUNT(*), SUM(prompt_tokens), SUM(completion_tokens), "
+                "SUM(cached = 0 AND elapsed IS NOT NULL), SUM(CASE WHEN cached = 0 THEN elapsed END), "
+                "SUM(analysis_pass = 'full'), SUM(analysis_pass IS NOT NULL) "
+                "FROM (SELECT * FROM frames WHERE status = 'analyzed' AND prompt_tokens IS NOT NULL "
+                "ORDER BY rowid DESC LIMIT ?)",
+                (recent_frames,)
+            ).fetchone()
+        finally:
+            conn.close()
+        return {
+            'runs': runs,
+            'frames_per_minute': round(frames / (duration / 60), 3) if duration else None,
+            'analyzed_frames': analyzed,
+            'prompt_tokens_per_frame': prompt_tokens / analyzed if analyzed else None,
+            'completion_tokens_per_frame': completion_tokens / analyzed if analyzed else None,
+            'cache_hit_rate': 1 - sent / analyzed if analyzed else None,
+            'seconds_per_frame': elapsed / sent if sent else None,
+            'reanalysis_rate': reanalyzed / low_res if low_res else None,
+        }
+
+
+class RunRecorder:
+    """记录一次处理中每个关键帧的结果
+
+    add_frame() 登记提取出的帧，set_result() 记录判定结果并立即追加到 JSONL；
+    finish() 补写未完成的帧，写出 CSV 并写入结果库。
+    """
+
+    def __init__(self, frames_dir, video_path, sensitivity=None, database=None, duration=None):
+        self.run_id = uuid.uuid4().hex
+        self.frames_dir = frames_dir
+        self.video_path = video_path
+        self.sensitivity = sensitivity
+        self.duration = duration  # 视频时长（秒），用于统计每分钟的关键帧数
+        self.database = database
+        self.started_at = time.time()
+        self.jsonl_path = os.path.join(frames_dir, RESULTS_JSONL_NAME)
+        self.csv_path = os.path.join(frames_dir, RESULTS_CSV_NAME)
+        self.finished = False
+        self._frames = {}
+        self._lock = threading.Lock()
+        # 每次处理重新生成
+        open(self.jsonl_path, 'w', encoding='utf-8').close()
+
+    def add_frame(self, frame_path, timestamp=None, sha1=None):
+        """登记一个关键帧；timestamp 缺省时从时间码文件名解析"""
+        time_str = frame_time_str(frame_path)
+        if timestamp is None:
+            timestamp = parse_timestamp(time_str)
+        with self._lock:
+            self._frames[frame_path] = {
+                'time': time_str,
+                'timestamp': round(timestamp, 3) if timestamp is not None else None,
+                'frame': os.path.basename(frame_path),
+                'sha1': sha1,
+                'status': 'pending',
+                'is_safe': None,
+                'risk_type': None,
+                'description': None,
+                'confidence': None,
+                'analysis_pass': None,
+                'prompt_tokens': None,
+                'completion_tokens': None,
+                'cost': None,
+                'elapsed': None,
+                'cached': False,
+                'error': None,
+            }
+
+    def set_result(self, frame_path, result=None, elapsed=None, cached=False, error=None, status=None):
+        """记录一帧的最终结果（判定、出错或未分析）"""
+        with self._lock:
+            record = self._frames.get(frame_path)
+            if record is None or self.finished:
+                return
+            if result is not None:
+                record.update(
+                    status='analyzed',
+                    is_safe=bool(result.get('is_safe', True)),
+                    risk_type=result.get('risk_type') or None,
+                    description=result.get('description') or None,
+                    confidence=result.get('confidence'),
+                    analysis_pass=result.get('analysis_pass'),
+                    # 缓存命中的帧没有发送请求
+                    prompt_tokens=0 if cached else result.get('prompt_tokens'),
+                    completion_tokens=0 if cached else result.get('completion_tokens'),
+                    cost=0.0 if cached else result.get('cost')
+                )
+            elif error is not None:
+                record.update(status='error', error=str(error))
+            if status:
+                record['status'] = status
+            record['elapsed'] = round(elapsed, 3) if elapsed is not None else None
+            record['cached'] = bool(cached)
+            self._append_jsonl(record)
+
+    def _append_jsonl(self, record):
+        with open(self.jsonl_path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(record, ensure_ascii=False) + '\n')
+
+    def finish(self, status='completed', usage=None):
+        """结束记录：写出 CSV 并写入结果库，返回 (jsonl路径, csv路径)
+
+        usage 为本次处理的总用量（SpendTracker.to_dict()，包括对冲等没有计入某一帧的请求），
+        缺省时按各帧的用量汇总。
+        """
+        with self._lock:
+            if self.finished:
+                return self.jsonl_path, self.csv_path
+            self.finished = True
+            # 取消或出错时仍未得到结果的帧也写入 JSONL，保证每帧一行
+            for record in self._frames.values():
+                if record['status'] == 'pending':
+                    record['status'] = 'cancelled' if status != 'completed' else 'not_analyzed'
+                    self._append_jsonl(record)
+            frames = sorted(self._frames.values(), key=lambda r: (r['timestamp'] is None, r['timestamp'] or 0))
+
+        with open(self.csv_path, 'w', encoding='utf-8-sig', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=CSV_FIELDS)
+            writer.writeheader()
+            writer.writerows(frames)
+
+        if self.database is not None:
+            run = {
+                'run_id': self.run_id,
+                'video_path': os.path.abspath(self.video_path),
+                'video_name': os.path.basename(self.video_path),
+                'frames_dir': self.frames_dir,
+                'sensitivity': self.sensitivity,
+                'status': status,
+                'started_at': self.started_at,
+                'finished_at': time.time(),
+                'frame_count': len(frames),
+                'risk_count': sum(1 for r in frames if r['is_safe'] is False),
+                'duration': self.duration,
+            }
+            if usage is None:
+                usage = {name: sum(r[name] or 0 for r in frames)
+                         for name in ('prompt_tokens', 'completion_tokens', 'cost')}
+            run.update(
+                prompt_tokens=usage['prompt_tokens'],
+                completion_tokens=usage['completion_tokens'],
+                cost=round(usage['cost'], 6)
+            )
+            db_frames = [
+                {key: record[key] for key in (
+                    'frame', 'timestamp', 'sha1', 'status', 'is_safe', 'risk_type',
+                    'description', 'elapsed', 'cached', 'error', 'confidence', 'analysis_pass',
+                    'prompt_tokens', 'completion_tokens', 'cost')}
+                for record in frames
+            ]
+            try:
+                self.database.upsert_run(run, db_frames)
+            except sqlite3.Error as e:
+                print(f"Error writing results database: {e}")
+        return self.jsonl_path, self.csv_path
+
+
+def default_database_path():
+    from config_manager import ConfigManager
+    return os.path.join(ConfigManager().get_config_dir(), RESULTS_DB_NAME)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="查询分析结果库")
+    parser.add_argument('--db', default=None, help="结果库路径（默认使用配置目录下的 results.db）")
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    query = sub.add_parser('query', help="查询关键帧结果，输出 JSONL")
+    query.add_argument('--video')
+    query.add_argument('--risk-type')
+    query.add_argument('--risky', action='store_true', help="只输出风险帧")
+    query.add_argument('--limit', type=int, default=1000)
+
+    runs = sub.add_parser('runs', help="列出最近的处理记录")
+    runs.add_argument('--limit', type=int, default=20)
+
+    usage = sub.add_parser('usage', help="按天、视频或每次处理汇总 token 用量和费用")
+    usage.add_argument('--by', choices=sorted(USAGE_GROUPS), default='day')
+    usage.add_argument('--limit', type=int, default=30)
+
+    args = parser.parse_args()
+    database = ResultsDatabase(args.db or default_database_path())
+    if args.command == 'query':
+        rows = database.query_frames(args.video, args.risk_type, args.risky, args.limit)
+    elif args.command == 'usage':
+        rows = database.usage_summary(args.by, args.limit)
+    else:
+        rows = database.list_runs(args.limit)
+    for row in rows:
+        sys.stdout.write(json.dumps(row, ensure_ascii=False) + '\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,301 @@
+import tkinter as tk
+from tkinter import ttk
+from io import BytesIO
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image, ImageTk
+
+from video_pipeline import frame_time_str
+
+
+ALL_RISK_TYPES = '全部'
+PREVIEW_SIZE = (400, 300)
+
+
+class PreviewCache:
+    """预览图 LRU 缓存，保存缩放后的 PIL 图片（PhotoImage 只能在界面线程创建）"""
+
+    def __init__(self, max_items=64):
+        self.max_items = max_items
+        self._items = OrderedDict()
+
+    def get(self, key):
+        img = self._items.get(key)
+        if img is not None:
+            self._items.move_to_end(key)
+        return img
+
+    def put(self, key, img):
+        self._items[key] = img
+        self._items.move_to_end(key)
+        while len(self._items) > self.max_items:
+            self._items.popitem(last=False)
+
+
+class RiskReportViewer(tk.Toplevel):
+    """风险报告窗口
+
+    - 列表分页显示，每页复用固定数量的行，翻页、排序、筛选只更新行内容，不重建列表
+    - 预览图在后台线程解码缩放（JPEG 按 DCT 缩放解码），选中行前后的若干行提前加载
+    """
+
+    def __init__(self, master, analysis_results, read_frame, icon_path=None,
+                 page_size=200, prefetch=3, on_close=None, results_lock=None):
+        super().__init__(master)
+        self.analysis_results = analysis_results
+        # 分析线程仍在写入结果时，在写入方的锁内取快照
+        self.results_lock = results_lock or threading.Lock()
+        self.read_frame = read_frame
+        self.on_close = on_close  # 窗口销毁时调用（包括主窗口关闭时），用于归还帧存储
+        self.page_size = page_size
+        self.prefetch = prefetch
+
+        self.title("风险分析报告")
+        self.geometry("800x600")
+        self.resizable(False, False)  # 禁止调整窗口大小
+        if icon_path:
+            try:
+                self.iconbitmap(icon_path)  # 设置窗口图标
+            except tk.TclError:
+                pass
+
+        self.items = self._collect_items()
+        self.view = list(range(len(self.items)))  # 当前筛选、排序后的条目下标
+        self.page = 0
+        self.sort_column = 'time'
+        self.sort_reverse = False
+        self._rows = []  # 复用的行 iid
+        self._row_items = {}  # 行 iid -> 条目下标
+        self._selected = None
+
+        self._cache = PreviewCache()
+        self._loading = {}  # 路径 -> Future
+        self._executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='risk-preview')
+
+        self._create_ui()
+        self._apply_view()
+        self.protocol("WM_DELETE_WINDOW", self.close)
+
+    def _collect_items(self):
+        items = []
+        with self.results_lock:
+            results = list(self.analysis_results.items())
+        for image_path, result in results:
+            if not result.get('is_safe', True):
+                items.append({
+                    # 从文件名提取时间点
+                    'time': frame_time_str(image_path),
+                    'path': image_path,
+                    'risk_type': result.get('risk_type') or '未知风险',
+                    'description': result.get('description') or '无详细说明'
+                })
+        return items
+
+    def _create_ui(self):
+        report_frame = ttk.Frame(self)
+        report_frame.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
+
+        # 添加标题
+        title_label = ttk.Label(report_frame, text="风险分析报告", font=('Arial', 16, 'bold'))
+        title_label.pack(pady=10)
+
+        # 筛选和分页
+        toolbar = ttk.Frame(report_frame)
+        toolbar.pack(fill=tk.X)
+        ttk.Label(toolbar, text="风险类型：").pack(side=tk.LEFT)
+        risk_types = sorted({item['risk_type'] for item in self.items})
+        self.filter_var = tk.StringVar(value=ALL_RISK_TYPES)
+        filter_box = ttk.Combobox(
+            toolbar, textvariable=self.filter_var, state='readonly', width=15,
+            values=[ALL_RISK_TYPES] + risk_types
+        )
+        filter_box.pack(side=tk.LEFT)
+        filter_box.bind('<<ComboboxSelected>>', lambda e: self._apply_view())
+
+        self.next_button = ttk.Button(toolbar, text="下一页", width=8, command=lambda: self._go_page(1))
+        self.next_button.pack(side=tk.RIGHT)
+        self.page_label = ttk.Label(toolbar, text="")
+        self.page_label.pack(side=tk.RIGHT, padx=5)
+        self.prev_button = ttk.Button(toolbar, text="上一页", width=8, command=lambda: self._go_page(-1))
+        self.prev_button.pack(side=tk.RIGHT)
+
+        # 创建左右分栏的容器
+        content_frame = ttk.Frame(report_frame)
+        content_frame.pack(fill=tk.BOTH, expand=True, pady=(10, 0))
+
+        # 左侧列表区域
+        list_frame = ttk.Frame(content_frame)
+        list_frame.pack(side=tk.LEFT, fill=tk.BOTH, expand=True, padx=(0, 10))
+
+        # 创建风险列表（使用Treeview实现表格效果），点击列标题排序
+        self.columns = {'time': '时间点', 'risk_type': '风险类型', 'description': '详细说明'}
+        self.tree = ttk.Treeview(list_frame, columns=tuple(self.columns), show='headings')
+        for column, title in self.columns.items():
+            self.tree.heading(column, text=title, command=lambda c=column: self._sort_by(c))
+        self.tree.column('time', width=100)
+        self.tree.column('risk_type', width=100)
+        self.tree.column('description', width=200)
+
+        # 添加滚动条
+        scrollbar = ttk.Scrollbar(list_frame, orient=tk.VERTICAL, command=self.tree.yview)
+        self.tree.configure(yscrollcommand=scrollbar.set)
+        self.tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+
+        # 右侧预览区域
+        preview_frame = ttk.LabelFrame(content_frame, text="图片预览")
+        preview_frame.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        preview_content = ttk.Frame(preview_frame)
+        preview_content.pack(fill=tk.BOTH, expand=True, padx=10, pady=5)
+
+        # 用于显示选中图片的标签
+        self.preview_label = ttk.Label(preview_content)
+        self.preview_label.pack(pady=5)
+
+        self.detail_label = ttk.Label(
+            preview_content,
+            wraplength=300,  # 调整文字换行宽度
+            justify='left',  # 文字左对齐
+            anchor='w'  # 整体左对齐
+        )
+        self.detail_label.pack(fill=tk.X, pady=5)
+
+        self.tree.bind('<<TreeviewSelect>>', self._on_select)
+
+    def _apply_view(self):
+        """按当前筛选和排序重新计算条目顺序，回到第一页"""
+        risk_type = self.filter_var.get()
+        view = [i for i, item in enumerate(self.items)
+                if risk_type == ALL_RISK_TYPES or item['risk_type'] == risk_type]
+        view.sort(key=lambda i: self.items[i][self.sort_column], reverse=self.sort_reverse)
+        self.view = view
+        self.page = 0
+        self._show_page()
+
+    def _sort_by(self, column):
+        if self.sort_column == column:
+            self.sort_reverse = not self.sort_reverse
+        else:
+            self.sort_column = column
+            self.sort_reverse = False
+        for name, title in self.columns.items():
+            arrow = (' ▼' if self.sort_reverse else ' ▲') if name == column else ''
+            self.tree.heading(name, text=title + arrow)
+        self._apply_view()
+
+    def _go_page(self, delta):
+        page = self.page + delta
+        if 0 <= page < self._page_count():
+            self.page = page
+            self._show_page()
+
+    def _page_count(self):
+        return max(1, -(-len(self.view) // self.page_size))
+
+    def _show_page(self):
+        """把当前页的内容写入复用的行，多余的行从列表中摘下"""
+        start = self.page * self.page_size
+        page_items = self.view[start:start + self.page_size]
+        while len(self._rows) < len(page_items):
+            self._rows.append(self.tree.insert('', tk.END))
+        self._row_items.clear()
+        for position, row in enumerate(self._rows):
+            if position < len(page_items):
+                index = page_items[position]
+                item = self.items[index]
+                self.tree.item(row, values=(item['time'], item['risk_type'], item['description']))
+                self.tree.move(row, '', position)
+                self._row_items[row] = index
+            else:
+                self.tree.detach(row)
+        self.tree.selection_set(())
+        if self._rows:
+            self.tree.yview_moveto(0)
+
+        self.page_label.config(text=f"第 {self.page + 1}/{self._page_count()} 页，共 {len(self.view)} 项")
+        self.prev_button.config(state='normal' if self.page > 0 else 'disabled')
+        self.next_button.config(state='normal' if self.page + 1 < self._page_count() else 'disabled')
+        # 预加载本页开头的几项
+        for index in page_items[:self.prefetch]:
+            self._load(self.items[index]['path'])
+
+    def _on_select(self, event=None):
+        selected = self.tree.selection()
+        if not selected or selected[0] not in self._row_items:
+            return
+        row = selected[0]
+        item = self.items[self._row_items[row]]
+        self._selected = item['path']
+
+        # 显示详细信息
+        self.detail_label.configure(text=f"风险类型：{item['risk_type']}\n\n详细说明：{item['description']}")
+        self._show_preview(item['path'])
+
+        # 预加载相邻行的图片
+        position = self.tree.index(row)
+        start = self.page * self.page_size
+        for offset in range(-self.prefetch, self.prefetch + 1):
+            neighbor = position + offset
+            if offset and 0 <= neighbor < self.page_size and start + neighbor < len(self.view):
+                self._load(self.items[self.view[start + neighbor]]['path'])
+
+    def _show_preview(self, path):
+        self._collect_loaded()
+        img = self._cache.get(path)
+        if img is None:
+            self.preview_label.configure(image='', text="加载中...")
+            self._load(path)
+            self._wait_for(path)
+            return
+        photo = ImageTk.PhotoImage(img)
+        self.preview_label.configure(image=photo, text='')
+        self.preview_label.image = photo  # 保持引用
+
+    def _load(self, path):
+        if self._cache.get(path) is not None or path in self._loading:
+            return
+        self._loading[path] = self._executor.submit(self._decode, path)
+
+    def _decode(self, path):
+        img = Image.open(BytesIO(self.read_frame(path)))
+        img.draft('RGB', PREVIEW_SIZE)
+        img = img.convert('RGB')
+        img.thumbnail(PREVIEW_SIZE)
+        return img
+
+    def _wait_for(self, path):
+        """轮询后台解码结果，完成后如果仍是选中项则显示"""
+        future = self._loading.get(path)
+        if future is None or not self.winfo_exists():
+            return
+        if not future.done():
+            self.after(20, self._wait_for, path)
+            return
+        self._collect_loaded()
+        if path == self._selected:
+            if self._cache.get(path) is not None:
+                self._show_preview(path)
+            else:
+                self.preview_label.configure(image='', text="图片加载失败")
+
+    def _collect_loaded(self):
+        # 把已完成的后台解码结果放入缓存（缓存只在界面线程访问）
+        for path, future in list(self._loading.items()):
+            if future.done():
+                del self._loading[path]
+                try:
+                    self._cache.put(path, future.result())
+                except Exception as e:
+                    print(f"Error loading preview {path}: {e}")
+
+    def close(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        self.destroy()
+
+    def destroy(self):
+        on_close, self.on_close = self.on_close, None
+        super().destroy()
+        if on_close:
+            on_close()
@@ -0,0 +1,65 @@
+"""预览缩略图磁盘缓存
+
+缩略图按帧内容的 SHA1 和缩略图宽度保存在配置目录下，
+同一视频再次处理时直接读取，不再解码原图。
+"""
+import os
+
+
+THUMBNAIL_CACHE_DIR_NAME = 'thumbnails'
+
+
+def thumbnail_cache_path(cache_dir, digest, max_width):
+    # 按哈希前两位分子目录，避免单个目录下文件过多
+    return os.path.join(cache_dir, digest[:2], f'{digest}_{max_width}.jpg')
+
+
+def read_cached_thumbnail(cache_dir, digest, max_width):
+    """读取缓存的缩略图字节，不存在时返回 None"""
+    try:
+        with open(thumbnail_cache_path(cache_dir, digest, max_width), 'rb') as f:
+            return f.read()
+    except OSError:
+        return None
+
+
+def write_cached_thumbnail(cache_dir, digest, max_width, data):
+    path = thumbnail_cache_path(cache_dir, digest, max_width)
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # 多个进程可能同时写同一个缩略图，先写临时文件再替换
+        tmp_path = f'{path}.{os.getpid()}.part'
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        print(f"Error writing thumbnail cache {path}: {e}")
+
+
+def prune_thumbnail_cache(cache_dir, max_bytes):
+    """缓存超过 max_bytes 时，按最后访问时间删除最旧的缩略图"""
+    files = []
+    total = 0
+    for root, _, names in os.walk(cache_dir):
+        for name in names:
+            path = os.path.join(root, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            files.append((stat.st_atime, stat.st_size, path))
+            total += stat.st_size
+    if total <= max_bytes:
+        return 0
+
+    removed = 0
+    for _, size, path in sorted(files):
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+        except OSError:
+            continue
+        total -= size
+        removed += 1
+    return removed
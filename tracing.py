@@ -0,0 +1,130 @@
+"""关键帧生命周期追踪
+
+每个关键帧在流水线中经历的阶段（提取、缩略图、排队、请求、解析、界面更新、写入报告）
+记录为带时间的区间，处理结束后导出为 Chrome / Perfetto 可打开的 trace JSON
+（chrome://tracing 或 https://ui.perfetto.dev）。
+
+记录开销很小，可以常开：区间追加到定长环形缓冲区，超出容量时丢弃最早的记录；
+按帧抽样，同一帧的所有区间要么全部记录，要么全部跳过。
+"""
+import os
+import json
+import time
+import uuid
+import zlib
+import threading
+from collections import deque
+from contextlib import contextmanager
+
+
+TRACE_FILE_NAME = "trace.json"
+
+
+class Tracer:
+    """一次处理（一个视频）的追踪记录"""
+
+    def __init__(self, name='', trace_id=None, capacity=50000, sample_rate=1.0):
+        self.name = name
+        self.trace_id = trace_id or uuid.uuid4().hex
+        self.sample_rate = sample_rate
+        self._threshold = int(max(0.0, min(sample_rate, 1.0)) * 10000)
+        self._origin = time.perf_counter()
+        # deque.append 是原子操作，记录时不需要加锁
+        self._events = deque(maxlen=capacity)
+        self.recorded = 0  # 记录过的区间总数（仅统计用，不加锁）
+        self._tracks = {}  # 帧键 -> 轨道号（导出为线程，每帧一行）
+        self._tracks_lock = threading.Lock()
+
+    @staticmethod
+    def now():
+        return time.perf_counter()
+
+    def sampled(self, key):
+        """按帧键确定是否记录，同一帧的结果始终相同"""
+        if self._threshold >= 10000:
+            return True
+        if self._threshold <= 0:
+            return False
+        return zlib.crc32(str(key).encode('utf-8')) % 10000 < self._threshold
+
+    def _track(self, key):
+        track = self._tracks.get(key)
+        if track is None:
+            with self._tracks_lock:
+                track = self._tracks.setdefault(key, len(self._tracks) + 1)
+        return track
+
+    def add_span(self, name, key, start, end=None, **args):
+        """记录一个区间，start / end 为 Tracer.now() 的返回值，end 缺省为当前时间"""
+        if not self.sampled(key):
+            return
+        end = self.now() if end is None else end
+        self.recorded += 1
+        self._events.append((name, self._track(key), start, max(end - start, 0.0), args or None))
+
+    def instant(self, name, key, **args):
+        """记录一个瞬时事件"""
+        if not self.sampled(key):
+            return
+        self.recorded += 1
+        self._events.append((name, self._track(key), self.now(), None, args or None))
+
+    @contextmanager
+    def span(self, name, key, **args):
+        start = self.now()
+        try:
+            yield
+        finally:
+            self.add_span(name, key, start, **args)
+
+    def to_chrome_trace(self):
+        """转换为 Chrome trace 事件格式（时间单位：微秒）"""
+        events = [{
+            'name': 'process_name', 'ph': 'M', 'pid': 1, 'tid': 0,
+            'args': {'name': self.name or self.trace_id}
+        }]
+        with self._tracks_lock:
+            tracks = dict(self._tracks)
+        for key, track in tracks.items():
+            events.append({
+                'name': 'thread_name', 'ph': 'M', 'pid': 1, 'tid': track,
+                'args': {'name': os.path.basename(str(key))}
+            })
+            events.append({
+                'name': 'thread_sort_index', 'ph': 'M', 'pid': 1, 'tid': track,
+                'args': {'sort_index': track}
+            })
+        recorded = self.recorded
+        spans = list(self._events)
+        for name, track, start, duration, args in spans:
+            event = {
+                'name': name,
+                'cat': 'frame',
+                'pid': 1,
+                'tid': track,
+                'ts': round((start - self._origin) * 1e6, 1),
+            }
+            if duration is None:
+                event.update(ph='i', s='t')
+            else:
+                event.update(ph='X', dur=round(duration * 1e6, 1))
+            if args:
+                event['args'] = args
+            events.append(event)
+        return {
+            'traceEvents': events,
+            'displayTimeUnit': 'ms',
+            'otherData': {
+                'trace_id': self.trace_id,
+                'name': self.name,
+                'sample_rate': self.sample_rate,
+                'recorded': recorded,
+                'dropped': max(0, recorded - len(spans)),
+            },
+        }
+
+    def export(self, directory, file_name=TRACE_FILE_NAME):
+        path = os.path.join(directory, file_name)
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.to_chrome_trace(), f, ensure_ascii=False)
+        return path
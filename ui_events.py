@@ -0,0 +1,90 @@
+"""界面事件总线
+
+工作线程（帧提取、AI分析）不直接调用 Tk，而是 post() 事件到总线；
+界面线程按固定帧率一次取出全部待处理事件，相同类型的连续事件合并成一批
+交给处理函数，一批只触发一次布局更新。
+"""
+import time
+import threading
+from itertools import groupby
+
+
+class UIEventBus:
+    """按帧率合并分发的线程安全事件队列
+
+    处理函数签名为 handler(payloads)，payloads 为同类连续事件的列表。
+    处理函数可以返回尚未处理的尾部事件（例如等待缩略图完成的预览），
+    这些事件和其后的所有事件保留到下一帧，保证分发顺序与 post() 顺序一致。
+    """
+
+    def __init__(self, widget, fps=30):
+        self.widget = widget
+        self.interval = max(1, int(1000 / fps))
+        self._handlers = {}
+        self._events = []
+        self._lock = threading.Lock()
+        self._after_id = None
+        self._running = False
+        # 统计：最近一帧取出的积压事件数、峰值积压、已分发事件数、最近一帧的处理耗时
+        self.depth = 0
+        self.max_depth = 0
+        self.dispatched = 0
+        self.last_tick_ms = 0.0
+
+    def subscribe(self, kind, handler):
+        self._handlers[kind] = handler
+
+    def post(self, kind, payload=None):
+        """可在任意线程调用"""
+        with self._lock:
+            self._events.append((kind, payload))
+
+    def start(self):
+        self._running = True
+        if self._after_id is None:
+            self._after_id = self.widget.after(self.interval, self._tick)
+
+    def stop(self):
+        self._running = False
+        if self._after_id is not None:
+            self.widget.after_cancel(self._after_id)
+            self._after_id = None
+
+    def _tick(self):
+        self._after_id = None
+        started = time.perf_counter()
+        with self._lock:
+            events, self._events = self._events, []
+        self.depth = len(events)
+        self.max_depth = max(self.max_depth, self.depth)
+        try:
+            self._dispatch(events)
+        finally:
+            self.last_tick_ms = (time.perf_counter() - started) * 1000
+            # 处理期间被 stop() 的不再继续
+            if self._running:
+                self._after_id = self.widget.after(self.interval, self._tick)
+
+    def _dispatch(self, events):
+        position = 0
+        for kind, group in groupby(events, key=lambda event: event[0]):
+            payloads = [payload for _, payload in group]
+            handler = self._handlers.get(kind)
+            leftover = None
+            if handler is None:
+                print(f"No handler for UI event: {kind}")
+            else:
+                try:
+                    leftover = handler(payloads)
+                except Exception as e:
+                    print(f"Error handling UI event {kind}: {e}")
+            if leftover:
+                handled = len(payloads) - len(leftover)
+                self.dispatched += handled
+                # 未处理的尾部和后续事件放回队列最前面
+                remaining = events[position + handled:]
+                with self._lock:
+                    self._events[:0] = remaining
+                return
+            self.dispatched += len(payloads)
+            position += len(payloads)
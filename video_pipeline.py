@@ -0,0 +1,355 @@
+import os
+import sys
+import re
+import time
+import threading
+import subprocess
+
+
+# Windows下隐藏控制台窗口，其他系统不支持该参数
+CREATE_NO_WINDOW = 0x08000000 if os.name == 'nt' else 0
+
+# 关键帧输出编码：编码名 -> 文件扩展名
+FRAME_EXTENSIONS = {'jpeg': '.jpg', 'webp': '.webp'}
+# 关键帧文件名：时间码 HH-MM-SS.mmm 加扩展名（小时数可超过两位）
+FRAME_NAME_PATTERN = re.compile(r'^\d{2,}-\d{2}-\d{2}\.\d{3}\.(?:jpg|webp)$')
+DEFAULT_QUALITY = 95
+
+
+def find_ffmpeg():
+    """查找 ffmpeg 可执行文件路径，找不到时返回 None"""
+    try:
+        # 如果是打包后的程序，优先使用打包的 ffmpeg
+        if getattr(sys, 'frozen', False):
+            if hasattr(sys, '_MEIPASS'):
+                # PyInstaller 打包环境
+                bundled_ffmpeg = os.path.join(sys._MEIPASS, 'bin', 'ffmpeg.exe')
+            else:
+                # 其他打包环境
+                bundled_ffmpeg = os.path.join(os.path.dirname(sys.executable), 'bin', 'ffmpeg.exe')
+        else:
+            # 开发环境
+            bundled_ffmpeg = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'bin', 'ffmpeg.exe')
+
+        if os.path.exists(bundled_ffmpeg):
+            return bundled_ffmpeg
+
+        # 如果找不到打包的 ffmpeg，尝试系统路径
+        finder = 'where' if os.name == 'nt' else 'which'
+        result = subprocess.run([finder, 'ffmpeg'],
+                                capture_output=True,
+                                text=True)
+        if result.returncode == 0:
+            return 'ffmpeg'
+
+    except Exception as e:
+        print(f"Error finding ffmpeg: {e}")
+
+    return None
+
+
+def make_frames_dir(video_path, base_dir=None):
+    """创建本次处理的关键帧输出目录（视频名 + 时间戳）"""
+    # 获取视频文件名（不含扩展名）和时间戳
+    video_name = os.path.splitext(os.path.basename(video_path))[0]
+    timestamp = time.strftime("%Y%m%d_%H%M%S")
+
+    # 创建输出目录名称（只包含视频名和时间戳），并清理非法字符
+    frames_dir_name = re.sub(r'[<>:"/\\|?*]', '_', f"{video_name}_{timestamp}")
+
+    # 未指定基础目录时使用视频所在目录
+    if not base_dir:
+        base_dir = os.path.dirname(os.path.abspath(video_path))
+
+    frames_dir = os.path.join(base_dir, frames_dir_name)
+    if not os.path.exists(frames_dir):
+        os.makedirs(frames_dir)
+    return frames_dir
+
+
+def format_timestamp(seconds):
+    """将秒数格式化为关键帧文件名使用的 HH-MM-SS.mmm"""
+    # 先换算为整数毫秒，避免浮点误差（例如 1.2 秒显示为 1.199）
+    total_ms = int(round(seconds * 1000))
+    hours = total_ms // 3600000
+    minutes = (total_ms % 3600000) // 60000
+    secs = (total_ms % 60000) // 1000
+    milliseconds = total_ms % 1000
+    return f'{hours:02d}-{minutes:02d}-{secs:02d}.{milliseconds:03d}'
+
+
+def parse_timestamp(time_str):
+    """format_timestamp 的逆运算：HH-MM-SS.mmm 转为秒数，格式不符时返回 None"""
+    try:
+        hours, minutes, seconds = time_str.split('-')
+        return int(hours) * 3600 + int(minutes) * 60 + float(seconds)
+    except ValueError:
+        return None
+
+
+def probe_duration(video_path, ffmpeg_path=None):
+    """读取视频时长（秒），无法识别时返回 None"""
+    ffmpeg_path = ffmpeg_path or find_ffmpeg()
+    if not ffmpeg_path:
+        return None
+    result = subprocess.run(
+        [ffmpeg_path, '-hide_banner', '-i', video_path],
+        capture_output=True,
+        text=True,
+        encoding='utf-8',
+        errors='replace',
+        creationflags=CREATE_NO_WINDOW
+    )
+    match = re.search(r'Duration:\s*(\d+):(\d+):(\d+(?:\.\d+)?)', result.stderr)
+    if not match:
+        return None
+    hours, minutes, seconds = match.groups()
+    return int(hours) * 3600 + int(minutes) * 60 + float(seconds)
+
+
+def count_scene_changes(video_path, sensitivity, ffmpeg_path=None, start=None, duration=None):
+    """只统计场景切换帧的数量，不编码输出，用于处理前估算关键帧数
+
+    与 stream_keyframes 使用相同的场景阈值和原尺寸画面（缩小画面会平滑噪声，场景评分偏低）。
+    start / duration（秒）用于只统计视频中的一段。
+
+    Returns:
+        int: 场景切换帧的数量
+    """
+    ffmpeg_path = ffmpeg_path or find_ffmpeg()
+    if not ffmpeg_path:
+        raise FileNotFoundError("找不到 ffmpeg")
+
+    command = [ffmpeg_path, '-hide_banner', '-nostats']
+    if start:
+        command += ['-ss', f'{start:.3f}']
+    if duration:
+        command += ['-t', f'{duration:.3f}']
+    command += ['-i', video_path, '-an', '-vf', f"select='gt(scene,{sensitivity})',showinfo", '-f', 'null', '-']
+    result = subprocess.run(
+        command,
+        capture_output=True,
+        text=True,
+        encoding='utf-8',
+        errors='replace',
+        creationflags=CREATE_NO_WINDOW
+    )
+    if result.returncode != 0:
+        print(result.stderr[-2000:])
+        raise subprocess.CalledProcessError(result.returncode, command)
+    return len(re.findall(r'Parsed_showinfo.*\bpts_time:', result.stderr))
+
+
+def frame_extension(encoding):
+    return FRAME_EXTENSIONS.get(encoding, '.jpg')
+
+
+def is_frame_name(name):
+    """是否为 format_timestamp 生成的关键帧文件名（不含目录）"""
+    return isinstance(name, str) and bool(FRAME_NAME_PATTERN.match(name))
+
+
+def frame_time_str(frame_path):
+    """从关键帧文件名中取出时间码（去掉扩展名）"""
+    return os.path.splitext(os.path.basename(frame_path))[0]
+
+
+def encoder_args(encoding='jpeg', quality=DEFAULT_QUALITY):
+    """关键帧编码参数，quality 取值 1-100
+
+    JPEG 质量 95 及以上对应 -q:v 2（原有的固定设置），越低压缩越强。
+    """
+    quality = max(1, min(100, int(quality)))
+    if encoding == 'webp':
+        return ['-c:v', 'libwebp', '-quality', str(quality)]
+    qscale = round(2 + (DEFAULT_QUALITY - min(quality, DEFAULT_QUALITY)) * 29 / DEFAULT_QUALITY)
+    return ['-c:v', 'mjpeg', '-q:v', str(max(2, min(31, qscale)))]
+
+
+def split_webp_stream(buffer):
+    """从 WebP 字节流中切出完整的图片（RIFF 头中记录了长度）"""
+    images = []
+    pos = 0
+    while True:
+        start = buffer.find(b'RIFF', pos)
+        if start < 0:
+            # 末尾可能是被切断的 RIFF 标记，保留最后 3 个字节
+            return images, buffer[max(pos, len(buffer) - 3):]
+        if len(buffer) < start + 8:
+            return images, buffer[start:]
+        size = int.from_bytes(buffer[start + 4:start + 8], 'little') + 8
+        if len(buffer) < start + size:
+            return images, buffer[start:]
+        images.append(bytes(buffer[start:start + size]))
+        pos = start + size
+
+
+def split_jpeg_stream(buffer):
+    """从 MJPEG 字节流中切出完整的 JPEG 图片
+
+    ffmpeg 的 mjpeg 编码不包含内嵌缩略图，熵编码数据中的 0xFF 都经过填充，
+    因此 EOI (FFD9) 只会出现在图片末尾。
+
+    Returns:
+        (list[bytes], bytearray): 完整的图片和剩余未完成的数据
+    """
+    images = []
+    pos = 0
+    while True:
+        start = buffer.find(b'\xff\xd8', pos)
+        if start < 0:
+            # 末尾可能是被切断的 SOI 标记，保留最后 1 个字节
+            return images, buffer[max(pos, len(buffer) - 1):]
+        end = buffer.find(b'\xff\xd9', start + 2)
+        if end < 0:
+            return images, buffer[start:]
+        images.append(bytes(buffer[start:end + 2]))
+        pos = end + 2
+
+
+def stream_keyframes(video_path, sensitivity, job=None, on_frame=None, ffmpeg_path=None,
+                     start=None, duration=None, encoding='jpeg', quality=DEFAULT_QUALITY,
+                     chunk_size=256 * 1024, metrics=None):
+    """使用 ffmpeg 场景检测提取关键帧，帧数据通过管道直接读入内存
+
+    每得到一帧回调 on_frame(timestamp, image_bytes)，timestamp 为该帧在视频中的真实时间（秒），
+    取自 showinfo 滤镜输出的 pts_time。job 为 JobControl，取消时终止 ffmpeg 并提前返回。
+    start / duration（秒）用于只处理视频中的一段。encoding 为 jpeg 或 webp。
+    metrics 为 MetricsRegistry（可选），记录等待 ffmpeg 输出的时间、帧数和吞吐量。
+
+    Returns:
+        int: 已提取的关键帧数量
+    """
+    ffmpeg_path = ffmpeg_path or find_ffmpeg()
+    if not ffmpeg_path:
+        raise FileNotFoundError("找不到 ffmpeg")
+
+    extract_command = [ffmpeg_path, '-hide_banner']
+    if start:
+        # 放在 -i 之前进行快速定位，输出时间从 0 开始
+        extract_command += ['-ss', f'{start:.3f}']
+    if duration:
+        extract_command += ['-t', f'{duration:.3f}']
+    extract_command += [
+        '-i', video_path,
+        '-an',
+        '-vf', f"select='gt(scene,{sensitivity})',showinfo",
+        '-vsync', 'vfr',
+        '-f', 'image2pipe',
+    ] + encoder_args(encoding, quality) + ['pipe:1']
+    split_stream = split_webp_stream if encoding == 'webp' else split_jpeg_stream
+
+    print(f"Running command: {' '.join(extract_command)}")  # 打印完整命令
+
+    process = subprocess.Popen(
+        extract_command,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        creationflags=CREATE_NO_WINDOW
+    )
+    if job:
+        job.attach_process(process)
+
+    # showinfo 把每个输出帧的时间戳写到 stderr，由单独的线程读取
+    timestamps = []
+    timestamps_cond = threading.Condition()
+    stderr_tail = []
+
+    def read_stderr():
+        for raw_line in iter(process.stderr.readline, b''):
+            line = raw_line.decode('utf-8', errors='replace')
+            match = re.search(r'Parsed_showinfo.*\bpts_time:\s*(-?[\d.]+)', line)
+            if match:
+                with timestamps_cond:
+                    timestamps.append(float(match.group(1)))
+                    timestamps_cond.notify_all()
+            else:
+                stderr_tail.append(line)
+                del stderr_tail[:-20]
+        with timestamps_cond:
+            timestamps.append(None)  # 结束标记
+            timestamps_cond.notify_all()
+
+    stderr_thread = threading.Thread(target=read_stderr, daemon=True)
+    stderr_thread.start()
+
+    def timestamp_of(index):
+        with timestamps_cond:
+            timestamps_cond.wait_for(
+                lambda: len(timestamps) > index or (timestamps and timestamps[-1] is None),
+                timeout=5
+            )
+            if len(timestamps) > index and timestamps[index] is not None:
+                return timestamps[index]
+        # 没有拿到 showinfo 输出时按 25 帧每秒估算
+        return index / 25
+
+    count = 0
+    buffer = bytearray()
+    started = time.perf_counter()
+    try:
+        while True:
+            if job and job.cancelled:
+                break
+            # 阻塞在管道上的时间即 ffmpeg 解码和场景评分所用的时间
+            read_started = time.perf_counter()
+            chunk = process.stdout.read1(chunk_size)
+            if metrics:
+                metrics.inc('ffmpeg_wait_seconds_total', time.perf_counter() - read_started)
+            if not chunk:
+                break
+            buffer += chunk
+            images, buffer = split_stream(buffer)
+            for data in images:
+                if job and job.cancelled:
+                    break
+                timestamp = (start or 0) + timestamp_of(count)
+                count += 1
+                if metrics:
+                    metrics.inc('frames_extracted_total')
+                    metrics.inc('frame_bytes_total', len(data))
+                    metrics.set('extraction_fps', round(count / max(time.perf_counter() - started, 1e-6), 2))
+                if on_frame:
+                    on_frame(timestamp, data)
+
+        process.wait()
+        stderr_thread.join(timeout=5)
+    finally:
+        if job:
+            job.detach_process(process)
+
+    if job and job.cancelled:
+        return count
+
+    if process.returncode != 0:
+        print(''.join(stderr_tail))
+        raise subprocess.CalledProcessError(process.returncode, extract_command)
+
+    return count
+
+
+def extract_keyframes(video_path, frames_dir, sensitivity, job=None, on_frame=None, ffmpeg_path=None,
+                      start=None, duration=None, encoding='jpeg', quality=DEFAULT_QUALITY, metrics=None):
+    """提取关键帧并保存为时间码命名的图片文件
+
+    每保存一帧回调 on_frame(frame_path)，参数含义同 stream_keyframes。
+
+    Returns:
+        list: 已提取的关键帧路径
+    """
+    frames = []
+
+    def save_frame(timestamp, data):
+        frame_path = os.path.join(frames_dir, f'{format_timestamp(timestamp)}{frame_extension(encoding)}')
+        write_started = time.perf_counter()
+        with open(frame_path, 'wb') as f:
+            f.write(data)
+        if metrics:
+            metrics.observe('frame_persist_seconds', time.perf_counter() - write_started)
+        frames.append(frame_path)
+        if on_frame:
+            on_frame(frame_path)
+
+    stream_keyframes(video_path, sensitivity, job=job, on_frame=save_frame, ffmpeg_path=ffmpeg_path,
+                     start=start, duration=duration, encoding=encoding, quality=quality, metrics=metrics)
+    return frames